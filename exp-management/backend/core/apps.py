@@ -3,3 +3,25 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # MongoClients are created lazily, after listeners are registered here
+        from pymongo import monitoring
+        from .diagnostics import slow_query_listener
+        from .metrics import MongoCommandListener, enabled
+        if enabled():
+            monitoring.register(MongoCommandListener())
+        listener = slow_query_listener()
+        if listener is not None:
+            monitoring.register(listener)
+        # Tokens carry is_staff and is_superuser; revoke them when those are taken away
+        from django.contrib.auth import get_user_model
+        from django.db.models.signals import m2m_changed, pre_save
+        from .auth import revoke_on_membership_drop, revoke_on_privilege_drop
+        User = get_user_model()
+        pre_save.connect(revoke_on_privilege_drop, sender=User, dispatch_uid='core.auth.privilege_drop')
+        for relation in (User.groups, User.user_permissions):
+            m2m_changed.connect(revoke_on_membership_drop, sender=relation.through,
+                                dispatch_uid='core.auth.membership_drop.%s' % relation.field.name)
+        # Registers the import job type for manage.py worker
+        from . import imports
@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from pymongo import DeleteOne, ReplaceOne
+
+from .indexes import _index_model, declared_indexes
+from .models import Project, Transaction
+
+ARCHIVE_SUFFIX = '_archive'
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def archive_collection(model):
+    """The collection holding ``model``'s archived documents, next to the hot one"""
+    hot = model._get_collection()
+    return hot.database[hot.name + ARCHIVE_SUFFIX]
+
+
+def archived(queryset):
+    """The same query, run over the archive collection"""
+    document = queryset._document
+    clone = queryset._clone_into(queryset.__class__(document, archive_collection(document)))
+    # A cursor already opened on the hot collection must not carry over
+    clone._cursor_obj = None
+    return clone
+
+
+class ArchivePolicy:
+    """Which documents of a collection are cold enough to archive.
+
+    Documents whose ``age_field`` is older than the setting's number of days
+    are cold, and with ``statuses`` only those in one of them. Documents
+    without ``age_field``, such as those stored before it existed, go by
+    ``fallback_field`` instead. Filters on ``range_field`` that reach back
+    past the cutoff read the archive too.
+    """
+
+    def __init__(self, model, days_setting, default_days, age_field, statuses=None, range_field=None,
+                 fallback_field=None):
+        self.model = model
+        self.days_setting = days_setting
+        self.default_days = default_days
+        self.age_field = age_field
+        self.statuses = statuses
+        self.range_field = range_field
+        self.fallback_field = fallback_field
+
+    @property
+    def days(self):
+        return getattr(settings, self.days_setting, self.default_days)
+
+    def cutoff(self, now=None):
+        """Naive UTC, as MongoDB stores dates"""
+        return (now or datetime.utcnow()) - timedelta(days=self.days)
+
+    def cold_filter(self, cutoff):
+        age = self.model._fields[self.age_field].db_field
+        query = {age: {'$lt': cutoff}}
+        if self.fallback_field:
+            fallback = self.model._fields[self.fallback_field].db_field
+            query = {'$or': [query, {age: None, fallback: {'$lt': cutoff}}]}
+        if self.statuses:
+            query['status'] = {'$in': list(self.statuses)}
+        return query
+
+    def reaches_archive(self, lowest, highest):
+        """Whether a range_field filter from ``lowest`` to ``highest`` (None: unbounded) can match archived documents"""
+        if lowest is None:
+            return highest is not None
+        if lowest.tzinfo is not None:
+            lowest = lowest.astimezone(timezone.utc).replace(tzinfo=None)
+        return lowest < self.cutoff()
+
+
+ARCHIVE_POLICIES = {
+    policy.model._meta['collection']: policy for policy in (
+        ArchivePolicy(Transaction, 'ARCHIVE_TRANSACTIONS_AFTER_DAYS', 730, 'date', range_field='date'),
+        ArchivePolicy(Project, 'ARCHIVE_PROJECTS_AFTER_DAYS', 180, 'updated_at', statuses=('completed', 'cancelled'),
+                      fallback_field='created_at'),
+    )
+}
+
+
+def ensure_archive_indexes(model):
+    """Give the archive collection the hot collection's declared indexes, so archive reads stay indexed"""
+    declared = declared_indexes(model)
+    if declared:
+        archive_collection(model).create_indexes([_index_model(name, *spec) for name, spec in declared.items()])
+
+
+def archive(policy, batch_size=ARCHIVE_BATCH_SIZE, now=None, progress=None):
+    """Move the policy's cold documents to the archive collection; returns how many moved.
+
+    Each batch, in _id order, is upserted into the archive and then deleted
+    from the hot collection where its version is unchanged. A document
+    written in between stays hot, and its archive copy is dropped again.
+    Stopping at any point loses nothing: a document in both collections
+    reads as the hot one until the next run finishes moving it, so running
+    again resumes the move and a finished run is a no-op.
+
+    Moved documents are tombstoned like deletes, so /changes/ and the
+    realtime hub drop them from clients' lists; ?include_archived=1 and
+    filters reaching past the cutoff still read them.
+    """
+    hot, cold = policy.model._get_collection(), archive_collection(policy.model)
+    query = policy.cold_filter(policy.cutoff(now))
+    moved, last_id = 0, None
+    while True:
+        page = query if last_id is None else dict(query, _id={'$gt': last_id})
+        documents = list(hot.find(page).sort('_id', 1).limit(batch_size))
+        if not documents:
+            break
+        last_id = documents[-1]['_id']
+        cold.bulk_write([ReplaceOne({'_id': document['_id']}, document, upsert=True) for document in documents],
+                        ordered=False)
+        result = hot.bulk_write([DeleteOne({'_id': document['_id'], 'version': document.get('version')})
+                                 for document in documents], ordered=False)
+        ids = [document['_id'] for document in documents]
+        if result.deleted_count < len(documents):
+            kept = {row['_id'] for row in hot.find({'_id': {'$in': ids}}, {'_id': 1})}
+            cold.delete_many({'_id': {'$in': list(kept)}})
+            ids = [document_id for document_id in ids if document_id not in kept]
+        if ids:
+            policy.model.tombstone(ids)
+        moved += result.deleted_count
+        if progress is not None:
+            progress(moved)
+    return moved
@@ -0,0 +1,115 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.urls import URLPattern
+from rest_framework.response import Response
+
+from .mongo import async_available, find_async
+from .tenants import NoTenant, db_alias
+
+ASYNC_ACTIONS = ('list', 'retrieve')
+
+
+def _plan(viewset, request, args, kwargs):
+    """Everything before the database round trip, run in a worker thread.
+
+    Returns ``(request, response)`` when the viewset already answered (cache
+    hit, auth or validation error, archive read), else ``(request, queryset)``.
+    """
+    viewset.headers = viewset.default_response_headers
+    request = viewset.initialize_request(request, *args, **kwargs)
+    viewset.request = request
+    try:
+        viewset.initial(request, *args, **kwargs)
+        cached = viewset.get_cached_response(request)
+        if cached is not None:
+            return request, cached
+        if viewset.reads_archive(request):
+            # Merging in the archive collection is left to the sync action
+            return request, getattr(viewset, viewset.action)(request, *args, **kwargs)
+        if viewset.action == 'list':
+            return request, viewset.get_page_queryset(request)
+        return request, viewset.get_object_queryset(kwargs.get('pk'))
+    except Exception as exc:
+        return request, viewset.handle_exception(exc)
+
+
+def _alias(model):
+    """The alias ``model`` is read through for the current tenant; None until one is known"""
+    try:
+        return db_alias(model)
+    except NoTenant:
+        return None
+
+
+def _respond(viewset, request, rows):
+    try:
+        if viewset.action == 'list':
+            return viewset.get_list_response(request, rows)
+        return viewset.get_retrieve_response(request, rows[0] if rows else None)
+    except Exception as exc:
+        return viewset.handle_exception(exc)
+
+
+def async_read_view(sync_view):
+    """Wrap a router view so GET list/retrieve await Motor instead of blocking.
+
+    Authentication, permissions, filters, pagination and the response cache
+    are the viewset's own code; only the MongoDB query is awaited. Other
+    methods, and requests whose tenant's alias has no Motor, go to ``sync_view``.
+    A tenant known only from the access token is resolved by the viewset's
+    authentication first; without Motor its query then runs in a thread.
+    """
+    viewset_class, actions = sync_view.cls, sync_view.actions
+    run_sync = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        action = actions.get(request.method.lower())
+        alias = _alias(viewset_class.model)
+        if action not in ASYNC_ACTIONS or (alias is not None and not async_available(alias)):
+            return await run_sync(request, *args, **kwargs)
+
+        # Same set-up as the view function DRF's ViewSetMixin.as_view builds
+        viewset = viewset_class(**sync_view.initkwargs)
+        viewset.action_map = actions
+        for method, name in actions.items():
+            setattr(viewset, method, getattr(viewset, name))
+        viewset.args, viewset.kwargs = args, kwargs
+
+        request, plan = await sync_to_async(_plan)(viewset, request, args, kwargs)
+        if isinstance(plan, Response):
+            response = plan
+        else:
+            try:
+                # sync_to_async carried the tenant authentication activated back here
+                alias = db_alias(viewset_class.model)
+                if async_available(alias):
+                    rows = await find_async(plan, alias)
+                else:
+                    rows = await sync_to_async(list)(plan)
+            except Exception as exc:
+                response = viewset.handle_exception(exc)
+            else:
+                response = await sync_to_async(_respond)(viewset, request, rows)
+        return viewset.finalize_response(request, response, *args, **kwargs)
+
+    view.cls, view.actions, view.initkwargs = viewset_class, actions, sync_view.initkwargs
+    # DRF enforces CSRF itself for session auth, as on its own views
+    view.csrf_exempt = True
+    return view
+
+
+def async_read_urls(urls):
+    """Swap router URL patterns serving list/retrieve for async_read_view.
+
+    A no-op unless ``settings.ASYNC_READ_ACTIONS`` is on, which asgi.py does
+    by default; under WSGI every request would otherwise spin up its own loop.
+    """
+    if not getattr(settings, 'ASYNC_READ_ACTIONS', False):
+        return urls
+    patterns = []
+    for url in urls:
+        actions = getattr(url.callback, 'actions', None) if isinstance(url, URLPattern) else None
+        if actions and actions.get('get') in ASYNC_ACTIONS:
+            url = URLPattern(url.pattern, async_read_view(url.callback), url.default_args, url.name)
+        patterns.append(url)
+    return patterns
@@ -0,0 +1,326 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from pymongo.errors import PyMongoError
+from rest_framework import serializers
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .cache import LocMemResponseCache
+from .models import RevokedToken
+from .tenants import activate, current_tenant, get_registry, user_tenants, using_tenant
+
+logger = logging.getLogger(__name__)
+
+TENANT_CLAIM = 'tenant'
+# Losing any of these revokes the user's tokens
+PRIVILEGE_FLAGS = {'is_active', 'is_staff', 'is_superuser'}
+
+
+class BloomFilter:
+    """Fixed-size set of strings that may answer a false yes, about ``error_rate`` of the time, but never a false no"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first, step = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        if not all(self.bits[p >> 3] & (1 << (p & 7)) for p in positions):
+            self.count += 1
+            for p in positions:
+                self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+
+class RevocationList:
+    """Ids (jti) of tokens revoked before they expire, shared through the revoked_tokens collection.
+
+    Each process keeps a bloom filter of them and adds what was revoked since
+    its last look every TOKEN_REVOCATION_REFRESH_SECONDS, so a token that was
+    never revoked is cleared by a few hashes. Only a token the filter may hold
+    is looked up in MongoDB. A revocation made by another process takes
+    effect here on the next refresh.
+
+    Rows with a user_id revoke every token of that user issued before their
+    revoked_at, e.g. when the account is deactivated or loses privileges.
+    Those few are kept in memory in full.
+    """
+    capacity = 100000
+    # revoked_at comes from each writer's clock
+    clock_skew = timedelta(minutes=1)
+
+    def __init__(self):
+        self._filter = None
+        self._users = {}
+        self._since = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        now = datetime.utcnow()
+        if self._filter is None or self._filter.count > self._filter.capacity:
+            # Start over, without what the TTL index has expired since
+            bloom, users = BloomFilter(max(self.capacity, 2 * getattr(self._filter, 'count', 0))), {}
+            query = {}
+        else:
+            bloom, users = self._filter, dict(self._users)
+            query = {'revoked_at': {'$gte': self._since - self.clock_skew}}
+        for row in RevokedToken._get_collection().find(query, {'jti': 1, 'user_id': 1, 'revoked_at': 1, '_id': 0}):
+            if row.get('user_id') is not None:
+                users[row['user_id']] = max(row['revoked_at'], users.get(row['user_id'], row['revoked_at']))
+            else:
+                bloom.add(row['jti'])
+        self._filter, self._users, self._since = bloom, users, now
+
+    def _maybe_refresh(self):
+        interval = getattr(settings, 'TOKEN_REVOCATION_REFRESH_SECONDS', 5)
+        if self._checked is not None and time.monotonic() - self._checked < interval:
+            return
+        with self._lock:
+            if self._checked is not None and time.monotonic() - self._checked < interval:
+                return
+            try:
+                self._refresh()
+            except PyMongoError:
+                logger.exception('Could not refresh revoked tokens; keeping the previous filter')
+            self._checked = time.monotonic()
+
+    def is_revoked(self, jti):
+        self._maybe_refresh()
+        bloom = self._filter
+        if bloom is not None and jti not in bloom:
+            return False
+        try:
+            return RevokedToken._get_collection().find_one({'jti': jti}, {'_id': 1}) is not None
+        except PyMongoError:
+            # Refuse rather than let a possibly revoked token through
+            logger.exception('Could not check whether token %s is revoked', jti)
+            return True
+
+    def is_user_revoked(self, user_id, issued_at):
+        """Whether the user's tokens issued at ``issued_at`` (epoch seconds) were revoked together"""
+        self._maybe_refresh()
+        revoked_at = self._users.get(str(user_id))
+        return revoked_at is not None and issued_at < (revoked_at - datetime(1970, 1, 1)).total_seconds()
+
+    def revoke_user(self, user_id):
+        """Revoke every token the user holds now; later logins are not affected"""
+        # Rounded up to whole seconds like iat, so a token issued this second is revoked too
+        now = datetime.utcnow().replace(microsecond=0) + timedelta(seconds=1)
+        RevokedToken._get_collection().update_one({'jti': 'user:%s' % user_id}, {'$set': {
+            'user_id': str(user_id),
+            'revoked_at': now,
+            'expires_at': now + api_settings.REFRESH_TOKEN_LIFETIME,
+        }}, upsert=True)
+        with self._lock:
+            self._users = dict(self._users, **{str(user_id): now})
+        forget_permissions(user_id)
+
+    def revoke(self, token):
+        """Revoke a validated token; False when it already was"""
+        jti = token[api_settings.JTI_CLAIM]
+        result = RevokedToken._get_collection().update_one({'jti': jti}, {'$setOnInsert': {
+            'revoked_at': datetime.utcnow(),
+            'expires_at': datetime.utcfromtimestamp(token['exp']),
+        }}, upsert=True)
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+        return result.upserted_id is not None
+
+
+revocations = RevocationList()
+_permissions = LocMemResponseCache(max_entries=4096)
+
+
+def forget_permissions(user_id):
+    """Drop this process's cached permissions of a user"""
+    _permissions.set('perms:%s' % user_id, None, 0)
+
+
+def user_permissions(user_id):
+    """The 'app_label.codename' permissions of a user, cached for AUTH_PERMISSION_CACHE_SECONDS"""
+    key = 'perms:%s' % user_id
+    permissions = _permissions.get(key)
+    if permissions is None:
+        User = get_user_model()
+        user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        permissions = frozenset(user.get_all_permissions()) if user is not None and user.is_active else frozenset()
+        _permissions.set(key, permissions, getattr(settings, 'AUTH_PERMISSION_CACHE_SECONDS', 300))
+    return permissions
+
+
+class ClaimsUser(TokenUser):
+    """The user an access token names, built from the token's claims.
+
+    username, is_staff and is_superuser come from the token. Permissions are
+    read from the user table on the first check and then cached, so most
+    requests never touch the database.
+    """
+
+    def get_all_permissions(self, obj=None):
+        return user_permissions(self.id) if obj is None else frozenset()
+
+    def has_perm(self, perm, obj=None):
+        return self.is_superuser or perm in self.get_all_permissions(obj)
+
+    def has_perms(self, perm_list, obj=None):
+        return all(self.has_perm(perm, obj) for perm in perm_list)
+
+    def has_module_perms(self, module):
+        return self.is_superuser or any(perm.startswith(module + '.') for perm in self.get_all_permissions())
+
+
+class ClaimsJWTAuthentication(JWTStatelessUserAuthentication):
+    """JWT authentication that trusts the token's claims instead of loading the user row.
+
+    A request costs a signature check and a bloom filter probe; revoked
+    tokens, and tokens of users revoked since they were issued, are refused. With tenants, the token's tenant claim becomes the
+    request's tenant, and must match the one its host is served for.
+    """
+
+    def get_user(self, validated_token):
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        if jti is not None and revocations.is_revoked(jti):
+            raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is not None and revocations.is_user_revoked(user_id, validated_token.get('iat', 0)):
+            raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+        if get_registry():
+            tenant = validated_token.get(TENANT_CLAIM)
+            if tenant is None or tenant not in get_registry() or current_tenant() not in (None, tenant):
+                raise AuthenticationFailed(_('Token is not valid for this tenant'), code='token_wrong_tenant')
+            activate(tenant)
+        return super().get_user(validated_token)
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Login that puts the claims ClaimsUser reads into the tokens.
+
+    With tenants the tokens are for the tenant of the host, the optional
+    ``tenant`` field, or else the only tenant the user belongs to.
+    """
+
+    tenant = serializers.CharField(required=False, write_only=True)
+
+    def validate(self, attrs):
+        tenant = current_tenant()
+        if attrs.get('tenant') and tenant not in (None, attrs['tenant']):
+            raise AuthenticationFailed(_('This host serves another tenant'), code='wrong_tenant')
+        with using_tenant(tenant or attrs.get('tenant')):
+            return super().validate(attrs)
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.get_username()
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        if get_registry():
+            token[TENANT_CLAIM] = cls.get_tenant(user)
+        return token
+
+    @classmethod
+    def get_tenant(cls, user):
+        tenants = user_tenants(user)
+        tenant = current_tenant()
+        if tenant is None and len(tenants) == 1:
+            tenant = tenants[0]
+        if tenant is None or tenant not in tenants:
+            raise AuthenticationFailed(_('Give a tenant this account belongs to'), code='no_tenant')
+        return tenant
+
+
+class RevokingTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh that refuses revoked refresh tokens and reloads the user.
+
+    With ROTATE_REFRESH_TOKENS and BLACKLIST_AFTER_ROTATION the given token
+    is revoked as it is exchanged, so each refresh token works once. The
+    claims are rebuilt from the user row, so a refresh never carries staff,
+    superuser or a tenant forward that the user no longer has.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION:
+            revoked = not revocations.revoke(refresh)
+        else:
+            revoked = revocations.is_revoked(refresh[api_settings.JTI_CLAIM])
+        user_id = refresh.get(api_settings.USER_ID_CLAIM)
+        if revoked or revocations.is_user_revoked(user_id, refresh.get('iat', 0)):
+            raise InvalidToken(_('Token has been revoked'))
+        user = get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        if user is None or not user.is_active:
+            raise AuthenticationFailed(_('User is inactive or deleted'), code='user_inactive')
+
+        refresh['username'] = user.get_username()
+        refresh['is_staff'] = user.is_staff
+        refresh['is_superuser'] = user.is_superuser
+        if get_registry() and refresh.get(TENANT_CLAIM) not in user_tenants(user):
+            raise AuthenticationFailed(_('Token is not valid for this tenant'), code='token_wrong_tenant')
+        forget_permissions(user_id)
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
+
+
+def revoke_on_privilege_drop(sender, instance, **kwargs):
+    """pre_save of users: revoke their tokens when they are deactivated or lose staff or superuser"""
+    update_fields = kwargs.get('update_fields')
+    if instance.pk is None or update_fields is not None and not PRIVILEGE_FLAGS & set(update_fields):
+        return
+    old = sender.objects.filter(pk=instance.pk).values(*PRIVILEGE_FLAGS).first()
+    if old is not None and any(old[flag] and not getattr(instance, flag) for flag in PRIVILEGE_FLAGS):
+        revocations.revoke_user(instance.pk)
+
+
+def revoke_on_membership_drop(sender, instance, action, reverse, pk_set, **kwargs):
+    """m2m_changed of User.groups and User.user_permissions: removals may take a tenant or a permission away"""
+    if action == 'post_remove':
+        user_ids = pk_set if reverse else [instance.pk]
+    elif action == 'pre_clear':
+        user_ids = instance.user_set.values_list('pk', flat=True) if reverse else [instance.pk]
+    else:
+        return
+    for user_id in list(user_ids):
+        revocations.revoke_user(user_id)
+
+
+class RevokeTokenSerializer(serializers.Serializer):
+    """Logout: revokes the refresh token and, when given, the access token in use"""
+    refresh = serializers.CharField(write_only=True)
+    access = serializers.CharField(write_only=True, required=False)
+
+    def validate(self, attrs):
+        revocations.revoke(RefreshToken(attrs['refresh']))
+        if attrs.get('access'):
+            revocations.revoke(AccessToken(attrs['access']))
+        return {}
@@ -0,0 +1,141 @@
+import contextvars
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import close_old_connections
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.views import APIView
+
+from .views import MongoEngineViewSet
+
+logger = logging.getLogger(__name__)
+
+# Headers of the batch request that must not reach its sub-requests
+_DROPPED_HEADERS = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MATCH', 'HTTP_IF_MODIFIED_SINCE')
+
+_executor = None
+_executor_lock = threading.Lock()
+_views = {}
+
+
+def get_executor():
+    """The process's pool for batch sub-requests, BATCH_MAX_WORKERS threads at most"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'BATCH_MAX_WORKERS', 8),
+                                           thread_name_prefix='batch')
+        return _executor
+
+
+def _sync_view(match):
+    """The plain DRF view behind a router URL, also when async_read_urls wrapped it"""
+    view = _views.get(match.url_name)
+    if view is None:
+        func = match.func
+        view = _views[match.url_name] = func.cls.as_view(func.actions, **func.initkwargs)
+    return view
+
+
+def _sub_request(request, path, query):
+    """A bodiless GET for ``path`` carrying the batch request's headers"""
+    environ = {key: value for key, value in request.META.items() if key not in _DROPPED_HEADERS}
+    environ.update({
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': query,
+        'wsgi.input': io.BytesIO(b''),
+        'wsgi.url_scheme': request.scheme,
+    })
+    sub = WSGIRequest(environ)
+    # The batch request was authenticated already; DRF takes these instead
+    # of running the authenticators again, and still checks permissions
+    sub._force_auth_user = request.user
+    sub._force_auth_token = request.auth
+    return sub
+
+
+def _error(item_id, status_code, detail):
+    return {'id': item_id, 'status': status_code, 'body': {'detail': detail}}
+
+
+class BatchView(APIView):
+    """Several GETs of the document resources in one round trip: POST /api/batch/
+
+    The body is {"requests": [{"id": "staff", "path": "employees/?page_size=5"}, ...]},
+    paths relative to /api/ or absolute. The caller is authenticated once;
+    the sub-requests run concurrently on a thread pool and each answers with
+    its own status, body and ETag, in the order asked, so the whole batch
+    takes about as long as its slowest query.
+    """
+    max_requests = 20
+
+    def post(self, request):
+        items = request.data.get('requests') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({'requests': ['Send a list of {"id", "path"} requests.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_requests:
+            return Response({'requests': ['Send at most %d requests.' % self.max_requests]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        prefix = reverse('batch')[:-len('batch/')]
+
+        planned = []
+        for index, item in enumerate(items):
+            item = {'path': item} if isinstance(item, str) else item
+            if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+                return Response({'requests': {index: ['Give each request a path.']}},
+                                status=status.HTTP_400_BAD_REQUEST)
+            planned.append((item.get('id', index), item['path']))
+
+        executor = get_executor()
+        futures = []
+        for item_id, url in planned:
+            # Each sub-request runs in a copy of this context, so its queries
+            # count towards this request's metrics
+            context = contextvars.copy_context()
+            futures.append(executor.submit(context.run, self.run_item, request, item_id, url, prefix))
+        return Response({'responses': [future.result() for future in futures]})
+
+    def run_item(self, request, item_id, url, prefix):
+        try:
+            return self.dispatch_item(request, item_id, url, prefix)
+        except Exception:
+            # One failing sub-request must not lose the others' answers
+            logger.exception('Batch request for %s failed', url)
+            return _error(item_id, status.HTTP_500_INTERNAL_SERVER_ERROR, 'Server error.')
+        finally:
+            # Pool threads outlive requests, so nothing else closes their connections
+            close_old_connections()
+
+    def dispatch_item(self, request, item_id, url, prefix):
+        parts = urlsplit(url)
+        path = parts.path if parts.path.startswith('/') else prefix + parts.path
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return _error(item_id, status.HTTP_404_NOT_FOUND, 'Not found.')
+        viewset = getattr(match.func, 'cls', None)
+        if not (isinstance(viewset, type) and issubclass(viewset, MongoEngineViewSet)):
+            return _error(item_id, status.HTTP_404_NOT_FOUND, 'Not found.')
+        if 'get' not in match.func.actions:
+            return _error(item_id, status.HTTP_405_METHOD_NOT_ALLOWED, 'Only GET can be batched.')
+
+        response = _sync_view(match)(_sub_request(request, path, parts.query), *match.args, **match.kwargs)
+        if not isinstance(response, Response):
+            # Exports stream their own body
+            response.close()
+            return _error(item_id, status.HTTP_400_BAD_REQUEST, 'This resource cannot be batched.')
+        result = {'id': item_id, 'status': response.status_code, 'body': response.data}
+        if response.has_header('ETag'):
+            result['etag'] = response['ETag']
+        return result
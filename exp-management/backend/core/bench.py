@@ -0,0 +1,229 @@
+import http.client
+import json
+import random
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from urllib.parse import urlsplit
+
+from bson import ObjectId
+
+from .models import Transaction
+
+SCENARIOS = ('list', 'filter', 'retrieve', 'create', 'aggregate')
+CATEGORIES = ('Office', 'Travel', 'Salary', 'Sales', 'Software', 'Marketing', 'Utilities', 'Consulting')
+SEED_START = datetime(2023, 1, 1)
+SEED_MINUTES = 2 * 365 * 24 * 60
+
+
+def synthetic_transactions(count, seed=0):
+    """Raw transaction documents spread over two years, in storage format"""
+    rng = random.Random(seed)
+    amount_field = Transaction._fields['amount']
+    for index in range(count):
+        document = {
+            '_id': ObjectId(),
+            'date': SEED_START + timedelta(minutes=rng.randrange(SEED_MINUTES)),
+            'description': 'Bench transaction %d' % index,
+            'amount': amount_field.to_mongo(Decimal(rng.randrange(100, 500000)).scaleb(-2)),
+            'type': 'income' if rng.random() < 0.3 else 'expense',
+            'category': rng.choice(CATEGORIES),
+            'created_at': datetime.utcnow(),
+        }
+        document.update(Transaction.derived_changes(document))
+        yield document
+
+
+def seed_transactions(count, seed=0, batch_size=10000):
+    """Insert ``count`` synthetic transactions with unordered insert_many batches"""
+    Transaction.ensure_indexes()
+    collection = Transaction._get_collection()
+    batch = []
+    for document in synthetic_transactions(count, seed):
+        batch.append(document)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+
+def build_request(scenario, rng, ids):
+    """(method, path, body) for one request of a scenario"""
+    if scenario == 'list':
+        return 'get', '/api/transactions/?page_size=50', None
+    if scenario == 'filter':
+        return 'get', '/api/transactions/?type=expense&category=%s&date__gte=2024-01-01&page_size=50' % (
+            rng.choice(CATEGORIES)
+        ), None
+    if scenario == 'retrieve':
+        return 'get', '/api/transactions/%s/' % rng.choice(ids), None
+    if scenario == 'create':
+        return 'post', '/api/transactions/', {
+            'date': '2024-06-01T12:00:00Z',
+            'description': 'Bench create',
+            'amount': '%d.%02d' % (rng.randrange(1, 5000), rng.randrange(100)),
+            'type': 'expense',
+            'category': rng.choice(CATEGORIES),
+        }
+    if scenario == 'aggregate':
+        return 'get', '/api/transactions/summary/?group_by=%s' % rng.choice(('category', 'month')), None
+    raise ValueError('Unknown scenario %r' % scenario)
+
+
+class InProcessTransport:
+    """Sends requests through the full Django stack without a server or socket"""
+    target = 'in-process'
+
+    def __init__(self):
+        from django.contrib.auth.models import User
+        self.user = User(username='bench')
+        self.local = threading.local()
+
+    def __call__(self, method, path, body=None):
+        from rest_framework.test import APIClient
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = APIClient()
+            client.force_authenticate(user=self.user)
+        response = getattr(client, method)(path, body, format='json')
+        return response.status_code, getattr(response, 'data', None)
+
+
+class HTTPTransport:
+    """Sends requests to a running server, one keep-alive connection per thread"""
+
+    def __init__(self, base_url, token=None):
+        parts = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.target = base_url
+        self.headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        if token:
+            self.headers['Authorization'] = 'Bearer %s' % token
+        self.local = threading.local()
+
+    def __call__(self, method, path, body=None):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = self.connection_class(self.netloc, timeout=60)
+        payload = json.dumps(body) if body is not None else None
+        try:
+            connection.request(method.upper(), self.prefix + path, body=payload, headers=self.headers)
+            response = connection.getresponse()
+            content = response.read()
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            self.local.connection = None
+            raise
+        try:
+            data = json.loads(content) if content else None
+        except ValueError:
+            data = None
+        return response.status, data
+
+
+def sample_ids(transport, size=100):
+    """Transaction ids for the retrieve scenario, read through the API itself"""
+    status_code, data = transport('get', '/api/transactions/?page_size=%d&fields=id' % size)
+    if status_code != 200:
+        raise RuntimeError('Listing transactions returned HTTP %d' % status_code)
+    return [row['id'] for row in data['results']]
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+
+def run_scenario(transport, scenario, requests, concurrency, ids=(), seed=0, warmup=10):
+    """Fire ``requests`` requests from ``concurrency`` threads and time each one"""
+    rng = random.Random(seed)
+    for _ in range(min(warmup, requests)):
+        transport(*build_request(scenario, rng, ids))
+
+    def worker(index):
+        count = requests // concurrency + (1 if index < requests % concurrency else 0)
+        worker_rng = random.Random(seed * 1000 + index)
+        latencies, errors = [], 0
+        for _ in range(count):
+            method, path, body = build_request(scenario, worker_rng, ids)
+            start = time.perf_counter()
+            try:
+                status_code, _ = transport(method, path, body)
+            except Exception:
+                status_code = None
+            latencies.append(time.perf_counter() - start)
+            if status_code is None or status_code >= 400:
+                errors += 1
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency)))
+    duration = time.perf_counter() - started
+
+    latencies = sorted(value * 1000 for worker_latencies, _ in results for value in worker_latencies)
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors in results),
+        'concurrency': concurrency,
+        'duration_s': round(duration, 3),
+        'rps': round(len(latencies) / duration, 1) if duration else None,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            'p50': _round(percentile(latencies, 50)),
+            'p95': _round(percentile(latencies, 95)),
+            'p99': _round(percentile(latencies, 99)),
+            'max': _round(latencies[-1] if latencies else None),
+        },
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def compare(report, baseline, threshold=None):
+    """Percentage change of each scenario's latency and throughput against a baseline.
+
+    With ``threshold`` set, a scenario whose p95 grew or whose req/s dropped
+    by more than that many percent is listed under ``regressions``.
+    """
+    changes, regressions = {}, []
+    for scenario, result in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(scenario)
+        if previous is None:
+            continue
+        change = {
+            metric + '_change_pct': _change(result['latency_ms'][metric], previous['latency_ms'][metric])
+            for metric in ('p50', 'p95', 'p99')
+        }
+        change['rps_change_pct'] = _change(result['rps'], previous['rps'])
+        changes[scenario] = change
+        if threshold is not None and (
+            (change['p95_change_pct'] or 0) > threshold or (change['rps_change_pct'] or 0) < -threshold
+        ):
+            regressions.append(scenario)
+    return {'scenarios': changes, 'regressions': regressions}
+
+
+def _change(current, previous):
+    if current is None or not previous:
+        return None
+    return round((current - previous) * 100.0 / previous, 1)
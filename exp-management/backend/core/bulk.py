@@ -0,0 +1,240 @@
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from mongoengine.errors import ValidationError as MongoValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from rest_framework import serializers, status
+from .models import TrackedDocument
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class BulkResult:
+    """Per-item outcome of a bulk write, kept in input order"""
+
+    def __init__(self, size):
+        self.items = [None] * size
+
+    def ok(self, index, status_code, **extra):
+        self.items[index] = dict(index=index, status=status_code, **extra)
+
+    def error(self, index, status_code, errors):
+        self.items[index] = {'index': index, 'status': status_code, 'errors': errors}
+
+    def skip_remaining(self):
+        """Ordered writes stop at the first failure; mark what was never tried"""
+        for index, item in enumerate(self.items):
+            if item is None:
+                self.error(index, status.HTTP_424_FAILED_DEPENDENCY,
+                           {'non_field_errors': ['Not attempted after an earlier failure.']})
+
+    @property
+    def succeeded(self):
+        return sum(1 for item in self.items if item and item['status'] < 300)
+
+    @property
+    def failed(self):
+        return len(self.items) - self.succeeded
+
+
+def _validate(child, item):
+    try:
+        return child.run_validation(item), None
+    except serializers.ValidationError as exc:
+        return None, exc.detail
+
+
+def _to_object_id(value):
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+def compile_set(model, data):
+    """The ``$set`` of validated serializer data, as ``(changes, errors)``.
+
+    Each value is checked by its model field and converted to BSON, as
+    save() would, so the write needs no document read first. Fields the
+    model derives from the changed ones are set along with them.
+    """
+    changes = {}
+    for name, value in data.items():
+        field = model._fields[name]
+        if value is not None:
+            try:
+                field.validate(value)
+            except MongoValidationError as exc:
+                return None, {name: [str(exc)]}
+            value = field.to_mongo(value)
+        changes[field.db_field] = value
+    if issubclass(model, TrackedDocument):
+        changes.update(model.derived_changes(changes))
+    return changes, None
+
+
+def _write_errors(exc):
+    return {error['index']: error for error in exc.details.get('writeErrors', [])}
+
+
+def _write_error_result(result, index, error):
+    if error['code'] == DUPLICATE_KEY_ERROR:
+        result.error(index, status.HTTP_409_CONFLICT, {'non_field_errors': ['Duplicate key.']})
+    else:
+        result.error(index, status.HTTP_400_BAD_REQUEST, {'non_field_errors': [error['errmsg']]})
+
+
+def bulk_create(serializer_class, items, ordered=True):
+    """Validate items and insert the valid ones with one insert_many.
+
+    Returns ``(result, documents)`` where documents are the raw inserted
+    documents, with their new ``_id``.
+    """
+    model = serializer_class.Meta.model
+    child = serializer_class(many=True).child
+    result = BulkResult(len(items))
+    indexes, documents = [], []
+
+    for index, item in enumerate(items):
+        data, errors = _validate(child, item)
+        if errors is None:
+            document = model(**data)
+            try:
+                document.validate()
+            except MongoValidationError as exc:
+                errors = exc.to_dict()
+        if errors is not None:
+            result.error(index, status.HTTP_400_BAD_REQUEST, errors)
+            if ordered:
+                break
+            continue
+        indexes.append(index)
+        documents.append(document.to_mongo().to_dict())
+
+    written = documents
+    if documents:
+        try:
+            model._get_collection().insert_many(documents, ordered=ordered)
+        except BulkWriteError as exc:
+            failures = _write_errors(exc)
+            written = []
+            for position, (index, document) in enumerate(zip(indexes, documents)):
+                if position in failures:
+                    _write_error_result(result, index, failures[position])
+                elif not ordered or position < min(failures):
+                    written.append(document)
+                    result.ok(index, status.HTTP_201_CREATED, id=str(document['_id']))
+        else:
+            for index, document in zip(indexes, documents):
+                result.ok(index, status.HTTP_201_CREATED, id=str(document['_id']))
+
+    if ordered:
+        result.skip_remaining()
+    return result, written
+
+
+def bulk_update(serializer_class, items, ordered=True):
+    """Apply partial updates ``[{"id": ..., <fields>}, ...]`` with one bulk_write.
+
+    Returns ``(result, changed)`` where changed lists ``(old, new)`` raw
+    documents for every update that was written.
+    """
+    model = serializer_class.Meta.model
+    child = serializer_class(many=True, partial=True).child
+    result = BulkResult(len(items))
+    indexes, operations, updates = [], [], {}
+    tracked = issubclass(model, TrackedDocument)
+    now = datetime.utcnow()
+
+    object_ids = [_to_object_id(item.get('id')) if isinstance(item, dict) else None for item in items]
+    existing = {
+        doc['_id']: doc for doc in model._get_collection().find(
+            {'_id': {'$in': [oid for oid in object_ids if oid is not None]}}
+        )
+    }
+
+    for index, (item, object_id) in enumerate(zip(items, object_ids)):
+        if object_id is None:
+            errors, code = {'id': ['A valid id is required.']}, status.HTTP_400_BAD_REQUEST
+        elif object_id not in existing:
+            errors, code = {'id': ['Not found.']}, status.HTTP_404_NOT_FOUND
+        elif object_id in updates:
+            # The changed pairs are built per id from its state before the batch
+            errors, code = {'id': ['Repeated in this batch.']}, status.HTTP_400_BAD_REQUEST
+        else:
+            data, errors = _validate(child, item)
+            code = status.HTTP_400_BAD_REQUEST
+            if errors is None:
+                changes, errors = compile_set(model, data)
+        if errors is not None:
+            result.error(index, code, errors)
+            if ordered:
+                break
+            continue
+        indexes.append(index)
+        update = {'$set': changes}
+        if tracked:
+            changes['updated_at'] = now
+            update['$inc'] = {'version': 1}
+        updates[object_id] = changes
+        operations.append(UpdateOne({'_id': object_id}, update))
+
+    written = dict(updates)
+    if operations:
+        try:
+            model._get_collection().bulk_write(operations, ordered=ordered)
+        except BulkWriteError as exc:
+            failures = _write_errors(exc)
+            for position, index in enumerate(indexes):
+                object_id = object_ids[index]
+                if position in failures:
+                    _write_error_result(result, index, failures[position])
+                    written.pop(object_id, None)
+                elif ordered and position > min(failures):
+                    written.pop(object_id, None)
+                else:
+                    result.ok(index, status.HTTP_200_OK, id=str(object_id))
+        else:
+            for index in indexes:
+                result.ok(index, status.HTTP_200_OK, id=str(object_ids[index]))
+
+    if ordered:
+        result.skip_remaining()
+    changed = []
+    for object_id, changes in written.items():
+        old = existing[object_id]
+        new = dict(old, **changes)
+        if tracked:
+            new['version'] = old.get('version', 0) + 1
+        changed.append((old, new))
+    return result, changed
+
+
+def bulk_delete(model, ids):
+    """Delete documents by id with one delete_many; unknown ids report 404.
+
+    Returns ``(result, deleted)`` with the raw documents that were removed.
+    """
+    result = BulkResult(len(ids))
+    object_ids = [_to_object_id(value) for value in ids]
+    existing = {
+        doc['_id']: doc for doc in model._get_collection().find(
+            {'_id': {'$in': [oid for oid in object_ids if oid is not None]}}
+        )
+    }
+
+    for index, object_id in enumerate(object_ids):
+        if object_id is None:
+            result.error(index, status.HTTP_400_BAD_REQUEST, {'id': ['A valid id is required.']})
+        elif object_id not in existing:
+            result.error(index, status.HTTP_404_NOT_FOUND, {'id': ['Not found.']})
+        else:
+            result.ok(index, status.HTTP_204_NO_CONTENT, id=str(object_id))
+
+    if existing:
+        model._get_collection().delete_many({'_id': {'$in': list(existing)}})
+        if issubclass(model, TrackedDocument):
+            model.tombstone(list(existing))
+    return result, list(existing.values())
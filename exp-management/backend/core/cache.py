@@ -0,0 +1,211 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.utils import encoders
+
+from .tenants import current_tenant
+
+DEFAULT_RESPONSE_CACHE = {
+    'BACKEND': 'core.cache.LocMemResponseCache',
+    'TIMEOUT': 60,
+    'OPTIONS': {},
+}
+
+
+def _seed():
+    # A fresh counter starts from the clock, so a counter lost to eviction or
+    # a restart can never come back to a generation that is still cached.
+    return time.time_ns() // 1000
+
+
+class LocMemResponseCache:
+    """In-process LRU cache with per-entry TTL.
+
+    Entries are kept as Python objects, so hits cost no unpickling. Each
+    worker has its own copy; generation bumps are only seen by the worker
+    that made them, so keep the TTL short or use a shared backend when
+    running several workers.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_counter(self, key):
+        with self._lock:
+            return self._counters.setdefault(key, _seed())
+
+    def incr_counter(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, _seed()) + 1
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+
+class DjangoResponseCache:
+    """Shared backend on a Django cache alias (Redis, Memcached, ...).
+
+    Any configured ``CACHES`` alias works, so tests can point it at
+    LocMemCache in place of the real shared server.
+    """
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, timeout):
+        self.cache.set(key, value, timeout)
+
+    def get_counter(self, key):
+        value = self.cache.get(key)
+        if value is None:
+            self.cache.add(key, _seed(), timeout=None)
+            value = self.cache.get(key)
+        return value
+
+    def incr_counter(self, key):
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, _seed(), timeout=None)
+            return self.cache.get(key)
+
+    def clear(self):
+        self.cache.clear()
+
+
+def _tenant_resource(resource):
+    tenant = current_tenant()
+    return resource if tenant is None else '%s/%s' % (tenant, resource)
+
+
+class ResponseCache:
+    """Caches serialized response data per resource, query and user.
+
+    Keys embed a per-resource generation counter. Writes bump the counter,
+    which orphans every cached entry for that resource at once; orphans age
+    out through TTL/LRU eviction. Resources are counted and cached per
+    tenant, so tenants never see or invalidate each other's entries.
+    """
+
+    def __init__(self, backend, timeout):
+        self.backend = backend
+        self.timeout = timeout
+
+    def generation(self, resource):
+        return self.backend.get_counter('gen:%s' % _tenant_resource(resource))
+
+    def invalidate(self, resource):
+        self.backend.incr_counter('gen:%s' % _tenant_resource(resource))
+
+    def make_key(self, resource, request):
+        user = request.user
+        user_key = user.pk if user is not None and user.is_authenticated else 'anon'
+        query = sorted(request.query_params.lists())
+        raw = json.dumps([request.path, query, str(user_key)], separators=(',', ':'))
+        digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+        return 'resp:%s:%s:%s' % (_tenant_resource(resource), self.generation(resource), digest)
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, etag, data):
+        self.backend.set(key, (etag, data), self.timeout)
+
+
+def make_etag(data):
+    payload = json.dumps(data, cls=encoders.JSONEncoder, sort_keys=True, separators=(',', ':'))
+    return '"%s"' % hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def version_etag(version):
+    """ETag of a single document, from its write counter"""
+    return '"v%d"' % (version or 0)
+
+
+def if_match_versions(request):
+    """Document versions an If-Match header accepts.
+
+    None without the header or with ``*``; otherwise a list, empty when no
+    tag names a version, so the write can only fail the precondition.
+    """
+    header = request.META.get('HTTP_IF_MATCH')
+    if not header:
+        return None
+    versions = []
+    for value in header.split(','):
+        value = value.strip()
+        if value == '*':
+            return None
+        # Weak tags never match for If-Match
+        if value.startswith('"v') and value.endswith('"') and value[2:-1].isdigit():
+            versions.append(int(value[2:-1]))
+    return versions
+
+
+def etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(',')]
+    return '*' in candidates or etag in candidates or ('W/' + etag) in candidates
+
+
+_lock = threading.Lock()
+_configured = (None, None)
+
+
+def get_response_cache():
+    """The ResponseCache built from settings.RESPONSE_CACHE.
+
+    Rebuilt when the setting object changes, e.g. under override_settings.
+    """
+    global _configured
+    config = getattr(settings, 'RESPONSE_CACHE', DEFAULT_RESPONSE_CACHE)
+    source, cache = _configured
+    if source is not config:
+        with _lock:
+            source, cache = _configured
+            if source is not config:
+                backend_class = import_string(config.get('BACKEND', DEFAULT_RESPONSE_CACHE['BACKEND']))
+                backend = backend_class(**config.get('OPTIONS', {}))
+                cache = ResponseCache(backend, config.get('TIMEOUT', DEFAULT_RESPONSE_CACHE['TIMEOUT']))
+                _configured = (config, cache)
+    return cache
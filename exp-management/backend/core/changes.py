@@ -0,0 +1,75 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timedelta
+
+from bson import json_util
+from django.conf import settings
+from mongoengine.queryset.visitor import Q
+
+from .models import Tombstone
+
+
+class ExpiredToken(Exception):
+    """The token predates the tombstones still kept; the client must reload"""
+
+
+def encode_token(position):
+    return urlsafe_b64encode(json_util.dumps(position).encode('ascii')).decode('ascii')
+
+
+def decode_token(token):
+    """``{'u': [updated_at, _id], 'd': [deleted_at, _id]}``; ValueError when malformed"""
+    try:
+        position = json_util.loads(urlsafe_b64decode(token.encode('ascii')))
+        for stream in ('u', 'd'):
+            moment, last_id = position[stream]
+            if not isinstance(moment, datetime):
+                raise ValueError('Invalid token')
+            # Compare with naive UTC datetimes as MongoEngine stores them
+            position[stream] = [moment.replace(tzinfo=None), last_id]
+    except (TypeError, ValueError, KeyError, UnicodeError):
+        raise ValueError('Invalid token')
+    return position
+
+
+def _after(time_field, moment, last_id):
+    """Match positions after ``(moment, last_id)`` in (time, _id) order"""
+    if last_id is None:
+        return Q(**{'%s__gt' % time_field: moment})
+    return Q(**{'%s__gt' % time_field: moment}) | Q(**{time_field: moment, 'id__gt': last_id})
+
+
+def _read(queryset, time_field, position, bound, limit):
+    """``(rows, next position, more)`` for one stream, after ``position`` up to ``bound``"""
+    queryset = queryset.filter(_after(time_field, *position) & Q(**{'%s__lte' % time_field: bound}))
+    rows = list(queryset.order_by(time_field, 'id').as_pymongo().limit(limit + 1))
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, [rows[-1][time_field], rows[-1]['_id']], True
+    # Everything up to bound has been read
+    return rows, [bound, None], False
+
+
+def changes_since(model, token, limit=500):
+    """Documents of a TrackedDocument model written, and ids deleted, since ``token``.
+
+    Returns ``(written, deleted ids, next token, more)``. Without a token it
+    starts from now. Both streams are keyset scans of (updated_at, _id) and
+    (deleted_at, _id) indexes. They stop CHANGES_SETTLE_SECONDS before now,
+    because a write stamped just before a poll may land just after it.
+    """
+    now = datetime.utcnow()
+    bound = now - timedelta(seconds=getattr(settings, 'CHANGES_SETTLE_SECONDS', 2))
+    # MongoDB keeps milliseconds; a finer bound would skip what shares its millisecond
+    bound = bound.replace(microsecond=bound.microsecond // 1000 * 1000)
+    if token is None:
+        return [], [], encode_token({'u': [bound, None], 'd': [bound, None]}), False
+
+    position = decode_token(token)
+    if position['d'][0] < now - timedelta(days=Tombstone.RETENTION_DAYS):
+        raise ExpiredToken
+
+    written, updated_position, more_written = _read(model.objects, 'updated_at', position['u'], bound, limit)
+    tombstones = Tombstone.objects(collection=model._meta['collection'])
+    deleted, deleted_position, more_deleted = _read(tombstones, 'deleted_at', position['d'], bound, limit)
+    token = encode_token({'u': updated_position, 'd': deleted_position})
+    return written, [row['document_id'] for row in deleted], token, more_written or more_deleted
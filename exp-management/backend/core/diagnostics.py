@@ -0,0 +1,348 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from mongoengine.connection import get_connection
+from pymongo import monitoring
+from pymongo.errors import OperationFailure, PyMongoError
+
+from .indexes import document_classes, index_name
+from .models import QueryShapeStat
+from .mongo import command_alias
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE = ('find', 'aggregate', 'count', 'distinct')
+IGNORED_COLLECTIONS = ('query_shapes',)
+# Session and routing fields the server rejects or ignores inside explain
+COMMAND_NOISE = ('$db', 'lsid', '$clusterTime', 'txnNumber', '$readPreference', 'readConcern', 'writeConcern')
+RANGE_OPERATORS = {'$gt', '$gte', '$lt', '$lte'}
+# How selective each kind of condition is for an index, best first
+KIND_RANK = {'eq': 0, 'in': 1, 'range': 2, 'other': 3}
+
+
+def _filter_kinds(query, kinds):
+    for key, value in query.items():
+        if key in ('$and', '$or', '$nor'):
+            # Keyset pagination seeks with $or branches over the sort keys
+            for clause in value:
+                _filter_kinds(clause, kinds)
+            continue
+        if key.startswith('$'):
+            kind = 'other'
+        elif isinstance(value, dict) and value and all(op.startswith('$') for op in value):
+            operators = set(value)
+            if operators <= {'$eq'}:
+                kind = 'eq'
+            elif operators <= {'$in'}:
+                kind = 'in'
+            elif operators & RANGE_OPERATORS:
+                kind = 'range'
+            else:
+                kind = 'other'
+        else:
+            kind = 'eq'
+        # A field compared for equality in one branch and by range in another is a range
+        if KIND_RANK[kind] >= KIND_RANK[kinds.get(key, 'eq')]:
+            kinds[key] = kind
+    return kinds
+
+
+def query_shape(command_name, command):
+    """(collection, filter, sort) of a command with every value stripped out.
+
+    ``filter`` lists ``[field, kind]`` pairs sorted by field, where kind is
+    eq, in, range or other; ``sort`` keeps the command's key order.
+    """
+    collection = command[command_name]
+    query, sort = {}, {}
+    if command_name == 'find':
+        query, sort = command.get('filter') or {}, command.get('sort') or {}
+    elif command_name in ('count', 'distinct'):
+        query = command.get('query') or {}
+    elif command_name == 'aggregate':
+        stages = command.get('pipeline') or []
+        if stages and '$match' in stages[0]:
+            query = stages[0]['$match']
+            stages = stages[1:]
+        if stages and '$sort' in stages[0]:
+            sort = stages[0]['$sort']
+    kinds = _filter_kinds(query, {})
+    return collection, sorted([field, kind] for field, kind in kinds.items()), [[key, int(direction)] for key, direction in sort.items()]
+
+
+def shape_key(database, collection, command_name, filter_shape, sort):
+    # Tenants' databases keep separate shapes, even on the same collection
+    raw = json.dumps([database, collection, command_name, filter_shape, sort], separators=(',', ':'))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _walk(document, key):
+    """Every value stored under ``key`` anywhere in a nested explain document"""
+    if isinstance(document, dict):
+        for name, value in document.items():
+            if name == key:
+                yield value
+            yield from _walk(value, key)
+    elif isinstance(document, list):
+        for item in document:
+            yield from _walk(item, key)
+
+
+def plan_summary(explain):
+    """COLLSCAN, or the indexes the winning plan scans, e.g. 'IXSCAN date_-1__id_-1'"""
+    plan = next(_walk(explain, 'winningPlan'), {})
+    stages = list(_walk(plan, 'stage'))
+    if 'COLLSCAN' in stages:
+        return 'COLLSCAN'
+    indexes = sorted(set(_walk(plan, 'indexName')))
+    if indexes:
+        return 'IXSCAN ' + ','.join(indexes)
+    return stages[0] if stages else None
+
+
+def execution_totals(explain):
+    """(docs examined, keys examined, returned) from executionStats"""
+    stats = next(_walk(explain, 'executionStats'), {})
+    return (stats.get('totalDocsExamined', 0), stats.get('totalKeysExamined', 0), stats.get('nReturned', 0))
+
+
+def record(command_name, command, duration_ms, explain=None, database=None):
+    """Add one slow query, and optionally its explain() output, to its shape's totals"""
+    collection, filter_shape, sort = query_shape(command_name, command)
+    update = {
+        '$inc': {'count': 1, 'total_ms': duration_ms},
+        '$max': {'max_ms': duration_ms},
+        '$set': {'database': database, 'collection': collection, 'command': command_name, 'filter': filter_shape,
+                 'sort': sort, 'last_seen': datetime.utcnow()},
+    }
+    if explain is not None:
+        docs, keys, returned = execution_totals(explain)
+        update['$inc'].update({'explains': 1, 'docs_examined': docs, 'keys_examined': keys, 'returned': returned})
+        update['$set']['plan'] = plan_summary(explain)
+    QueryShapeStat._get_collection().update_one(
+        {'shape': shape_key(database, collection, command_name, filter_shape, sort)}, update, upsert=True
+    )
+
+
+class SlowQueryRecorder:
+    """Records slow queries and explains them on a background thread.
+
+    Each shape is explained at most once per ``explain_interval`` seconds,
+    so a hot slow query costs one extra explain per interval, not per call.
+    The queue is bounded; when the thread falls behind, samples are dropped.
+    """
+
+    def __init__(self, explain_interval=600, maxsize=100):
+        self.explain_interval = explain_interval
+        self.maxsize = maxsize
+        self._explained = {}
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, alias, database, command_name, command, duration_ms):
+        if self._pid != os.getpid():
+            # First use, or first use in a forked worker: threads do not survive fork
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(self.maxsize)
+                    threading.Thread(target=self._run, name='slow-query-explain', daemon=True).start()
+                    self._pid = os.getpid()
+        try:
+            self._queue.put_nowait((alias, database, command_name, command, duration_ms))
+        except queue.Full:
+            pass
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self.process(*item)
+            except Exception:
+                logger.exception('Could not record slow query')
+
+    def process(self, alias, database, command_name, command, duration_ms):
+        collection, filter_shape, sort = query_shape(command_name, command)
+        key = shape_key(database, collection, command_name, filter_shape, sort)
+        explain = None
+        now = time.monotonic()
+        if key not in self._explained or now - self._explained[key] >= self.explain_interval:
+            self._explained[key] = now
+            explain = self.explain(alias, database, command)
+        record(command_name, command, duration_ms, explain, database)
+
+    def explain(self, alias, database, command):
+        """explain() on the connection that ran the command, e.g. a tenant's own server"""
+        try:
+            return get_connection(alias)[database].command('explain', command, verbosity='executionStats')
+        except PyMongoError as exc:
+            logger.warning('explain failed: %s', exc)
+            return None
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Hands commands slower than ``threshold_ms`` to a SlowQueryRecorder.
+
+    The listener itself only keeps the started command until it completes;
+    explain and bookkeeping happen off the request thread.
+    """
+
+    def __init__(self, threshold_ms, recorder=None):
+        self.threshold_ms = threshold_ms
+        self.recorder = recorder or SlowQueryRecorder()
+        self._pending = {}
+
+    def started(self, event):
+        if event.command_name not in EXPLAINABLE:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str) or collection in IGNORED_COLLECTIONS:
+            return
+        command = {key: value for key, value in event.command.items() if key not in COMMAND_NOISE}
+        self._pending[(event.connection_id, event.request_id)] = (event.database_name, command)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        duration_ms = event.duration_micros / 1000.0
+        if duration_ms >= self.threshold_ms:
+            database, command = pending
+            alias = command_alias(database, event.connection_id)
+            self.recorder.submit(alias, database, event.command_name, command, duration_ms)
+
+
+def slow_query_listener():
+    """Listener configured from settings, or None when SLOW_QUERY_MS is off"""
+    threshold = getattr(settings, 'SLOW_QUERY_MS', 0)
+    if not threshold:
+        return None
+    return SlowQueryListener(threshold, SlowQueryRecorder(getattr(settings, 'SLOW_QUERY_EXPLAIN_INTERVAL', 600)))
+
+
+def _index_keys(document):
+    """Declared index key lists of a document, plus the implicit _id index.
+
+    Partial indexes are left out: they only serve queries that repeat their
+    filter expression, so they cannot be relied on for a general shape. So
+    are text indexes, which only serve $text searches.
+    """
+    keys = [[('_id', 1)]]
+    for spec in document._meta.get('index_specs', []):
+        if 'partialFilterExpression' not in spec and spec['fields'][0][1] != 'text':
+            keys.append([(field, direction) for field, direction in spec['fields']])
+    return keys
+
+
+def recommend_index(filter_shape, sort):
+    """Index keys for a shape by the equality, sort, range rule"""
+    keys = [(field, 1) for field, kind in filter_shape if kind in ('eq', 'in')]
+    used = {field for field, _ in keys}
+    for field, direction in sort:
+        if field not in used:
+            keys.append((field, direction))
+            used.add(field)
+    keys.extend((field, 1) for field, kind in filter_shape if kind == 'range' and field not in used)
+    return keys
+
+
+def covers(index, keys, equality=0):
+    """True when ``index`` starts with ``keys``.
+
+    The first ``equality`` keys may come in any order and direction; the rest
+    must match in order with all directions equal or all reversed.
+    """
+    if len(index) < len(keys):
+        return False
+    head = index[:len(keys)]
+    if {field for field, _ in head[:equality]} != {field for field, _ in keys[:equality]}:
+        return False
+    rest, wanted = head[equality:], keys[equality:]
+    if [field for field, _ in rest] != [field for field, _ in wanted]:
+        return False
+    signs = {direction == want for (_, direction), (_, want) in zip(rest, wanted)}
+    return len(signs) <= 1
+
+
+def _model_keys(document, keys):
+    names = {field.db_field: name for name, field in document._fields.items()}
+    return tuple(('-' if direction == -1 else '') + names.get(field, field) for field, direction in keys)
+
+
+def index_usage(document):
+    """{index name: ops since server start} from $indexStats, or None if unsupported"""
+    try:
+        return {row['name']: row['accesses']['ops']
+                for row in document._get_collection().aggregate([{'$indexStats': {}}])}
+    except (OperationFailure, NotImplementedError):
+        return None
+
+
+def advise(min_count=1, max_ratio=10.0):
+    """Compare recorded slow query shapes with the declared indexes.
+
+    Returns ``{collection: {'suggestions', 'redundant', 'unused'}}``. A shape
+    gets a suggestion when no declared index starts with its recommended keys
+    and it scanned a whole collection or more than ``max_ratio`` documents per
+    result. ``unused`` is None when the server cannot report index usage.
+    """
+    models = document_classes()
+    report = {}
+    for collection, document in sorted(models.items()):
+        if collection in IGNORED_COLLECTIONS:
+            continue
+        declared = _index_keys(document)
+        suggestions = {}
+        for stat in QueryShapeStat.objects(collection=collection, count__gte=min_count).order_by('-total_ms'):
+            filter_shape = [tuple(pair) for pair in stat.filter]
+            keys = recommend_index(filter_shape, [tuple(pair) for pair in stat.sort])
+            if not keys or keys == [('_id', 1)]:
+                continue
+            equality = sum(1 for _, kind in filter_shape if kind in ('eq', 'in'))
+            if any(covers(index, keys, equality) for index in declared):
+                continue
+            ratio = stat.docs_examined / max(stat.returned, 1) if stat.explains else None
+            if stat.plan != 'COLLSCAN' and (ratio is None or ratio <= max_ratio):
+                continue
+            suggestion = suggestions.setdefault(_model_keys(document, keys), {
+                'index': _model_keys(document, keys), 'queries': 0, 'total_ms': 0.0, 'shapes': [],
+            })
+            suggestion['queries'] += stat.count
+            suggestion['total_ms'] += stat.total_ms
+            suggestion['shapes'].append({
+                'database': stat.database, 'command': stat.command, 'filter': stat.filter, 'sort': stat.sort,
+                'count': stat.count, 'avg_ms': round(stat.total_ms / stat.count, 3),
+                'examined_per_result': round(ratio, 1) if ratio is not None else None, 'plan': stat.plan,
+            })
+
+        redundant = []
+        for index in declared[1:]:
+            for other in declared:
+                if other is not index and len(other) > len(index) and covers(other, index, 1 if len(index) == 1 else 0):
+                    redundant.append({'index': _model_keys(document, index), 'covered_by': _model_keys(document, other)})
+                    break
+
+        usage = index_usage(document)
+        unused = None
+        if usage is not None:
+            unused = [_model_keys(document, index) for index in declared[1:] if usage.get(index_name(index)) == 0]
+
+        report[collection] = {
+            'suggestions': sorted(suggestions.values(), key=lambda item: -item['total_ms']),
+            'redundant': redundant,
+            'unused': unused,
+        }
+    return report
@@ -0,0 +1,200 @@
+import io
+import json
+from itertools import islice
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from bson import Decimal128
+from pyarrow import csv as arrow_csv, parquet
+from rest_framework import serializers
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+COLUMNAR_FORMATS = ('parquet', 'arrow', 'csv')
+# Rows per record batch, which is also a Parquet row group
+COLUMNAR_BATCH_SIZE = 65536
+TIMESTAMP = pa.timestamp('ms', tz='UTC')
+
+
+def _column_type(field):
+    """Arrow type for a serializer field; JSON text for anything without a flat equivalent"""
+    if isinstance(field, serializers.DecimalField):
+        return pa.decimal128(field.max_digits or 38, field.decimal_places or 0)
+    if isinstance(field, serializers.DateTimeField):
+        # MongoDB keeps UTC milliseconds
+        return TIMESTAMP
+    if isinstance(field, serializers.BooleanField):
+        return pa.bool_()
+    if isinstance(field, serializers.IntegerField):
+        return pa.int64()
+    if isinstance(field, serializers.FloatField):
+        return pa.float64()
+    if isinstance(field, (serializers.CharField, serializers.ChoiceField)):
+        return pa.string()
+    return None
+
+
+def _strings(values, arrow_type):
+    return pa.array([None if value is None else str(value) for value in values], arrow_type)
+
+
+def _json(values, arrow_type):
+    return pa.array([None if value is None else json.dumps(value, cls=encoders.JSONEncoder) for value in values],
+                    pa.string())
+
+
+def _decimal_converter(model_field):
+    to_python = model_field.to_python
+
+    def convert(values, arrow_type):
+        # Amounts are stored as floats already rounded to their places, so
+        # Arrow can round and cast them; anything else goes through Decimal
+        if all(type(value) is float for value in values if value is not None):
+            floats = pa.array(values, pa.float64())
+            rounded = pc.round(floats, arrow_type.scale, round_mode='half_up')
+            if pc.all(pc.equal(rounded, floats)).as_py() is not False:
+                return rounded.cast(arrow_type)
+        return pa.array([None if value is None else to_python(
+            value.to_decimal() if isinstance(value, Decimal128) else value) for value in values], arrow_type)
+    return convert
+
+
+def _plain(values, arrow_type):
+    return pa.array(values, arrow_type)
+
+
+class ColumnarExporter:
+    """Turns raw documents into Arrow record batches with a serializer's columns.
+
+    Columns are converted a batch at a time in Arrow rather than row by row,
+    which is what makes exports many times faster than the JSON API.
+    Decimals become decimal128 and datetimes UTC timestamps.
+    """
+
+    def __init__(self, serializer):
+        model_fields = serializer.Meta.model._fields
+        columns, self.converters = [], []
+        for name, key, _, default in serializer.get_raw_converters():
+            field, model_field = serializer.fields[name], model_fields[name]
+            arrow_type = _column_type(field)
+            if name == 'id':
+                convert = _strings
+            elif arrow_type is None:
+                arrow_type, convert = pa.string(), _json
+            elif pa.types.is_decimal(arrow_type):
+                convert = _decimal_converter(model_field)
+            else:
+                convert = _plain
+            columns.append(pa.field(name, arrow_type))
+            if model_field.default is None:
+                default = None
+            self.converters.append((key, default, convert, arrow_type))
+        self.schema = pa.schema(columns)
+
+    def record_batch(self, rows):
+        arrays = []
+        for key, default, convert, arrow_type in self.converters:
+            values = [row.get(key) for row in rows]
+            if default is not None and None in values:
+                # Missing values read as the model default, as in serialize_raw
+                values = [default() if value is None else value for value in values]
+            arrays.append(convert(values, arrow_type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def batches(self, cursor, batch_size=COLUMNAR_BATCH_SIZE):
+        # A generator, since iter() on a MongoEngine queryset starts over each time
+        documents = (row for row in cursor)
+        rows = list(islice(documents, batch_size))
+        while rows:
+            yield self.record_batch(rows)
+            rows = list(islice(documents, batch_size))
+
+
+def open_writer(sink, schema, file_format):
+    """A writer of record batches to ``sink``, a path or binary file"""
+    if file_format == 'parquet':
+        return parquet.ParquetWriter(sink, schema)
+    if file_format == 'arrow':
+        return pa.ipc.new_stream(sink, schema)
+    if file_format == 'csv':
+        return arrow_csv.CSVWriter(sink, schema)
+    raise ValueError('Choose from: %s.' % ', '.join(COLUMNAR_FORMATS))
+
+
+def write_columnar(exporter, cursor, sink, file_format, batch_size=COLUMNAR_BATCH_SIZE):
+    """Write every document of ``cursor`` to ``sink``; returns the number of rows"""
+    rows = 0
+    writer = open_writer(sink, exporter.schema, file_format)
+    try:
+        for batch in exporter.batches(cursor, batch_size):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        writer.close()
+    return rows
+
+
+class _Chunks(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        # Parquet records offsets from here, so it counts every byte ever written
+        return self.position
+
+    def drain(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def iter_columnar(exporter, cursor, file_format, batch_size=COLUMNAR_BATCH_SIZE):
+    """Encode ``cursor`` as Parquet, Arrow IPC or CSV, yielding bytes once per record batch"""
+    sink = _Chunks()
+    writer = open_writer(sink, exporter.schema, file_format)
+    for batch in exporter.batches(cursor, batch_size):
+        writer.write_batch(batch)
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+
+class ColumnarRenderer(BaseRenderer):
+    """Lets content negotiation accept a columnar ``?format=``.
+
+    Exports write their own body; error responses are rendered as JSON.
+    """
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return JSONRenderer().render(data)
+
+
+class ParquetRenderer(ColumnarRenderer):
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
+
+
+class ArrowStreamRenderer(ColumnarRenderer):
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+
+
+class CSVRenderer(ColumnarRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
@@ -0,0 +1,143 @@
+from datetime import datetime, time
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+# MongoEngine's ordering key for a $text query's relevance, best first
+TEXT_SCORE = '$text_score'
+
+
+def indexed_fields(model):
+    """Return the fields that lead one of the model's declared indexes.
+
+    Partial indexes do not count, as they only hold a subset of documents,
+    and neither do text indexes, which only serve $text searches.
+    """
+    names = {field.db_field: name for name, field in model._fields.items()}
+    leading = {'id'}
+    for spec in model._meta.get('index_specs', []):
+        if 'partialFilterExpression' in spec or spec['fields'][0][1] == 'text':
+            continue
+        db_field = spec['fields'][0][0]
+        if db_field in names:
+            leading.add(names[db_field])
+    return leading
+
+
+class IndexedQueryFilter:
+    """Turn whitelisted query parameters into an indexed MongoEngine query.
+
+    ``?type=expense&date__gte=2024-01-01`` filters, ``?ordering=-date`` sorts
+    and ``?fields=id,amount`` projects. Filters and orderings must be listed
+    on the view and lead one of the model's indexes; anything else on a model
+    field is rejected rather than turned into a collection scan. ``?q=an``
+    keeps documents holding the words in the view's ``search_fields``, through
+    the collection's text index, best matches first unless ``?ordering=`` is
+    given; it ignores accents but not đ.
+    """
+    ordering_param = 'ordering'
+    fields_param = 'fields'
+    search_param = 'q'
+    lookups = ('exact', 'in', 'ne', 'gt', 'gte', 'lt', 'lte')
+
+    def filter_queryset(self, request, queryset, view):
+        model = view.model
+        conditions = {}
+        for param in request.query_params:
+            field_name, _, lookup = param.partition('__')
+            if field_name not in model._fields:
+                continue
+            self._check_indexed(param, field_name, view.filter_fields, model)
+            lookup = lookup or 'exact'
+            if lookup not in self.lookups:
+                raise ValidationError({param: ['Unsupported lookup "%s".' % lookup]})
+
+            raw = request.query_params.get(param)
+            if lookup == 'in':
+                value = [self._to_value(view, param, field_name, item) for item in raw.split(',')]
+            else:
+                value = self._to_value(view, param, field_name, raw)
+            conditions[field_name if lookup == 'exact' else param] = value
+
+        if conditions:
+            queryset = queryset.filter(**conditions)
+
+        query = request.query_params.get(self.search_param, '').strip()
+        if query:
+            if not view.search_fields:
+                raise ValidationError({self.search_param: ['Searching is not supported here.']})
+            queryset = queryset.search_text(query)
+
+        fields = self.get_projection(request, view)
+        if fields is not None:
+            keys = [key.lstrip('-') for key in view.paginator.get_ordering(view) if key != TEXT_SCORE]
+            queryset = queryset.only(*set(fields).union(keys))
+        return queryset
+
+    def get_ordering(self, request, view):
+        value = request.query_params.get(self.ordering_param)
+        if not value:
+            if view.search_fields and request.query_params.get(self.search_param, '').strip():
+                return (TEXT_SCORE,)
+            return None
+        ordering = []
+        for key in value.split(','):
+            key = key.strip()
+            self._check_indexed(self.ordering_param, key.lstrip('-'), view.ordering_fields, view.model)
+            ordering.append(key)
+        return tuple(ordering)
+
+    def get_range(self, request, view, field_name):
+        """``(lowest, highest)`` value the filters on ``field_name`` allow; None where unbounded"""
+        lows, highs = [], []
+        for lookup, bounds in (('exact', (lows, highs)), ('in', (lows, highs)), ('gt', (lows,)), ('gte', (lows,)),
+                               ('lt', (highs,)), ('lte', (highs,))):
+            param = field_name if lookup == 'exact' else '%s__%s' % (field_name, lookup)
+            raw = request.query_params.get(param)
+            if raw is None:
+                continue
+            values = [self._to_value(view, param, field_name, item) for item in raw.split(',')] \
+                if lookup == 'in' else [self._to_value(view, param, field_name, raw)]
+            for bound in bounds:
+                bound.extend(values)
+        return min(lows) if lows else None, max(highs) if highs else None
+
+    def get_projection(self, request, view):
+        value = request.query_params.get(self.fields_param)
+        if not value:
+            return None
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in view.serializer_class().fields]
+        if unknown:
+            raise ValidationError({self.fields_param: ['Unknown fields: %s.' % ', '.join(unknown)]})
+        return fields
+
+    def _check_indexed(self, param, field_name, allowed, model):
+        if field_name not in allowed:
+            raise ValidationError({param: ['Filtering or ordering on "%s" is not supported.' % field_name]})
+        if field_name not in indexed_fields(model):
+            raise ValidationError({param: ['"%s" has no index to serve this query.' % field_name]})
+
+    def _to_value(self, view, param, field_name, raw):
+        if field_name == 'id':
+            try:
+                return ObjectId(raw)
+            except (InvalidId, TypeError):
+                raise ValidationError({param: ['"%s" is not a valid id.' % raw]})
+
+        field = view.serializer_class().fields.get(field_name)
+        if field is None:
+            return raw
+        try:
+            if isinstance(field, serializers.DateTimeField) and parse_date(raw):
+                # Accept plain dates for datetime fields, meaning midnight.
+                return timezone.make_aware(datetime.combine(parse_date(raw), time.min))
+            return field.to_internal_value(raw)
+        except ValueError:
+            raise ValidationError({param: ['"%s" is not a valid date.' % raw]})
+        except serializers.ValidationError as exc:
+            raise ValidationError({param: exc.detail})
@@ -0,0 +1,321 @@
+import csv
+import io
+import re
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+from xml.etree import ElementTree
+
+import gridfs
+from bson import ObjectId
+from mongoengine import fields
+from pymongo.errors import BulkWriteError
+
+from .bulk import DUPLICATE_KEY_ERROR, _write_errors
+from .jobs import job_type
+
+IMPORT_FORMATS = ('csv', 'xlsx')
+IMPORT_CHUNK_SIZE = 5000
+# Row errors kept in a report; the counts cover every row
+MAX_REPORTED_ERRORS = 1000
+FILES_COLLECTION = 'import_files'
+
+_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_RELATIONSHIP = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+_PACKAGE_RELS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+# Built-in number formats that display dates or times
+_DATE_FORMAT_IDS = frozenset(range(14, 23)) | frozenset(range(45, 48))
+# Quoted text, escapes and [colour]/[h] sections do not make a format a date format
+_FORMAT_LITERALS = re.compile(r'"[^"]*"|\\.|\[[^\]]*\]')
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+
+
+def import_format(filename):
+    """'csv' or 'xlsx' from an upload's name; ValueError for anything else"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension not in IMPORT_FORMATS:
+        raise ValueError('Upload a .csv or .xlsx file.')
+    return extension
+
+
+def _header(cells):
+    return [str(cell).strip().lower() for cell in cells]
+
+
+def read_csv(stream):
+    """Yield ``(row number, {column: text})`` from a binary CSV stream with a header row"""
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    header = _header(next(reader, ()))
+    for number, cells in enumerate(reader, start=2):
+        if cells:
+            yield number, dict(zip(header, cells))
+
+
+def _column(reference):
+    index = 0
+    for char in reference:
+        if char.isdigit():
+            break
+        index = index * 26 + ord(char) - 64
+    return index - 1
+
+
+def _shared_strings(archive):
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+    strings = []
+    with archive.open('xl/sharedStrings.xml') as stream:
+        for _, element in ElementTree.iterparse(stream):
+            if element.tag == _MAIN + 'si':
+                # Plain text, or rich text runs; phonetic hints (rPh) are not part of the value
+                texts = element.findall(_MAIN + 't') or element.findall('%sr/%st' % (_MAIN, _MAIN))
+                strings.append(''.join(text.text or '' for text in texts))
+                element.clear()
+    return strings
+
+
+def _date_styles(archive):
+    """Indexes of the cell styles whose number format shows a date"""
+    if 'xl/styles.xml' not in archive.namelist():
+        return frozenset()
+    styles = ElementTree.fromstring(archive.read('xl/styles.xml'))
+    date_formats = set(_DATE_FORMAT_IDS)
+    for number_format in styles.iter(_MAIN + 'numFmt'):
+        code = _FORMAT_LITERALS.sub('', number_format.get('formatCode', '')).lower()
+        if any(char in code for char in 'dmyhs'):
+            date_formats.add(int(number_format.get('numFmtId')))
+    cell_formats = styles.find(_MAIN + 'cellXfs')
+    return frozenset(
+        index for index, xf in enumerate(cell_formats if cell_formats is not None else ())
+        if int(xf.get('numFmtId', 0)) in date_formats
+    )
+
+
+def _first_sheet(archive):
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    sheet = workbook.find('%ssheets/%ssheet' % (_MAIN, _MAIN))
+    if sheet is None:
+        raise ValueError('The workbook has no sheets.')
+    relationships = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for relationship in relationships.iter(_PACKAGE_RELS + 'Relationship'):
+        if relationship.get('Id') == sheet.get(_RELATIONSHIP):
+            target = relationship.get('Target')
+            return target.lstrip('/') if target.startswith('/') else 'xl/' + target
+    raise ValueError('The workbook has no sheets.')
+
+
+def _from_serial(serial):
+    value = _EXCEL_EPOCH + timedelta(days=float(serial))
+    # Serials carry float noise; MongoDB keeps milliseconds anyway
+    return value.replace(microsecond=0) + timedelta(milliseconds=round(value.microsecond / 1000))
+
+
+def read_xlsx(stream):
+    """Yield ``(row number, {column: value})`` from the first sheet of a seekable XLSX stream.
+
+    The sheet is parsed incrementally, so memory stays flat however many
+    rows it has. Values come back as the text Excel stored, except cells
+    formatted as dates, which become datetimes.
+    """
+    try:
+        archive = zipfile.ZipFile(stream)
+        strings, date_styles, sheet = _shared_strings(archive), _date_styles(archive), _first_sheet(archive)
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as exc:
+        raise ValueError('Not a readable XLSX file: %s' % exc) from exc
+    value_tag, inline_tag, cell_tag = _MAIN + 'v', _MAIN + 'is', _MAIN + 'c'
+    header, number = None, 0
+    with archive.open(sheet) as source:
+        for _, element in ElementTree.iterparse(source):
+            if element.tag != _MAIN + 'row':
+                continue
+            # References are optional; a row or cell without one follows the previous
+            number = int(element.get('r') or number + 1)
+            cells, column = {}, -1
+            for cell in element.iter(cell_tag):
+                column = _column(cell.get('r')) if cell.get('r') else column + 1
+                kind = cell.get('t', 'n')
+                if kind == 'inlineStr':
+                    inline = cell.find(inline_tag)
+                    value = ''.join(text.text or '' for text in inline.iter(_MAIN + 't')) if inline is not None else ''
+                else:
+                    value = cell.findtext(value_tag)
+                    if value is None:
+                        continue
+                    if kind == 's':
+                        value = strings[int(value)]
+                    elif kind == 'n' and cell.get('s') is not None and int(cell.get('s')) in date_styles:
+                        value = _from_serial(value)
+                cells[column] = value
+            element.clear()
+            if header is None:
+                header = {index: name for index, name in zip(cells, _header(cells.values()))}
+            elif cells:
+                yield number, {header[index]: value for index, value in cells.items() if index in header}
+
+
+def read_rows(stream, file_format):
+    return read_xlsx(stream) if file_format == 'xlsx' else read_csv(stream)
+
+
+def _utc_naive(value):
+    # As MongoDB stores it: UTC, to the millisecond
+    if value.tzinfo is not None and value.utcoffset():
+        value = value.astimezone(timezone.utc)
+    return value.replace(tzinfo=None, microsecond=value.microsecond // 1000 * 1000)
+
+
+def _document_builder(model):
+    """Return ``build(chunk)``, the raw documents ``model(**data).to_mongo()`` would give.
+    
+    Date defaults such as created_at are taken once per chunk, like the
+    shared timestamp of a bulk update.
+    """
+    converters, defaults = {}, []
+    for name, model_field in model._fields.items():
+        if name == 'id':
+            continue
+        if isinstance(model_field, fields.DateTimeField):
+            convert = _utc_naive
+        elif isinstance(model_field, (fields.StringField, fields.IntField)):
+            convert = None
+        else:
+            convert = model_field.to_mongo
+        converters[name] = (model_field.db_field, convert)
+        if model_field.default is not None:
+            per_chunk = isinstance(model_field, fields.DateTimeField)
+            defaults.append((name, model_field.db_field, model_field.default, convert, per_chunk))
+
+    def default_value(default, convert):
+        value = default() if callable(default) else default
+        return value if value is None or convert is None else convert(value)
+
+    def build(chunk):
+        shared = {name: default_value(default, convert)
+                  for name, db_field, default, convert, per_chunk in defaults if per_chunk}
+        documents = []
+        for data in chunk:
+            document = {}
+            for name, value in data.items():
+                if value is not None:
+                    db_field, convert = converters[name]
+                    document[db_field] = value if convert is None else convert(value)
+            for name, db_field, default, convert, per_chunk in defaults:
+                if db_field not in document:
+                    value = shared[name] if per_chunk else default_value(default, convert)
+                    if value is not None:
+                        document[db_field] = value
+            document.update(model.derived_changes(document))
+            documents.append(document)
+        return documents
+    return build
+
+
+def import_rows(viewset_class, rows, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """Validate, de-duplicate and insert ``(row number, dict)`` rows a chunk at a time.
+
+    Rows are checked with the viewset's serializer rules (validate_rows).
+    A row whose natural key, the viewset's ``import_key``, is already stored
+    or came earlier in the file counts as a duplicate and is skipped, so
+    running an import twice adds nothing. Each chunk is one unordered
+    insert_many. Returns a report with counts, the first
+    MAX_REPORTED_ERRORS row errors and the throughput.
+    """
+    viewset = viewset_class()
+    model, key_fields = viewset.model, viewset.import_key
+    serializer = viewset.serializer_class()
+    collection = model._get_collection()
+    build = _document_builder(model)
+    db_key = [model._fields[name].db_field for name in key_fields]
+    report = {'rows': 0, 'created': 0, 'duplicates': 0, 'invalid': 0, 'errors': []}
+    started = time.perf_counter()
+
+    def fail(number, errors):
+        report['invalid'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'row': number, 'errors': errors})
+
+    def flush(numbers, chunk):
+        documents = build(chunk)
+        keys = [tuple(map(document.get, db_key)) for document in documents]
+        # Keys already stored, earlier chunks' included, looked up by the first
+        # key field's values in this chunk; only this chunk's window is kept
+        lookup = {db_key[0]: {'$in': list({key[0] for key in keys})}}
+        seen = {tuple(row.get(field) for field in db_key)
+                for row in collection.find(lookup, dict.fromkeys(db_key, 1))}
+        batch, batch_numbers = [], []
+        for number, key, document in zip(numbers, keys, documents):
+            if key in seen:
+                report['duplicates'] += 1
+            else:
+                seen.add(key)
+                batch.append(document)
+                batch_numbers.append(number)
+        if not batch:
+            return
+        written = batch
+        try:
+            collection.insert_many(batch, ordered=False)
+        except BulkWriteError as exc:
+            failures = _write_errors(exc)
+            written = [document for position, document in enumerate(batch) if position not in failures]
+            for position, error in failures.items():
+                if error['code'] == DUPLICATE_KEY_ERROR:
+                    report['duplicates'] += 1
+                else:
+                    fail(batch_numbers[position], {'non_field_errors': [error['errmsg']]})
+        report['created'] += len(written)
+        viewset.perform_bulk_write(created=written)
+
+    numbers, chunk = [], []
+    rows = iter(rows)
+    while True:
+        batch = [row for _, row in zip(range(chunk_size), rows)]
+        if not batch:
+            break
+        report['rows'] += len(batch)
+        for (number, row), (data, errors) in zip(batch, serializer.validate_rows(row for _, row in batch)):
+            if errors is None:
+                numbers.append(number)
+                chunk.append(data)
+            else:
+                fail(number, errors)
+        if chunk:
+            flush(numbers, chunk)
+            numbers, chunk = [], []
+        if progress is not None:
+            progress(report['rows'])
+
+    if report['created']:
+        viewset.invalidate_cache()
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    report['rows_per_second'] = round(report['rows'] / report['seconds']) if report['seconds'] else report['rows']
+    return report
+
+
+def import_file(viewset_class, stream, file_format, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """import_rows over a binary CSV or XLSX stream"""
+    return import_rows(viewset_class, read_rows(stream, file_format), chunk_size, progress)
+
+
+def _files(model):
+    return gridfs.GridFS(model._get_db(), collection=FILES_COLLECTION)
+
+
+def store_upload(model, upload):
+    """Keep an uploaded file in GridFS until its import job has run; returns its id"""
+    return _files(model).put(upload, filename=upload.name)
+
+
+@job_type('import', concurrency=2)
+def _import(context):
+    # views imports this module to queue imports
+    from .views import IMPORT_VIEWSETS
+    viewset_class = IMPORT_VIEWSETS[context.params['collection']]
+    files = _files(viewset_class.model)
+    file_id = ObjectId(context.params['file_id'])
+    with files.get(file_id) as stream:
+        # A retry re-reads the whole file; rows written by the failed attempt count as duplicates
+        report = import_file(viewset_class, stream, context.params['format'],
+                             progress=lambda rows: context.progress(rows, message='rows read'))
+    files.delete(file_id)
+    return report
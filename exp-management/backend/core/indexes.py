@@ -0,0 +1,118 @@
+from mongoengine.base.common import _document_registry
+from pymongo import IndexModel
+
+# Options that make two indexes on the same keys behave differently
+COMPARED_OPTIONS = {'unique': False, 'sparse': False, 'partialFilterExpression': None, 'expireAfterSeconds': None}
+
+
+def document_classes():
+    """Concrete Document classes by collection name"""
+    documents = {}
+    for document in _document_registry.values():
+        meta = document._meta
+        if not meta.get('abstract') and meta.get('collection'):
+            documents[meta['collection']] = document
+    return documents
+
+
+def index_name(keys):
+    """The name MongoDB gives an index on ``keys``, e.g. ``type_1_date_-1``"""
+    return '_'.join('%s_%s' % (field, direction) for field, direction in keys)
+
+
+def declared_indexes(document):
+    """{name: (keys, options)} for a document's meta['indexes'] and unique fields.
+
+    Transactions in a time-series collection get their indexes from
+    core/timeseries.py.
+    """
+    index_opts = document._meta.get('index_opts') or {}
+    declared = {}
+    for spec in document._meta.get('index_specs', []):
+        options = dict(index_opts, **spec)
+        keys = [tuple(key) for key in options.pop('fields')]
+        options.pop('cls', None)
+        declared[options.pop('name', None) or index_name(keys)] = (keys, options)
+    # Imported here, as core.timeseries builds on this module
+    from .timeseries import timeseries_indexes
+    return timeseries_indexes(document, declared)
+
+
+def live_indexes(document):
+    """{name: (keys, options)} for the indexes the collection has, without _id_"""
+    live = {}
+    for name, info in document._get_collection().index_information().items():
+        if name != '_id_':
+            options = {option: info[option] for option in COMPARED_OPTIONS if option in info}
+            keys = [tuple(key) for key in info['key']]
+            if ('_fts', 'text') in keys:
+                # The server lists a text index as _fts/_ftsx keys with the fields in weights
+                keys = [key for key in keys if key[0] not in ('_fts', '_ftsx')]
+                keys.extend((field, 'text') for field in info['weights'])
+            live[name] = (keys, options)
+    return live
+
+
+def _key_order(keys):
+    """Keys with text fields sorted last; their order does not matter"""
+    return [key for key in keys if key[1] != 'text'] + sorted(key for key in keys if key[1] == 'text')
+
+
+def _matches(declared, live):
+    (keys, options), (live_keys, live_options) = declared, live
+    return _key_order(keys) == _key_order(live_keys) and all(
+        options.get(option, default) == live_options.get(option, default)
+        for option, default in COMPARED_OPTIONS.items()
+    )
+
+
+def index_plan(document):
+    """Compare declared with live indexes.
+
+    Returns ``(declared, missing, changed, stale)`` where changed indexes
+    share a name with a declared one but differ in keys or options, and stale
+    ones exist on the collection without being declared.
+    """
+    declared, live = declared_indexes(document), live_indexes(document)
+    missing = [name for name in declared if name not in live]
+    changed = [name for name in declared if name in live and not _matches(declared[name], live[name])]
+    stale = [name for name in live if name not in declared]
+    return declared, missing, changed, stale
+
+
+def sync_indexes(document, drop_stale=False, dry_run=False):
+    """Build missing indexes of a document's collection, optionally dropping stale ones.
+
+    All missing indexes go into one createIndexes command, which builds them
+    in a single collection scan. Builds are online on MongoDB 4.2+: the
+    collection is locked only briefly at the start and end, so reads and
+    writes carry on; ``background`` gives the same on older servers.
+
+    New indexes are built before anything is dropped. Stale and changed
+    indexes are only dropped with ``drop_stale``; a changed index is then
+    dropped and rebuilt under its declared definition.
+    """
+    declared, missing, changed, stale = index_plan(document)
+    result = {'created': [], 'dropped': [], 'changed': changed, 'stale': stale}
+    rebuilt = changed if drop_stale else []
+    if dry_run:
+        result['created'] = missing + rebuilt
+        result['dropped'] = (stale + changed) if drop_stale else []
+        return result
+
+    collection = document._get_collection()
+    if missing:
+        collection.create_indexes([_index_model(name, *declared[name]) for name in missing])
+        result['created'].extend(missing)
+    if drop_stale:
+        for name in stale + changed:
+            collection.drop_index(name)
+            result['dropped'].append(name)
+    if rebuilt:
+        collection.create_indexes([_index_model(name, *declared[name]) for name in rebuilt])
+        result['created'].extend(rebuilt)
+    return result
+
+
+def _index_model(name, keys, options):
+    return IndexModel(keys, name=name, background=True, **options)
@@ -0,0 +1,310 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from .models import Job
+from .mongo import reset_connections
+from .summaries import rebuild_rollups
+from .tenants import current_tenant, using_tenant
+
+logger = logging.getLogger(__name__)
+
+JOB_TYPES = {}
+
+
+class JobType:
+    def __init__(self, name, handler, concurrency, max_attempts, retry_delay):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def get_concurrency(self):
+        return getattr(settings, 'JOB_CONCURRENCY', {}).get(self.name, self.concurrency)
+
+
+def job_type(name, concurrency=1, max_attempts=3, retry_delay=30):
+    """Register the decorated ``handler(context)`` as job type ``name``.
+
+    At most ``concurrency`` jobs of the type run at once across all workers;
+    JOB_CONCURRENCY overrides it per type. A job that raises is retried up to
+    ``max_attempts`` times in all, ``retry_delay`` seconds later, doubling
+    each time. The handler's return value, a dict, becomes the job's result.
+    """
+    def register(handler):
+        JOB_TYPES[name] = JobType(name, handler, concurrency, max_attempts, retry_delay)
+        return handler
+    return register
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    """What a handler gets: the job's params and a way to report progress"""
+    progress_interval = 1.0
+
+    def __init__(self, job_id, params):
+        self.job_id = job_id
+        self.params = params
+        self.cancelled = False
+        self._reported = None
+
+    def progress(self, done, total=None, message=None):
+        """Record progress, at most once a second.
+
+        Raises JobCancelled once the job was cancelled, so long handlers
+        should call it regularly.
+        """
+        if self.cancelled:
+            raise JobCancelled
+        now = time.monotonic()
+        if self._reported is None or now - self._reported >= self.progress_interval or done == total:
+            self._reported = now
+            Job._get_collection().update_one({'_id': self.job_id}, {'$set': {
+                'progress': {'done': done, 'total': total, 'message': message},
+            }})
+
+
+def enqueue(name, params=None, user=None, delay=0):
+    """Queue a job of a registered type; returns the Job"""
+    if name not in JOB_TYPES:
+        raise ValueError('Unknown job type %r' % name)
+    return Job(
+        type=name,
+        params=params or {},
+        max_attempts=JOB_TYPES[name].max_attempts,
+        created_by=user.get_username() if user is not None and user.is_authenticated else None,
+        tenant=current_tenant(),
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    ).save()
+
+
+def cancel(job_id):
+    """Cancel a queued job of the current tenant, or ask a running one to stop at its next progress report.
+
+    Returns the raw job, or None when there is no such unfinished job.
+    """
+    collection = Job._get_collection()
+    job = collection.find_one_and_update(
+        {'_id': job_id, 'tenant': current_tenant(), 'status': 'queued'},
+        {'$set': {'status': 'cancelled', 'finished_at': datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if job is None:
+        job = collection.find_one_and_update(
+            {'_id': job_id, 'tenant': current_tenant(), 'status': 'running'},
+            {'$set': {'cancel_requested': True}},
+            return_document=ReturnDocument.AFTER,
+        )
+    return job
+
+
+class Worker:
+    """Claims ready jobs one at a time and runs them.
+
+    A claimed job is leased to the worker, and a heartbeat thread renews the
+    lease while the handler runs. When a worker dies its lease runs out and
+    another worker retries the job, so handlers must be safe to run again.
+    """
+    lease_seconds = 60
+    sweep_interval = 30
+
+    def __init__(self, types=None, poll_interval=1.0, name=None):
+        self.types = list(types or JOB_TYPES)
+        self.poll_interval = poll_interval
+        self.name = name or '%s:%d' % (socket.gethostname(), os.getpid())
+        self._swept = None
+
+    def _free_types(self):
+        running = {row['_id']: row['count'] for row in Job._get_collection().aggregate([
+            {'$match': {'status': 'running', 'type': {'$in': self.types}}},
+            {'$group': {'_id': '$type', 'count': {'$sum': 1}}},
+        ])}
+        return [name for name in self.types if running.get(name, 0) < JOB_TYPES[name].get_concurrency()]
+
+    def claim(self):
+        """Take the next ready job of a type below its concurrency limit; the raw job or None"""
+        types = self._free_types()
+        if not types:
+            return None
+        now = datetime.utcnow()
+        collection = Job._get_collection()
+        job = collection.find_one_and_update(
+            {'status': 'queued', 'run_at': {'$lte': now}, 'type': {'$in': types}},
+            {'$set': {'status': 'running', 'worker': self.name, 'started_at': now,
+                      'lease_expires_at': now + timedelta(seconds=self.lease_seconds)},
+             '$inc': {'attempts': 1}},
+            sort=[('run_at', 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is None:
+            return None
+        # Workers that counted at the same time may both have claimed one; the
+        # later claims past the limit give theirs back
+        ahead = collection.count_documents({'type': job['type'], 'status': 'running', '$or': [
+            {'started_at': {'$lt': now}},
+            {'started_at': now, '_id': {'$lt': job['_id']}},
+        ]})
+        if ahead >= JOB_TYPES[job['type']].get_concurrency():
+            collection.update_one(
+                {'_id': job['_id'], 'worker': self.name, 'status': 'running'},
+                {'$set': {'status': 'queued'}, '$inc': {'attempts': -1},
+                 '$unset': {'worker': '', 'started_at': '', 'lease_expires_at': ''}},
+            )
+            return None
+        return job
+
+    def _update(self, job, update):
+        # Only while the job is still ours: a worker whose lease ran out must not overwrite the retry
+        return Job._get_collection().find_one_and_update(
+            {'_id': job['_id'], 'worker': self.name, 'status': 'running'}, update,
+            projection={'cancel_requested': 1}, return_document=ReturnDocument.AFTER,
+        )
+
+    def _heartbeat(self, job, context, stop):
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                current = self._update(job, {'$set': {
+                    'lease_expires_at': datetime.utcnow() + timedelta(seconds=self.lease_seconds),
+                }})
+            except PyMongoError:
+                logger.exception('Could not renew the lease on job %s', job['_id'])
+                continue
+            if current is None or current.get('cancel_requested'):
+                context.cancelled = True
+
+    def run_job(self, job):
+        kind = JOB_TYPES[job['type']]
+        context = JobContext(job['_id'], job.get('params') or {})
+        context.cancelled = bool(job.get('cancel_requested'))
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, context, stop), daemon=True)
+        heartbeat.start()
+        try:
+            with using_tenant(job.get('tenant')):
+                result = kind.handler(context)
+        except JobCancelled:
+            self._finish(job, 'cancelled')
+        except Exception as exc:
+            logger.exception('Job %s (%s) failed on attempt %d', job['_id'], job['type'], job['attempts'])
+            error = ''.join(traceback.format_exception_only(type(exc), exc)).strip()
+            if job['attempts'] < job['max_attempts']:
+                delay = kind.retry_delay * 2 ** (job['attempts'] - 1)
+                self._update(job, {
+                    '$set': {'status': 'queued', 'error': error,
+                             'run_at': datetime.utcnow() + timedelta(seconds=delay)},
+                    '$unset': {'worker': '', 'lease_expires_at': ''},
+                })
+            else:
+                self._finish(job, 'failed', error=error)
+        else:
+            self._finish(job, 'succeeded', result=result or {})
+        finally:
+            stop.set()
+            heartbeat.join()
+
+    def _finish(self, job, status, **values):
+        self._update(job, {
+            '$set': dict(values, status=status, finished_at=datetime.utcnow()),
+            '$unset': {'lease_expires_at': ''},
+        })
+
+    def requeue_expired(self):
+        """Retry jobs whose worker stopped renewing its lease, or fail them after their last attempt"""
+        now = datetime.utcnow()
+        collection = Job._get_collection()
+        expired = {'status': 'running', 'lease_expires_at': {'$lt': now}}
+        for job in collection.find(expired, {'attempts': 1, 'max_attempts': 1, 'worker': 1}):
+            error = 'Worker %s stopped responding' % job.get('worker')
+            if job['attempts'] < job['max_attempts']:
+                update = {'$set': {'status': 'queued', 'run_at': now, 'error': error},
+                          '$unset': {'worker': '', 'lease_expires_at': ''}}
+            else:
+                update = {'$set': {'status': 'failed', 'finished_at': now, 'error': error},
+                          '$unset': {'lease_expires_at': ''}}
+            collection.update_one(dict(expired, _id=job['_id']), update)
+
+    def run(self, stop=None, burst=False):
+        """Work until ``stop`` is set or, with ``burst``, until no job is ready"""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                if self._swept is None or time.monotonic() - self._swept > self.sweep_interval:
+                    self._swept = time.monotonic()
+                    self.requeue_expired()
+                job = self.claim()
+            except PyMongoError:
+                logger.exception('Could not claim a job')
+                job = None
+            if job is not None:
+                self.run_job(job)
+            elif burst:
+                return
+            else:
+                stop.wait(self.poll_interval)
+
+
+def _work(stop, types, poll_interval):
+    # The parent turns signals into stop, letting running jobs finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    reset_connections()
+    Worker(types, poll_interval).run(stop)
+
+
+def run_pool(processes, types=None, poll_interval=1.0):
+    """Run ``processes`` worker processes until SIGTERM or SIGINT, replacing any that die"""
+    context = multiprocessing.get_context('fork')
+    stop = context.Event()
+    # The handler only flips a flag: setting the Event there could deadlock on
+    # the lock a wait() in the main thread holds
+    stopping = []
+
+    def request_stop(signum, frame):
+        stopping.append(signum)
+
+    def spawn():
+        child = context.Process(target=_work, args=(stop, types, poll_interval), name='job-worker')
+        child.start()
+        return child
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    children = [spawn() for _ in range(processes)]
+    while not stopping:
+        time.sleep(1)
+        for index, child in enumerate(children):
+            if not child.is_alive():
+                logger.warning('Job worker %d exited with code %s; starting another', child.pid, child.exitcode)
+                children[index] = spawn()
+    stop.set()
+    for child in children:
+        child.join()
+
+
+@job_type('rebuild_rollups', max_attempts=2)
+def _rebuild_rollups(context):
+    return {'buckets': rebuild_rollups(progress=context.progress)}
+
+
+if settings.DEBUG:
+    # Seeding replaces every employee, so it is only offered in development
+    @job_type('seed_employees', max_attempts=1)
+    def _seed_employees(context):
+        call_command('seed_employees', stdout=StringIO())
+        return {}
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.archive import ARCHIVE_BATCH_SIZE, ARCHIVE_POLICIES, archive, archive_collection, ensure_archive_indexes
+from core.cache import get_response_cache
+from core.tenants import tenant_ids, using_tenant
+
+class Command(BaseCommand):
+    help = 'Moves old transactions and long-closed projects into their archive collections; safe to rerun'
+
+    def add_arguments(self, parser):
+        parser.add_argument('collections', nargs='*', help='Only these collections (default: all with a policy)')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='Documents moved per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would move')
+        parser.add_argument('--tenant', action='append', dest='tenants',
+                            help='Only this tenant; repeat for more (default: every tenant)')
+
+    def handle(self, *args, **options):
+        names = options['collections'] or sorted(ARCHIVE_POLICIES)
+        unknown = [name for name in names if name not in ARCHIVE_POLICIES]
+        if unknown:
+            raise CommandError('No archive policy for: %s' % ', '.join(unknown))
+        try:
+            tenants = tenant_ids(options['tenants'])
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        for tenant in tenants:
+            with using_tenant(tenant):
+                for name in names:
+                    self.archive(ARCHIVE_POLICIES[name], f'{tenant}/{name}' if tenant else name, options)
+
+    def archive(self, policy, name, options):
+        target = archive_collection(policy.model).name
+        if options['dry_run']:
+            count = policy.model._get_collection().count_documents(policy.cold_filter(policy.cutoff()))
+            self.stdout.write(f'[dry run] {name}: {count} documents older than {policy.days} days')
+            return
+        ensure_archive_indexes(policy.model)
+        moved = archive(policy, batch_size=options['batch_size'])
+        if moved:
+            # Other workers' local caches and search indexes catch up within their TTLs
+            get_response_cache().invalidate(policy.model._meta['collection'])
+        self.stdout.write(self.style.SUCCESS(f'{name}: moved {moved} documents to {target}'))
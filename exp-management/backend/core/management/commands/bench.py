@@ -0,0 +1,116 @@
+import json
+import platform
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from mongoengine.connection import get_db
+from core.bench import (
+    SCENARIOS, HTTPTransport, InProcessTransport, compare, peak_rss_mb,
+    run_scenario, sample_ids, seed_transactions
+)
+from core.mongo import use_database
+from core.summaries import rebuild_rollups
+
+class Command(BaseCommand):
+    help = 'Benchmarks the transactions API on a synthetic dataset and prints a JSON report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=10000,
+                            help='Synthetic transactions to seed (default 10000)')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent client threads')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help='Comma separated subset of: %s' % ', '.join(SCENARIOS))
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for data and requests')
+        parser.add_argument('--database', help='Database to seed and query (default <current>_bench)')
+        parser.add_argument('--mock', action='store_true', help='Run against mongomock instead of MongoDB')
+        parser.add_argument('--no-seed', action='store_true', help='Reuse data already in the bench database')
+        parser.add_argument('--keep', action='store_true', help='Keep the bench database afterwards')
+        parser.add_argument('--url', help='Benchmark a running server at this base URL instead, without seeding')
+        parser.add_argument('--token', help='JWT access token for --url')
+        parser.add_argument('--output', help='Write the report to this file instead of stdout')
+        parser.add_argument('--baseline', help='Earlier report to compare against')
+        parser.add_argument('--fail-threshold', type=float,
+                            help='Fail when p95 grows or req/s drops by more than this percent vs --baseline')
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError('Unknown scenarios: %s' % ', '.join(sorted(unknown)))
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--requests and --concurrency must be at least 1')
+
+        report = {
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'options': {key: options[key] for key in ('transactions', 'requests', 'concurrency', 'seed')},
+        }
+        if options['url']:
+            transport = HTTPTransport(options['url'], options['token'])
+            report['dataset'] = {'target': transport.target}
+            report['scenarios'] = self.run(transport, scenarios, options)
+        else:
+            report['dataset'], report['scenarios'] = self.run_local(scenarios, options)
+        report['peak_rss_mb'] = peak_rss_mb()
+
+        failed = False
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                report['baseline'] = compare(report, json.load(baseline_file), options['fail_threshold'])
+            failed = bool(report['baseline']['regressions'])
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output + '\n')
+            self.stderr.write('Wrote %s' % options['output'])
+        else:
+            self.stdout.write(output)
+        if failed:
+            raise CommandError('Regressed scenarios: %s' % ', '.join(report['baseline']['regressions']))
+
+    def run_local(self, scenarios, options):
+        current = get_db().name
+        database = options['database'] or '%s_bench' % current
+        if database == current and not options['mock']:
+            raise CommandError('Refusing to seed synthetic data into the working database %s' % current)
+        client_class = None
+        if options['mock']:
+            try:
+                import mongomock
+            except ImportError:
+                raise CommandError('--mock needs the mongomock package')
+            client_class = mongomock.MongoClient
+
+        with use_database(database, mongo_client_class=client_class):
+            dataset = {'target': 'in-process', 'database': database, 'mock': options['mock']}
+            if not options['no_seed']:
+                get_db().client.drop_database(database)
+                started = time.perf_counter()
+                seed_transactions(options['transactions'], seed=options['seed'])
+                dataset['seed_seconds'] = round(time.perf_counter() - started, 3)
+                started = time.perf_counter()
+                rebuild_rollups()
+                dataset['rollup_seconds'] = round(time.perf_counter() - started, 3)
+                self.stderr.write('Seeded %d transactions into %s' % (options['transactions'], database))
+            dataset['transactions'] = get_db()['transactions'].estimated_document_count()
+            try:
+                return dataset, self.run(InProcessTransport(), scenarios, options)
+            finally:
+                if not options['keep']:
+                    get_db().client.drop_database(database)
+
+    def run(self, transport, scenarios, options):
+        ids = sample_ids(transport) if 'retrieve' in scenarios else []
+        if 'retrieve' in scenarios and not ids:
+            raise CommandError('No transactions to retrieve')
+        results = {}
+        for scenario in scenarios:
+            self.stderr.write('Running %s' % scenario)
+            results[scenario] = run_scenario(
+                transport, scenario, options['requests'], options['concurrency'],
+                ids=ids, seed=options['seed']
+            )
+        return results
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from core.exports import COLUMNAR_BATCH_SIZE, COLUMNAR_FORMATS, ColumnarExporter, write_columnar
+from core.tenants import NoTenant, using_tenant
+from core.views import EXPORT_VIEWSETS
+
+class Command(BaseCommand):
+    help = 'Writes a collection to a Parquet, Arrow IPC or CSV file for analytics, a record batch at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('collection', choices=sorted(EXPORT_VIEWSETS))
+        parser.add_argument('path', help='Output file')
+        parser.add_argument('--format', choices=COLUMNAR_FORMATS,
+                            help='Output format (default: from the extension of path)')
+        parser.add_argument('--fields', help='Comma separated fields to export (default: all)')
+        parser.add_argument('--batch-size', type=int, default=COLUMNAR_BATCH_SIZE, help='Rows per record batch')
+        parser.add_argument('--tenant', help='The tenant whose data this is, when there are tenants')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        if file_format not in COLUMNAR_FORMATS:
+            raise CommandError('Give --format: one of %s' % ', '.join(COLUMNAR_FORMATS))
+        viewset = EXPORT_VIEWSETS[options['collection']]
+        fields = [name.strip() for name in options['fields'].split(',')] if options['fields'] else None
+        serializer = viewset.serializer_class(fields=fields)
+        if fields is not None and set(fields) - set(serializer.fields):
+            raise CommandError('Unknown fields: %s' % ', '.join(sorted(set(fields) - set(serializer.fields))))
+
+        started = time.perf_counter()
+        try:
+            with using_tenant(options['tenant']):
+                cursor = viewset.model.objects.order_by(*viewset.ordering).no_cache().as_pymongo() \
+                    .batch_size(viewset.export_batch_size)
+                rows = write_columnar(ColumnarExporter(serializer), cursor, options['path'], file_format,
+                                      options['batch_size'])
+        except (OSError, NoTenant) as exc:
+            raise CommandError(exc)
+        seconds = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {rows} rows to {options['path']} in {seconds:.1f} s ({rows / max(seconds, 1e-9):.0f} rows/s)"
+        ))
@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from core.imports import import_file, import_format
+from core.tenants import NoTenant, using_tenant
+from core.views import IMPORT_VIEWSETS
+
+class Command(BaseCommand):
+    help = 'Imports a CSV or XLSX file into transactions or assets in this process, skipping rows already stored'
+
+    def add_arguments(self, parser):
+        parser.add_argument('collection', choices=sorted(IMPORT_VIEWSETS))
+        parser.add_argument('path', help='.csv or .xlsx file whose first row names the columns')
+        parser.add_argument('--errors', action='store_true', help='Print the errors of invalid rows')
+        parser.add_argument('--tenant', help='The tenant whose data this is, when there are tenants')
+
+    def handle(self, *args, **options):
+        try:
+            file_format = import_format(options['path'])
+            with open(options['path'], 'rb') as stream, using_tenant(options['tenant']):
+                report = import_file(IMPORT_VIEWSETS[options['collection']], stream, file_format)
+        except (OSError, ValueError, NoTenant) as exc:
+            raise CommandError(exc)
+
+        if options['errors']:
+            for error in report['errors']:
+                self.stdout.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['rows']} rows: {report['created']} created, {report['duplicates']} duplicates, "
+            f"{report['invalid']} invalid in {report['seconds']} s ({report['rows_per_second']} rows/s)"
+        ))
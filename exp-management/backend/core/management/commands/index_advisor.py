@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand
+from core.diagnostics import advise
+from core.models import QueryShapeStat
+
+class Command(BaseCommand):
+    help = 'Suggests indexes for recorded slow query shapes and flags redundant or unused ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-count', type=int, default=1,
+                            help='Ignore shapes seen fewer times than this')
+        parser.add_argument('--max-ratio', type=float, default=10.0,
+                            help='Documents examined per result above which a shape needs an index')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+        parser.add_argument('--reset', action='store_true', help='Clear the recorded shapes afterwards')
+
+    def handle(self, *args, **options):
+        report = advise(min_count=options['min_count'], max_ratio=options['max_ratio'])
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, default=str))
+        else:
+            self.write_report(report)
+        if options['reset']:
+            # Keeps the unique index on shape the recorder's upserts rely on
+            QueryShapeStat._get_collection().delete_many({})
+            self.stdout.write('Cleared recorded query shapes')
+
+    def write_report(self, report):
+        for collection, findings in report.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(collection))
+            for suggestion in findings['suggestions']:
+                self.stdout.write(self.style.WARNING(
+                    f"  add index {suggestion['index']}: {suggestion['queries']} slow queries, "
+                    f"{suggestion['total_ms']:.0f} ms in total"
+                ))
+                for shape in suggestion['shapes']:
+                    self.stdout.write(
+                        f"    {shape['command']} filter={shape['filter']} sort={shape['sort']} "
+                        f"avg {shape['avg_ms']} ms, {shape['examined_per_result']} examined/result, "
+                        f"plan {shape['plan']}"
+                    )
+            for item in findings['redundant']:
+                self.stdout.write(f"  redundant index {item['index']}: prefix of {item['covered_by']}")
+            if findings['unused'] is None:
+                self.stdout.write('  index usage not available from this server')
+            for index in findings['unused'] or []:
+                self.stdout.write(f"  unused index {index}: no queries since the server started")
+            if not findings['suggestions'] and not findings['redundant'] and not findings['unused']:
+                self.stdout.write(self.style.SUCCESS('  no changes suggested'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.summaries import rebuild_rollups
+from core.tenants import tenant_ids, using_tenant
+
+class Command(BaseCommand):
+    help = 'Recomputes the transaction summary rollups from the transactions and their archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenant', action='append', dest='tenants',
+                            help='Only this tenant; repeat for more (default: every tenant)')
+
+    def handle(self, *args, **options):
+        try:
+            tenants = tenant_ids(options['tenants'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        for tenant in tenants:
+            with using_tenant(tenant):
+                count = rebuild_rollups()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} rollup buckets' + (f' of {tenant}' if tenant else '')))
@@ -1,5 +1,7 @@
 from django.core.management.base import BaseCommand
+from core.indexes import sync_indexes
 from core.models import Employee
+from core.views import EmployeeViewSet
 from datetime import datetime
 
 class Command(BaseCommand):
@@ -39,18 +41,24 @@ class Command(BaseCommand):
             {"name": "Lý Thị Nga", "email": "nga.ly@company.com", "position": "Product Manager", "department": "IT"}
         ]
 
-        # Delete existing employees
-        Employee.drop_collection()
+        # Delete existing employees; dropping the collection would lose its indexes,
+        # which auto_create_index is off for
+        collection = Employee._get_collection()
+        deleted = list(collection.find({}, {'_id': 1}))
+        collection.delete_many({'_id': {'$in': [document['_id'] for document in deleted]}})
+        if deleted:
+            Employee.tombstone([document['_id'] for document in deleted])
         self.stdout.write('Deleted existing employees')
 
-        # Create new employees
-        for data in employees_data:
-            employee = Employee(
-                name=data["name"],
-                email=data["email"],
-                position=data["position"],
-                department=data["department"]
-            )
-            employee.save()
+        # Create new employees in a single insert_many
+        created = [Employee(**data).to_mongo().to_dict() for data in employees_data]
+        collection.insert_many(created)
+        # A fresh database has none yet, and ?q= search needs the text index
+        sync_indexes(Employee)
+
+        # Same bookkeeping as a bulk write through the API: search index and cached lists
+        viewset = EmployeeViewSet()
+        viewset.perform_bulk_write(created=created, deleted=deleted)
+        viewset.invalidate_cache()
 
         self.stdout.write(self.style.SUCCESS(f'Successfully created {len(employees_data)} employees'))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.indexes import document_classes, sync_indexes
+from core.tenants import tenant_ids, using_tenant
+
+class Command(BaseCommand):
+    help = 'Builds indexes declared in model meta that the collections lack, online'
+
+    def add_arguments(self, parser):
+        parser.add_argument('collections', nargs='*', help='Only these collections (default: all)')
+        parser.add_argument('--drop-stale', action='store_true',
+                            help='Drop indexes that are no longer declared and rebuild changed ones')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+        parser.add_argument('--tenant', action='append', dest='tenants',
+                            help='Only this tenant; repeat for more (default: every tenant)')
+
+    def handle(self, *args, **options):
+        documents = document_classes()
+        names = options['collections'] or sorted(documents)
+        unknown = [name for name in names if name not in documents]
+        if unknown:
+            raise CommandError('Unknown collections: %s' % ', '.join(unknown))
+        try:
+            tenants = tenant_ids(options['tenants'])
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        for tenant in tenants:
+            with using_tenant(tenant):
+                for name in names:
+                    scoped = tenant is not None and documents[name]._meta.get('tenant_scoped')
+                    # Shared collections such as jobs are in the default database; sync them once
+                    if scoped or tenant == tenants[0]:
+                        self.sync(documents[name], f'{tenant}/{name}' if scoped else name, prefix, options)
+        self.stdout.write(self.style.SUCCESS(f'{prefix}Indexes in sync'))
+
+    def sync(self, document, name, prefix, options):
+        result = sync_indexes(document, drop_stale=options['drop_stale'], dry_run=options['dry_run'])
+        for index in result['created']:
+            self.stdout.write(self.style.SUCCESS(f'{prefix}{name}: built {index}'))
+        for index in result['dropped']:
+            self.stdout.write(self.style.WARNING(f'{prefix}{name}: dropped {index}'))
+        if not options['drop_stale']:
+            for index in result['changed']:
+                self.stdout.write(self.style.WARNING(
+                    f'{name}: {index} differs from its declaration; rerun with --drop-stale to rebuild it'
+                ))
+            for index in result['stale']:
+                self.stdout.write(f'{name}: {index} is not declared; --drop-stale removes it')
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.cache import get_response_cache
+from core.models import Transaction
+from core.tenants import tenant_ids, using_tenant
+from core.timeseries import LEGACY_SUFFIX, MIGRATE_BATCH_SIZE, enabled, migrate
+
+class Command(BaseCommand):
+    help = 'Moves transactions into a MongoDB 7.0+ time-series collection; safe to rerun'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=MIGRATE_BATCH_SIZE, help='Documents copied per batch')
+        parser.add_argument('--drop-legacy', action='store_true',
+                            help='Drop the old collection once every transaction is copied')
+        parser.add_argument('--tenant', action='append', dest='tenants',
+                            help='Only this tenant; repeat for more (default: every tenant)')
+
+    def handle(self, *args, **options):
+        if not enabled():
+            raise CommandError('Set TRANSACTIONS_TIMESERIES=True first; the API must read the new collection')
+        try:
+            tenants = tenant_ids(options['tenants'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        for tenant in tenants:
+            with using_tenant(tenant):
+                self.migrate(f'{tenant}/transactions' if tenant else 'transactions', options)
+
+    def migrate(self, name, options):
+        copied = migrate(batch_size=options['batch_size'],
+                         progress=lambda count: self.stdout.write(f'{name}: copied {count}'))
+        get_response_cache().invalidate('transactions')
+        self.stdout.write(self.style.SUCCESS(f'{name}: {copied} copied into the time-series collection'))
+
+        hot = Transaction._get_collection()
+        legacy = hot.database[hot.name + LEGACY_SUFFIX]
+        if options['drop_legacy'] and legacy.name in hot.database.list_collection_names():
+            legacy.drop()
+            self.stdout.write(self.style.WARNING(f'{name}: dropped {legacy.name}'))
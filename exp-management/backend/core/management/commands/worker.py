@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.jobs import JOB_TYPES, Worker, run_pool
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (core/jobs.py) in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=getattr(settings, 'JOB_WORKER_PROCESSES', 2),
+                            help='Worker processes (default JOB_WORKER_PROCESSES)')
+        parser.add_argument('--types', help='Comma separated job types to run (default: all of %s)'
+                            % ', '.join(sorted(JOB_TYPES)))
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds between looks at an empty queue')
+        parser.add_argument('--burst', action='store_true',
+                            help='Run ready jobs in this process and exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        types = [name.strip() for name in options['types'].split(',') if name.strip()] if options['types'] else None
+        unknown = set(types or ()) - set(JOB_TYPES)
+        if unknown:
+            raise CommandError('Unknown job types: %s' % ', '.join(sorted(unknown)))
+        if options['processes'] < 1:
+            raise CommandError('--processes must be at least 1')
+
+        if options['burst']:
+            Worker(types, options['poll']).run(burst=True)
+            self.stdout.write(self.style.SUCCESS('No jobs left to run'))
+            return
+        self.stdout.write(f"Running jobs in {options['processes']} processes; Ctrl-C lets running jobs finish")
+        run_pool(options['processes'], types, options['poll'])
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
@@ -0,0 +1,240 @@
+import bisect
+import hmac
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404, HttpResponse
+from pymongo import monitoring
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_current = ContextVar('request_stats', default=None)
+
+
+def enabled():
+    return getattr(settings, 'PERFORMANCE_METRICS', False)
+
+
+class RequestStats:
+    """MongoDB commands and named timings collected while serving one request"""
+    __slots__ = ('mongo_commands', 'mongo_time', 'timings')
+
+    def __init__(self):
+        self.mongo_commands = 0
+        self.mongo_time = 0.0
+        self.timings = {}
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+
+def current_stats():
+    return _current.get()
+
+
+class timed:
+    """Context manager adding the block's duration to the request's ``name`` timing.
+
+    A plain class rather than @contextmanager: it wraps every serialization,
+    so it has to stay cheap, and it does nothing outside a timed request.
+    """
+    __slots__ = ('name', 'stats', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.stats = _current.get()
+        if self.stats is not None:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.stats is not None:
+            self.stats.add(self.name, time.perf_counter() - self.start)
+
+
+def record_mongo(seconds, commands=1):
+    stats = _current.get()
+    if stats is not None:
+        stats.mongo_commands += commands
+        stats.mongo_time += seconds
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Counts commands and their server round-trip time against the current request.
+
+    pymongo publishes events on the thread that ran the command, so the
+    request's context is visible here; commands outside a request are ignored.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        record_mongo(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        record_mongo(event.duration_micros / 1e6)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus text exposition format"""
+
+    def __init__(self, name, documentation, buckets, labelnames=('viewset', 'action')):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def expose(self):
+        with self._lock:
+            series = sorted((labels, [list(counts), total, count])
+                            for labels, (counts, total, count) in self._series.items())
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s histogram' % self.name]
+        for labels, (counts, total, count) in series:
+            label_text = ','.join('%s="%s"' % (name, _escape(value)) for name, value in zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append('%s_bucket{%s,le="%s"} %d' % (self.name, label_text, _format_bound(bound), cumulative))
+            lines.append('%s_sum{%s} %r' % (self.name, label_text, total))
+            lines.append('%s_count{%s} %d' % (self.name, label_text, count))
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+REQUEST_SECONDS = Histogram('api_request_duration_seconds', 'Total time spent handling a request.', DURATION_BUCKETS)
+MONGO_SECONDS = Histogram('api_request_mongo_seconds', 'Time spent in MongoDB commands per request.', DURATION_BUCKETS)
+MONGO_COMMANDS = Histogram('api_request_mongo_commands', 'MongoDB commands run per request.', COUNT_BUCKETS)
+SERIALIZE_SECONDS = Histogram('api_request_serialize_seconds', 'Time spent serializing per request.', DURATION_BUCKETS)
+AUTH_SECONDS = Histogram('api_request_auth_seconds', 'Time spent authenticating per request.', DURATION_BUCKETS)
+HISTOGRAMS = (REQUEST_SECONDS, MONGO_SECONDS, MONGO_COMMANDS, SERIALIZE_SECONDS, AUTH_SECONDS)
+
+
+def expose():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.expose())
+    return '\n'.join(lines) + '\n'
+
+
+def view_labels(view_func, method):
+    """(viewset, action) labels for a resolved view; plain views use the HTTP method"""
+    cls = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    viewset = cls.__name__ if cls is not None else getattr(view_func, '__name__', 'view')
+    actions = getattr(view_func, 'actions', None) or {}
+    return viewset, actions.get(method.lower(), method.lower())
+
+
+def server_timing(stats, total):
+    metrics = ['db;dur=%.3f;desc="%d commands"' % (stats.mongo_time * 1000, stats.mongo_commands)]
+    metrics.extend('%s;dur=%.3f' % (name, seconds * 1000) for name, seconds in sorted(stats.timings.items()))
+    metrics.append('total;dur=%.3f' % (total * 1000))
+    return ', '.join(metrics)
+
+
+class PerformanceMetricsMiddleware:
+    """Times every request and reports MongoDB, serializer and auth time.
+
+    The breakdown goes out as a Server-Timing header and into per viewset and
+    action histograms served at /metrics. Histograms are per process; scrape
+    each worker or run one worker per container. Streaming bodies are timed
+    up to the first byte. Removed from the stack unless PERFORMANCE_METRICS.
+    Async capable, so ASGI requests are not adapted to a thread for it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, stats, time.perf_counter() - start)
+
+    def report(self, request, response, stats, total):
+        # Read off the resolved URL rather than in process_view, which Django
+        # would run through sync_to_async on every ASGI request
+        match = getattr(request, 'resolver_match', None)
+        labels = view_labels(match.func, request.method) if match else ('unmatched', request.method.lower())
+        REQUEST_SECONDS.observe(labels, total)
+        MONGO_SECONDS.observe(labels, stats.mongo_time)
+        MONGO_COMMANDS.observe(labels, stats.mongo_commands)
+        if 'serialize' in stats.timings:
+            SERIALIZE_SECONDS.observe(labels, stats.timings['serialize'])
+        if 'auth' in stats.timings:
+            AUTH_SECONDS.observe(labels, stats.timings['auth'])
+        response['Server-Timing'] = server_timing(stats, total)
+        return response
+
+
+def scrape_allowed(request):
+    """Whether ``request`` carries the METRICS_TOKEN bearer token or a staff session"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    scheme, _, given = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and hmac.compare_digest(given.encode(), token.encode()):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_active and user.is_staff)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; latencies and routes are not for everyone, see scrape_allowed"""
+    if not enabled():
+        raise Http404
+    if not scrape_allowed(request):
+        response = HttpResponse('Send the METRICS_TOKEN as a bearer token', status=401, content_type='text/plain')
+        response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+        return response
+    return HttpResponse(expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
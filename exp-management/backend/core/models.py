@@ -1,7 +1,61 @@
 from mongoengine import Document, fields
+from mongoengine.connection import get_db
 from datetime import datetime
+from .tenants import current_alias
 
-class Employee(Document):
+class TenantDocument(Document):
+    """Document kept in the database of the current tenant (core/tenants.py).
+    
+    The collection is looked up on every use instead of being cached on the
+    class as switch_db does, so threads serving different tenants at once
+    never see each other's.
+    """
+    meta = {'abstract': True, 'tenant_scoped': True}
+    
+    @classmethod
+    def _get_db(cls):
+        return get_db(current_alias())
+    
+    @classmethod
+    def _get_collection(cls):
+        return cls._get_db()[cls._get_collection_name()]
+
+class TrackedDocument(TenantDocument):
+    """Document stamped with updated_at on every save and tombstoned on delete.
+    
+    Together they let /changes/ hand out what changed since a client's last poll.
+    version counts writes; the API hands it out as the ETag that If-Match checks.
+    """
+    updated_at = fields.DateTimeField(default=datetime.utcnow)
+    version = fields.IntField(default=0)
+    
+    meta = {'abstract': True}
+    
+    def save(self, *args, **kwargs):
+        self.updated_at = datetime.utcnow()
+        if not self._created:
+            self.version = (self.version or 0) + 1
+        return super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        super().delete(*args, **kwargs)
+        self.tombstone([self.pk])
+    
+    @classmethod
+    def derived_changes(cls, changes):
+        """Fields kept in step with the raw ``changes`` of a write that bypasses save()"""
+        return {}
+    
+    @classmethod
+    def tombstone(cls, ids):
+        """Record deletions that bypassed delete(), e.g. a delete_many"""
+        now = datetime.utcnow()
+        Tombstone._get_collection().insert_many([
+            {'collection': cls._meta['collection'], 'document_id': document_id, 'deleted_at': now}
+            for document_id in ids
+        ])
+
+class Employee(TrackedDocument):
     name = fields.StringField(max_length=100, required=True)
     email = fields.EmailField(required=True)
     position = fields.StringField(max_length=100, required=True)
@@ -10,13 +64,19 @@ class Employee(Document):
     
     meta = {
         'collection': 'employees',
-        'indexes': ['email', 'department']
+        'indexes': [
+            'email',
+            'department',
+            {'fields': ['$name', '$email'], 'default_language': 'none', 'weights': {'name': 2}},
+            ('updated_at', 'id'),
+        ],
+        'auto_create_index': False
     }
     
     def __str__(self):
         return f"{self.name} - {self.position}"
 
-class Transaction(Document):
+class Transaction(TrackedDocument):
     TYPE_CHOICES = [
         ('income', 'Income'),
         ('expense', 'Expense'),
@@ -28,16 +88,34 @@ class Transaction(Document):
     type = fields.StringField(max_length=10, choices=TYPE_CHOICES, required=True)
     category = fields.StringField(max_length=100, required=True)
     created_at = fields.DateTimeField(default=datetime.utcnow)
+    # type and category again, as the metaField of a time-series collection (core/timeseries.py)
+    series = fields.DictField(db_field='meta')
     
     meta = {
         'collection': 'transactions',
-        'indexes': ['date', 'type', 'category']
+        # Filter by type or category, newest first; the date index serves date ranges
+        'indexes': [
+            ('-date', '-id'),
+            ('type', '-date', '-id'),
+            ('category', '-date', '-id'),
+            ('updated_at', 'id'),
+        ],
+        'auto_create_index': False
     }
     
     def __str__(self):
         return f"{self.description} - {self.amount}"
+    
+    def clean(self):
+        self.series = {'type': self.type, 'category': self.category}
+    
+    @classmethod
+    def derived_changes(cls, changes):
+        if 'type' in changes and 'category' in changes:
+            return {'meta': {'type': changes['type'], 'category': changes['category']}}
+        return {'meta.' + name: changes[name] for name in ('type', 'category') if name in changes}
 
-class Project(Document):
+class Project(TrackedDocument):
     STATUS_CHOICES = [
         ('planning', 'Planning'),
         ('active', 'Active'),
@@ -56,13 +134,23 @@ class Project(Document):
     
     meta = {
         'collection': 'projects',
-        'indexes': ['status', 'client', 'start_date']
+        'indexes': [
+            ('status', 'start_date'),
+            'client',
+            'start_date',
+            # Active projects of a client by start date, holding active projects only
+            {'fields': ['client', 'start_date'], 'partialFilterExpression': {'status': 'active'}},
+            {'fields': ['$name', '$client', '$description'], 'default_language': 'none',
+             'weights': {'name': 3, 'client': 2}},
+            ('updated_at', 'id'),
+        ],
+        'auto_create_index': False
     }
     
     def __str__(self):
         return f"{self.name} - {self.client}"
 
-class Customer(Document):
+class Customer(TrackedDocument):
     STATUS_CHOICES = [
         ('lead', 'Lead'),
         ('prospect', 'Prospect'),
@@ -79,13 +167,21 @@ class Customer(Document):
     
     meta = {
         'collection': 'customers',
-        'indexes': ['email', 'status', 'company']
+        'indexes': [
+            'email',
+            'status',
+            'company',
+            {'fields': ['$name', '$email', '$company'], 'default_language': 'none',
+             'weights': {'name': 3, 'email': 2}},
+            ('updated_at', 'id'),
+        ],
+        'auto_create_index': False
     }
     
     def __str__(self):
         return f"{self.name} - {self.company}"
 
-class Asset(Document):
+class Asset(TrackedDocument):
     CATEGORY_CHOICES = [
         ('equipment', 'Equipment'),
         ('furniture', 'Furniture'),
@@ -110,8 +206,149 @@ class Asset(Document):
     
     meta = {
         'collection': 'assets',
-        'indexes': ['category', 'status', 'location']
+        'indexes': [
+            'category',
+            'status',
+            'location',
+            # Finds stored rows by natural key during imports
+            ('name', 'category', 'location'),
+            {'fields': ['$name', '$description'], 'default_language': 'none', 'weights': {'name': 2}},
+            ('updated_at', 'id'),
+        ],
+        'auto_create_index': False
     }
     
     def __str__(self):
         return f"{self.name} - {self.category}"
+
+class TransactionRollup(TenantDocument):
+    """Running totals of transactions per day/month bucket, type and category"""
+    PERIOD_CHOICES = [
+        ('day', 'Day'),
+        ('month', 'Month'),
+    ]
+    
+    period = fields.StringField(max_length=10, choices=PERIOD_CHOICES, required=True)
+    bucket = fields.StringField(max_length=10, required=True)  # '2024-05-17' or '2024-05', UTC
+    type = fields.StringField(max_length=10, required=True)
+    category = fields.StringField(max_length=100, required=True)
+    total_cents = fields.LongField(default=0)
+    count = fields.IntField(default=0)
+    
+    meta = {
+        'collection': 'transaction_rollups',
+        'indexes': [
+            {'fields': ['period', 'bucket', 'type', 'category'], 'unique': True},
+        ],
+        'auto_create_index': False
+    }
+    
+    def __str__(self):
+        return f"{self.period} {self.bucket} {self.type}/{self.category} - {self.total_cents}"
+
+class Tombstone(TenantDocument):
+    """Deleted document of a tracked collection, kept for clients catching up on changes"""
+    RETENTION_DAYS = 30
+    
+    collection = fields.StringField(max_length=100, required=True)
+    document_id = fields.ObjectIdField(required=True)
+    deleted_at = fields.DateTimeField(required=True)
+    
+    meta = {
+        'collection': 'tombstones',
+        'indexes': [
+            ('collection', 'deleted_at', 'id'),
+            {'fields': ['deleted_at'], 'expireAfterSeconds': RETENTION_DAYS * 24 * 3600},
+        ],
+        'auto_create_index': False
+    }
+    
+    def __str__(self):
+        return f"{self.collection} {self.document_id} - {self.deleted_at}"
+
+class QueryShapeStat(Document):
+    """Slow query shape seen by core.diagnostics, with totals from its explain() samples"""
+    shape = fields.StringField(max_length=40, required=True, unique=True)  # sha1 of the fields below
+    database = fields.StringField(max_length=100)
+    collection = fields.StringField(max_length=100, required=True)
+    command = fields.StringField(max_length=20, required=True)
+    filter = fields.ListField(fields.ListField(fields.StringField()))  # [[db field, eq|in|range|other], ...]
+    sort = fields.ListField(fields.ListField())  # [[db field, 1 or -1], ...]
+    count = fields.IntField(default=0)
+    total_ms = fields.FloatField(default=0)
+    max_ms = fields.FloatField(default=0)
+    explains = fields.IntField(default=0)
+    docs_examined = fields.LongField(default=0)
+    keys_examined = fields.LongField(default=0)
+    returned = fields.LongField(default=0)
+    plan = fields.StringField()  # winning plan of the last explain, e.g. 'COLLSCAN'
+    last_seen = fields.DateTimeField()
+    
+    meta = {
+        'collection': 'query_shapes',
+        'indexes': ['collection'],
+        'auto_create_index': False
+    }
+    
+    def __str__(self):
+        return f"{self.collection} {self.command} {self.filter} - {self.count}"
+
+class RevokedToken(Document):
+    """JWT revoked before it expires (logout, refresh rotation); kept until it would have expired"""
+    jti = fields.StringField(max_length=64, required=True, unique=True)
+    revoked_at = fields.DateTimeField(required=True)
+    expires_at = fields.DateTimeField(required=True)
+    
+    meta = {
+        'collection': 'revoked_tokens',
+        'indexes': [
+            'revoked_at',
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0},
+        ],
+        'auto_create_index': False
+    }
+    
+    def __str__(self):
+        return f"{self.jti} - {self.expires_at}"
+
+class Job(Document):
+    """Background work queued through core.jobs and run by manage.py worker"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+    RETENTION_DAYS = 7
+    
+    type = fields.StringField(max_length=50, required=True)
+    params = fields.DictField()
+    status = fields.StringField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = fields.IntField(default=0)
+    max_attempts = fields.IntField(default=3)
+    run_at = fields.DateTimeField(default=datetime.utcnow)  # not before; pushed back between retries
+    progress = fields.DictField()  # {'done': 40, 'total': 100, 'message': '...'}
+    result = fields.DictField()
+    error = fields.StringField()
+    cancel_requested = fields.BooleanField(default=False)
+    worker = fields.StringField(max_length=100)
+    lease_expires_at = fields.DateTimeField()  # a running job whose lease ran out is retried
+    created_by = fields.StringField(max_length=150)
+    tenant = fields.StringField(max_length=100)  # whose data the job works on; jobs themselves are shared
+    created_at = fields.DateTimeField(default=datetime.utcnow)
+    started_at = fields.DateTimeField()
+    finished_at = fields.DateTimeField()
+    
+    meta = {
+        'collection': 'jobs',
+        'indexes': [
+            ('status', 'run_at'),
+            ('type', 'status', 'started_at'),
+            {'fields': ['finished_at'], 'expireAfterSeconds': RETENTION_DAYS * 24 * 3600},
+        ],
+        'auto_create_index': False
+    }
+    
+    def __str__(self):
+        return f"{self.type} {self.status} - {self.id}"
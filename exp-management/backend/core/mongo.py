@@ -0,0 +1,185 @@
+import asyncio
+import os
+import weakref
+from contextlib import contextmanager
+
+import mongoengine
+from mongoengine.connection import DEFAULT_CONNECTION_NAME, _connection_settings, _connections
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:  # the async read path then falls back to the sync views
+    AsyncIOMotorClient = None
+
+def _read_preference(name):
+    return make_read_preference(read_pref_mode_from_name(name), None)
+
+
+# MongoClient keyword -> (environment variable, parser)
+POOL_OPTIONS = {
+    'maxPoolSize': ('MONGO_MAX_POOL_SIZE', int),
+    'minPoolSize': ('MONGO_MIN_POOL_SIZE', int),
+    'maxConnecting': ('MONGO_MAX_CONNECTING', int),
+    'maxIdleTimeMS': ('MONGO_MAX_IDLE_TIME_MS', int),
+    'waitQueueTimeoutMS': ('MONGO_WAIT_QUEUE_TIMEOUT_MS', int),
+    'connectTimeoutMS': ('MONGO_CONNECT_TIMEOUT_MS', int),
+    'socketTimeoutMS': ('MONGO_SOCKET_TIMEOUT_MS', int),
+    'serverSelectionTimeoutMS': ('MONGO_SERVER_SELECTION_TIMEOUT_MS', int),
+    'read_preference': ('MONGO_READ_PREFERENCE', _read_preference),
+    'w': ('MONGO_WRITE_CONCERN', lambda value: int(value) if value.isdigit() else value),
+    'journal': ('MONGO_JOURNAL', lambda value: value.lower() == 'true'),
+    'retryWrites': ('MONGO_RETRY_WRITES', lambda value: value.lower() == 'true'),
+    'appname': ('MONGO_APP_NAME', str),
+}
+
+# Read preference for read-only viewset actions, e.g. secondaryPreferred
+READ_ACTIONS_PREFERENCE_ENV = 'MONGO_READ_ACTIONS_PREFERENCE'
+
+_registered = {}
+
+# Motor clients are bound to the event loop they were first used on
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def client_options(environ=None):
+    """MongoClient pool, timeout and concern options set in the environment"""
+    environ = os.environ if environ is None else environ
+    options = {}
+    for option, (variable, parse) in POOL_OPTIONS.items():
+        value = environ.get(variable)
+        if value not in (None, ''):
+            options[option] = parse(value)
+    return options
+
+
+def configure(alias=DEFAULT_CONNECTION_NAME, environ=None, **settings):
+    """Register a MongoEngine connection without opening a client.
+
+    ``settings`` are the usual mongoengine.connect() arguments; pool options
+    from the environment are layered on top. The MongoClient is created by
+    the first query, which under gunicorn happens in the worker after fork.
+    """
+    options = dict(settings)
+    options.update(client_options(environ))
+    options.setdefault('connect', False)
+    _registered[alias] = options
+    mongoengine.register_connection(alias, **options)
+    return options
+
+
+def reset_connections():
+    """Drop clients inherited across fork and re-register their settings.
+
+    Called from gunicorn's post_fork hook as a safeguard in case something
+    queried MongoDB in the master before forking. Clients are opened again
+    lazily by the first query in the worker.
+    """
+    for alias, options in list(_registered.items()):
+        mongoengine.disconnect(alias)
+        mongoengine.register_connection(alias, **options)
+    _async_clients.clear()
+
+
+def _reregister(alias, settings):
+    settings = dict(settings)
+    name = settings.pop('name')
+    mongoengine.disconnect(alias)
+    mongoengine.register_connection(alias, **settings)
+    # Set after registering, as a database in a host URI would win over name
+    _connection_settings[alias]['name'] = name
+    _async_clients.clear()
+
+
+@contextmanager
+def use_database(name, alias=DEFAULT_CONNECTION_NAME, mongo_client_class=None):
+    """Point ``alias`` at another database for the duration of the block.
+
+    Keeps synthetic data, e.g. the bench command's, out of the real database.
+    ``mongo_client_class`` swaps the client too, such as mongomock.MongoClient.
+    """
+    original = dict(_connection_settings[alias])
+    settings = dict(original, name=name)
+    if mongo_client_class is not None:
+        settings['mongo_client_class'] = mongo_client_class
+    _reregister(alias, settings)
+    try:
+        yield
+    finally:
+        _reregister(alias, original)
+
+
+def read_actions_preference(environ=None):
+    """Read preference for read-only API actions, or None to use the client's"""
+    environ = os.environ if environ is None else environ
+    name = environ.get(READ_ACTIONS_PREFERENCE_ENV)
+    if not name:
+        return None
+    return _read_preference(name)
+
+
+def command_alias(database, address):
+    """Alias of the connection a monitored command on ``database`` ran through.
+
+    ``address`` is the (host, port) of the event's connection_id. Aliases of
+    ``database`` whose client is connected to that server win; otherwise the
+    first alias of the database, then the default one.
+    """
+    aliases = [alias for alias, settings in _connection_settings.items() if settings.get('name') == database]
+    for alias in aliases:
+        # A frozenset of (host, port) on pymongo clients; mongomock has no such set
+        nodes = getattr(_connections.get(alias), 'nodes', None)
+        if isinstance(nodes, frozenset) and address in nodes:
+            return alias
+    return aliases[0] if aliases else DEFAULT_CONNECTION_NAME
+
+
+def async_available(alias=DEFAULT_CONNECTION_NAME):
+    """True when Motor is installed and ``alias`` points at a real server"""
+    settings = _connection_settings.get(alias)
+    return (AsyncIOMotorClient is not None and settings is not None
+            and 'mongo_client_class' not in settings)
+
+
+def _async_client_options(settings):
+    # Same clean-up mongoengine applies before creating its MongoClient
+    renamed = {'authentication_source': 'authSource', 'authentication_mechanism': 'authMechanism'}
+    return {
+        renamed.get(key, key): value for key, value in settings.items()
+        if key not in ('name', 'connect') and value is not None
+    }
+
+
+def get_async_db(alias=DEFAULT_CONNECTION_NAME):
+    """Motor database for a registered alias, one client per event loop"""
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    if alias not in clients:
+        settings = _connection_settings[alias]
+        client = AsyncIOMotorClient(**_async_client_options(settings))
+        clients[alias] = client[settings['name']]
+    return clients[alias]
+
+
+async def find_async(queryset, alias=None):
+    """Run a MongoEngine queryset's find on Motor and return the raw documents.
+
+    Filter, projection, read preference, ordering and limit are taken from the
+    queryset, so it can be built by the same code as the sync path. ``alias``
+    defaults to the one the document reads through for the current tenant.
+    """
+    document = queryset._document
+    if alias is None:
+        # Imported here, as core.tenants registers its connections through this module
+        from .tenants import db_alias
+        alias = db_alias(document)
+    collection = get_async_db(alias)[document._get_collection_name()]
+    if queryset._read_preference is not None:
+        collection = collection.with_options(read_preference=queryset._read_preference)
+    cursor = collection.find(queryset._query, **queryset._cursor_args)
+    if queryset._ordering:
+        cursor = cursor.sort(queryset._ordering)
+    elif queryset._ordering is None and document._meta['ordering']:
+        cursor = cursor.sort(queryset._get_order_by(document._meta['ordering']))
+    if queryset._limit is not None:
+        cursor = cursor.limit(queryset._limit)
+    return await cursor.to_list(length=None)
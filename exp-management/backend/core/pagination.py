@@ -0,0 +1,245 @@
+import heapq
+import operator
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from functools import cmp_to_key, reduce
+
+from bson import json_util
+from mongoengine.queryset.visitor import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .filters import TEXT_SCORE
+
+
+def row_order_key(ordering):
+    """Sort key for raw documents in ``ordering``, e.g. ('-date', '-id'); nulls sort first, as in MongoDB"""
+    keys = [('_text_score', True) if key == TEXT_SCORE else
+            ('_id' if key.lstrip('-') == 'id' else key.lstrip('-'), key.startswith('-')) for key in ordering]
+
+    def compare(row, other):
+        for field, descending in keys:
+            value, other_value = row.get(field), other.get(field)
+            if value == other_value:
+                continue
+            before = other_value is not None and (value is None or value < other_value)
+            return (1 if before else -1) if descending else (-1 if before else 1)
+        return 0
+    return cmp_to_key(compare)
+
+
+def merge_ordered(ordering, *parts):
+    """Merge raw document iterables, each sorted by ``ordering``, into one sorted stream.
+
+    A document in more than one part keeps its row from the earliest. Its
+    copies must sort together, as they do when ``ordering`` ends with id
+    and they have the same values.
+    """
+    previous = None
+    # heapq.merge finishes the last part with ``yield from``, which would
+    # restart a no_cache() queryset; generators carry on where they were
+    parts = [(row for row in part) for part in parts]
+    for row in heapq.merge(*parts, key=row_order_key(ordering)):
+        if previous is None or row['_id'] != previous:
+            previous = row['_id']
+            yield row
+
+
+class MongoCursorPagination(BasePagination):
+    """Keyset pagination for MongoEngine querysets.
+
+    Each page is fetched with a range query on the ordering fields, which
+    always end with ``id`` so positions are unique. The cost of a page does
+    not depend on how deep into the collection it is.
+
+    Text scores cannot be range-queried, so pages ranked by relevance
+    (``$text_score`` first) go by offset instead, each read from the best
+    match. MongoDB sorts every match of the search for any page anyway.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = api_settings.PAGE_SIZE or 20
+    max_page_size = 100
+    ordering = ('-id',)
+    offset = 0
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_rows(list(self.prepare_queryset(queryset, request, view)))
+
+    def prepare_queryset(self, queryset, request, view=None):
+        """Order, seek and limit ``queryset`` to one page without running it.
+
+        The async read path runs the returned queryset's query on its own
+        client, then hands the rows to ``paginate_rows``.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(view)
+        self.cursor = self.decode_cursor(request)
+        if self.ranked:
+            self.offset = self.cursor['p'][0] if self.cursor is not None else 0
+            return queryset.order_by(*self.ordering).limit(self.offset + self.page_size + 1)
+
+        reverse = self.cursor is not None and self.cursor['r']
+        queryset = queryset.order_by(*self._directed_ordering(reverse))
+        if self.cursor is not None:
+            queryset = queryset.filter(self._seek(self.cursor['p'], reverse))
+
+        # Fetch one extra row to learn whether another page follows.
+        return queryset.limit(self.page_size + 1)
+
+    def paginate_rows(self, rows):
+        """Trim the rows fetched for ``prepare_queryset`` to the page"""
+        if self.ranked:
+            rows = rows[self.offset:]
+            self.has_next, self.has_previous = len(rows) > self.page_size, self.offset > 0
+            self.page = rows[:self.page_size]
+            return self.page
+        reverse = self.cursor is not None and self.cursor['r']
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next = self.cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        self.page = rows
+        return rows
+
+    def merge_rows(self, *fetched):
+        """Rows the ``prepare_queryset`` query fetched from several collections, as one fetch.
+
+        A document found in more than one keeps its row from the earliest.
+        """
+        seen, rows = set(), []
+        for part in fetched:
+            for row in part:
+                if row['_id'] not in seen:
+                    seen.add(row['_id'])
+                    rows.append(row)
+        reverse = self.cursor is not None and self.cursor['r']
+        rows.sort(key=row_order_key(self._directed_ordering(reverse)))
+        return rows[:self.offset + self.page_size + 1]
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, view):
+        ordering = list(getattr(view, 'get_ordering', lambda: self.ordering)())
+        if not ordering or ordering[-1].lstrip('-') != 'id':
+            # Break ties on the primary key in the direction of the last key,
+            # newest first among equally relevant matches
+            descending = bool(ordering) and (ordering[-1].startswith('-') or ordering[-1] == TEXT_SCORE)
+            ordering.append('-id' if descending else 'id')
+        return tuple(ordering)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.ranked:
+            return self.encode_cursor([self.offset + self.page_size], reverse=False)
+        if self.page:
+            position = self._get_position(self.page[-1])
+        else:
+            position = self.cursor['p']
+        return self.encode_cursor(position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.ranked:
+            return self.encode_cursor([max(self.offset - self.page_size, 0)], reverse=False)
+        if self.page:
+            position = self._get_position(self.page[0])
+        else:
+            position = self.cursor['p']
+        return self.encode_cursor(position, reverse=True)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json_util.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            position, reverse = cursor['p'], bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if self.ranked:
+            # An offset into the ranked matches
+            if not isinstance(position, list) or len(position) != 1 or not isinstance(position[0], int) \
+                    or position[0] < 0:
+                raise NotFound(self.invalid_cursor_message)
+            return {'p': position, 'r': False}
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return {'p': position, 'r': reverse}
+
+    def encode_cursor(self, position, reverse):
+        payload = {'p': position}
+        if reverse:
+            payload['r'] = 1
+        encoded = urlsafe_b64encode(json_util.dumps(payload).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    @property
+    def ranked(self):
+        return self.ordering[0] == TEXT_SCORE
+
+    def _directed_ordering(self, reverse):
+        if not reverse:
+            return self.ordering
+        return tuple(key[1:] if key.startswith('-') else '-' + key for key in self.ordering)
+
+    def _seek(self, position, reverse):
+        """Build ``(k1 > v1) OR (k1 == v1 AND k2 > v2) OR ...`` for the page start."""
+        clauses = []
+        for index, key in enumerate(self.ordering):
+            after = self._after(key.lstrip('-'), position[index], key.startswith('-') != reverse)
+            if after is None:
+                continue
+            equal = {
+                previous.lstrip('-'): value
+                for previous, value in zip(self.ordering[:index], position)
+            }
+            clauses.append(Q(**equal) & after if equal else after)
+        if not clauses:
+            return Q(id=None)
+        return reduce(operator.or_, clauses)
+
+    def _after(self, field, value, descending):
+        """Match values sorting after ``value``; MongoDB sorts nulls first."""
+        if value is None:
+            return None if descending else Q(**{'%s__ne' % field: None})
+        if descending and field == 'id':
+            return Q(id__lt=value)
+        if descending:
+            return Q(**{'%s__lt' % field: value}) | Q(**{field: None})
+        return Q(**{'%s__gt' % field: value})
+
+    def _get_position(self, row):
+        if isinstance(row, dict):
+            # Raw pymongo documents from as_pymongo()
+            return [row.get('_id' if key.lstrip('-') == 'id' else key.lstrip('-')) for key in self.ordering]
+        return [getattr(row, key.lstrip('-')) for key in self.ordering]
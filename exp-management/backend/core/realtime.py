@@ -0,0 +1,309 @@
+import asyncio
+import json
+import logging
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from mongoengine.connection import DEFAULT_CONNECTION_NAME
+from pymongo.errors import PyMongoError
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+
+from .changes import changes_since, decode_token
+from .models import Asset, Customer, Employee, Project, Transaction
+from .mongo import async_available, get_async_db
+from .serializers import AssetSerializer, CustomerSerializer, EmployeeSerializer, ProjectSerializer, TransactionSerializer
+from .tenants import activate, current_alias, current_tenant, get_registry
+from . import timeseries
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = ('insert', 'update', 'delete')
+SERIALIZERS = {
+    serializer.Meta.model._meta['collection']: serializer
+    for serializer in (EmployeeSerializer, TransactionSerializer, ProjectSerializer, CustomerSerializer, AssetSerializer)
+}
+WATCHED = tuple(SERIALIZERS)
+HEARTBEAT_SECONDS = 15
+RESYNC = b'event: resync\ndata: {}\n\n'
+
+
+def format_event(event):
+    """SSE frame for a change event; the document is serialized like the API's"""
+    data = {'collection': event['collection'], 'operation': event['operation'], 'id': str(event['id'])}
+    if event['operation'] != 'delete' and event.get('document') is not None:
+        data['document'] = SERIALIZERS[event['collection']]().serialize_raw(event['document'])
+    return ('event: change\ndata: %s\n\n' % json.dumps(data, cls=encoders.JSONEncoder)).encode('utf-8')
+
+
+class MemorySource:
+    """Events put in by hand, for tests and local experiments"""
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.started = 0
+
+    def put(self, collection, operation, document_id, document=None):
+        self.queue.put_nowait({'collection': collection, 'operation': operation, 'id': document_id,
+                               'document': document})
+
+    async def events(self):
+        self.started += 1
+        while True:
+            yield await self.queue.get()
+
+
+class ChangeStreamSource:
+    """Events from one change stream over the watched collections; needs a replica set.
+
+    The resume token survives a lost connection, so the hub can reopen the
+    stream where it stopped.
+    """
+    operation_types = {'insert': 'insert', 'update': 'update', 'replace': 'update', 'delete': 'delete'}
+
+    def __init__(self, alias=DEFAULT_CONNECTION_NAME):
+        self.alias = alias
+        self.resume_token = None
+
+    async def events(self):
+        pipeline = [{'$match': {
+            'ns.coll': {'$in': list(WATCHED)},
+            'operationType': {'$in': list(self.operation_types)},
+        }}]
+        database = get_async_db(self.alias)
+        async with database.watch(pipeline, full_document='updateLookup', resume_after=self.resume_token) as stream:
+            async for change in stream:
+                self.resume_token = stream.resume_token
+                yield {
+                    'collection': change['ns']['coll'],
+                    'operation': self.operation_types[change['operationType']],
+                    'id': change['documentKey']['_id'],
+                    'document': change.get('fullDocument'),
+                }
+
+
+class PollingSource:
+    """Events from the /changes/ scans, for a standalone server without change streams.
+
+    Every ``interval`` seconds each collection is read from its last token.
+    A written document counts as an insert when it was created after the
+    previous poll.
+    """
+    models = (Employee, Transaction, Project, Customer, Asset)
+
+    def __init__(self, interval=2):
+        self.interval = interval
+        self.tokens = {}
+
+    async def events(self):
+        read = sync_to_async(changes_since, thread_sensitive=False)
+        for model in self.models:
+            if model not in self.tokens:
+                self.tokens[model] = (await read(model, None))[2]
+        while True:
+            await asyncio.sleep(self.interval)
+            for model in self.models:
+                more = True
+                while more:
+                    since = decode_token(self.tokens[model])['u'][0]
+                    written, deleted, self.tokens[model], more = await read(model, self.tokens[model])
+                    collection = model._meta['collection']
+                    for document in written:
+                        created = document.get('created_at')
+                        operation = 'insert' if created is not None and created > since else 'update'
+                        yield {'collection': collection, 'operation': operation, 'id': document['_id'],
+                               'document': document}
+                    for document_id in deleted:
+                        yield {'collection': collection, 'operation': 'delete', 'id': document_id}
+
+
+async def _supports_change_streams(alias=DEFAULT_CONNECTION_NAME):
+    if not async_available(alias):
+        return False
+    hello = await get_async_db(alias).command('hello')
+    return 'setName' in hello or hello.get('msg') == 'isdbgrid'
+
+
+async def make_source():
+    """Source named by REALTIME_SOURCE: change_stream, poll, or auto to pick by server.
+
+    Time-series collections have no change streams, so auto polls when
+    transactions live in one.
+    """
+    alias = current_alias()
+    kind = getattr(settings, 'REALTIME_SOURCE', 'auto')
+    if kind == 'auto':
+        kind = 'change_stream' if not timeseries.enabled() and await _supports_change_streams(alias) else 'poll'
+    if kind == 'change_stream':
+        return ChangeStreamSource(alias)
+    return PollingSource(getattr(settings, 'REALTIME_POLL_SECONDS', 2))
+
+
+class Subscription:
+    """One client's filtered view of the hub, with a bounded queue of SSE frames"""
+
+    def __init__(self, collections, operations, maxsize):
+        self.collections = frozenset(collections)
+        self.operations = frozenset(operations)
+        self.queue = asyncio.Queue(maxsize)
+        self.overflows = 0
+
+    def offer(self, operation, frame):
+        if operation not in self.operations:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # A slow reader loses its backlog and is told to resync through
+            # /changes/, rather than buffering without bound or holding up
+            # every other subscriber
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            self.overflows += 1
+
+
+class ChangeHub:
+    """Fans the events of one source out to any number of subscribers.
+
+    The source runs while anyone is subscribed, so a process holds one
+    change stream or poller per tenant however many dashboards are
+    connected. Each event is serialized once and offered to the subscribers
+    of its collection; a lost source is restarted with a backoff.
+    """
+    queue_size = 100
+    max_backoff = 30
+
+    def __init__(self, source=None, tenant=None):
+        self.source = source
+        self.tenant = tenant
+        self._subscribers = {collection: set() for collection in WATCHED}
+        self._count = 0
+        self._task = None
+
+    def __len__(self):
+        return self._count
+
+    def subscribe(self, collections=WATCHED, operations=OPERATIONS):
+        subscription = Subscription(collections, operations, self.queue_size)
+        for collection in subscription.collections:
+            self._subscribers[collection].add(subscription)
+        self._count += 1
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for collection in subscription.collections:
+            self._subscribers[collection].discard(subscription)
+        self._count -= 1
+        if not self._count and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def publish(self, event):
+        subscribers = self._subscribers.get(event['collection'])
+        if subscribers:
+            frame = format_event(event)
+            for subscription in list(subscribers):
+                subscription.offer(event['operation'], frame)
+
+    async def _run(self):
+        # The task has its own context; the source reads this tenant's database
+        activate(self.tenant)
+        if self.source is None:
+            self.source = await make_source()
+        backoff = 1
+        while True:
+            try:
+                async for event in self.source.events():
+                    self.publish(event)
+                    backoff = 1
+            except PyMongoError:
+                logger.exception('Change source failed, restarting in %d s', backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub(tenant=None):
+    """The running event loop's ChangeHub for ``tenant``"""
+    hubs = _hubs.setdefault(asyncio.get_running_loop(), {})
+    if tenant not in hubs:
+        hubs[tenant] = ChangeHub(tenant=tenant)
+    return hubs[tenant]
+
+
+def _authenticate(request):
+    """Whether the API's authentication and permission classes let ``request`` in.
+
+    EventSource cannot send headers, so ?access_token= stands in for the
+    Authorization header.
+    """
+    token = request.GET.get('access_token')
+    if token and 'HTTP_AUTHORIZATION' not in request.META:
+        request.META['HTTP_AUTHORIZATION'] = 'Bearer %s' % token
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        # Authenticate up front as DRF views do, so a bad token fails even under AllowAny
+        drf_request.user
+        if get_registry() and current_tenant() is None:
+            return False
+        return all(permission().has_permission(drf_request, None)
+                   for permission in api_settings.DEFAULT_PERMISSION_CLASSES)
+    except APIException:
+        return False
+
+
+async def _stream(hub, filters, lifetime):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + lifetime
+    subscription = hub.subscribe(**filters)
+    try:
+        yield b'retry: 3000\n\n'
+        while loop.time() < deadline:
+            try:
+                yield await asyncio.wait_for(subscription.queue.get(), min(HEARTBEAT_SECONDS, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                yield b': keep-alive\n\n'
+    finally:
+        hub.unsubscribe(subscription)
+
+
+async def events_view(request):
+    """Server-sent events for writes to the watched collections.
+
+    GET /api/events/?collections=employees,projects&operations=insert,delete
+    sends a ``change`` event per write and ``resync`` when the client fell
+    too far behind; it should then catch up through /changes/, as after a
+    reconnect. Django 4.2 does not notice a client going away, so streams
+    end after REALTIME_STREAM_SECONDS and EventSource reconnects. Needs the
+    ASGI server.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'Server-sent events need the ASGI server'}, status=501)
+    if not await sync_to_async(_authenticate)(request):
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    filters = {}
+    for param, choices in (('collections', WATCHED), ('operations', OPERATIONS)):
+        values = [value.strip() for value in request.GET.get(param, '').split(',') if value.strip()]
+        if any(value not in choices for value in values):
+            return JsonResponse({param: ['Choose from: %s.' % ', '.join(choices)]}, status=400)
+        filters[param] = values or choices
+
+    lifetime = getattr(settings, 'REALTIME_STREAM_SECONDS', 300)
+    # The tenant the middleware or the token's claim made current
+    hub = get_hub(current_tenant())
+    response = StreamingHttpResponse(_stream(hub, filters, lifetime), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Let nginx pass events through instead of buffering them
+    response['X-Accel-Buffering'] = 'no'
+    return response
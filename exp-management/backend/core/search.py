@@ -0,0 +1,288 @@
+import contextvars
+import heapq
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from django.conf import settings
+from pymongo.errors import PyMongoError
+
+from .mongo import read_actions_preference
+from .tenants import db_alias
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+# Letters NFKD does not split into a base letter and a combining mark
+FOLDED_LETTERS = str.maketrans({'đ': 'd'})
+
+
+def fold(text):
+    """Lowercase ``text`` and strip its diacritics: 'Nguyễn Đức' -> 'nguyen duc'"""
+    text = unicodedata.normalize('NFKD', text.lower().translate(FOLDED_LETTERS))
+    return text.encode('ascii', 'ignore').decode('ascii')
+
+
+def tokenize(text):
+    """Folded words of ``text``; an email splits into its name and domain parts"""
+    return TOKEN_RE.findall(fold(text)) if text else []
+
+
+class PrefixIndex:
+    """In-memory prefix index over a few text fields of one collection.
+
+    Each folded token lists the documents holding it, per weight of the field
+    it came from; earlier fields weigh more. The distinct tokens are kept
+    sorted, so every token starting with a prefix is one bisect away. A
+    document matches when each query term prefixes one of its tokens, and
+    scores the sum over terms of that token's weight, doubled when the token
+    equals the term. Ties go to the most recently added document.
+
+    A term expands to its first ``max_expansions`` tokens in sorted order.
+    Candidates for the rarest term are read best first and checked for the
+    other terms. Reading stops once no unread candidate can make the top
+    results, and after ``max_candidates`` at most, so a one-letter query on
+    a large collection costs about as much as a narrow one.
+    """
+    max_expansions = 100
+    max_candidates = 4000
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.weights = {field: len(self.fields) - index for index, field in enumerate(self.fields)}
+        self._tokens = []  # distinct tokens, sorted before each search
+        self._sorted = True
+        self._postings = {}  # token -> [ordinals with weight 0 or None, with weight 1 or None, ...]
+        self._doc_tokens = []  # ordinal -> tokens of the document
+        self._doc_weights = []  # ordinal -> bytes with the weight of each token
+        self._ids = []  # ordinal -> document _id, None once removed or replaced
+        self._ordinals = {}  # document _id -> ordinal
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ordinals)
+
+    def add(self, document):
+        """Index a raw document, replacing what was indexed under its _id"""
+        tokens = {}
+        for field in self.fields:
+            weight = self.weights[field]
+            for token in tokenize(document.get(field)):
+                if tokens.get(token, 0) < weight:
+                    tokens[token] = weight
+        with self._lock:
+            self._discard(document['_id'])
+            ordinal = len(self._ids)
+            self._ids.append(document['_id'])
+            self._ordinals[document['_id']] = ordinal
+            self._doc_tokens.append(tuple(map(sys.intern, tokens)))
+            self._doc_weights.append(bytes(tokens.values()))
+            for token, weight in tokens.items():
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[sys.intern(token)] = [None] * (len(self.fields) + 1)
+                    self._tokens.append(token)
+                    self._sorted = False
+                if postings[weight] is None:
+                    postings[weight] = [ordinal]
+                else:
+                    postings[weight].append(ordinal)
+
+    def discard(self, document_id):
+        with self._lock:
+            self._discard(document_id)
+
+    def _discard(self, document_id):
+        # Postings keep the ordinal; searches skip it until the next rebuild
+        ordinal = self._ordinals.pop(document_id, None)
+        if ordinal is not None:
+            self._ids[ordinal] = None
+            self._doc_tokens[ordinal] = ()
+            self._doc_weights[ordinal] = b''
+
+    def _prefixed(self, term):
+        """``(postings, term, tokens, truncated)`` for the tokens starting with ``term``"""
+        start = bisect_left(self._tokens, term)
+        # '{' sorts right after 'z', past every token starting with term
+        end = bisect_left(self._tokens, term + '{', start)
+        tokens = self._tokens[start:min(end, start + self.max_expansions)]
+        size = sum(len(ordinals) for token in tokens for ordinals in self._postings[token] if ordinals)
+        return size, term, tokens, end - start > self.max_expansions
+
+    def _candidates(self, term, tokens):
+        """``(score, ordinal)`` of live documents holding one of ``tokens``, best first"""
+        levels = {}
+        for token in tokens:
+            bonus = 2 if token == term else 1
+            for weight, ordinals in enumerate(self._postings[token]):
+                if ordinals:
+                    levels.setdefault(weight * bonus, []).append(ordinals)
+        seen = set()
+        for score in sorted(levels, reverse=True):
+            # Ordinals only grow, so newest first is each list reversed
+            merged = heapq.merge(*map(reversed, levels[score]), reverse=True)
+            for ordinal in merged:
+                if ordinal not in seen and self._ids[ordinal] is not None:
+                    seen.add(ordinal)
+                    yield score, ordinal
+
+    def _best_score(self, term, tokens):
+        """The highest score any document holding one of ``tokens`` gets for ``term``"""
+        return max((
+            weight * 2 if token == term else weight
+            for token in tokens
+            for weight, ordinals in enumerate(self._postings[token]) if ordinals
+        ), default=0)
+
+    def _term_score(self, ordinal, term):
+        best = 0
+        for token, weight in zip(self._doc_tokens[ordinal], self._doc_weights[ordinal]):
+            if token.startswith(term):
+                best = max(best, weight * 2 if token == term else weight)
+        return best
+
+    def search(self, query, limit):
+        """``(matches, exact, [(score, _id), ...])`` with the best ``limit`` matches.
+
+        When reading stopped early, ``exact`` is False and ``matches`` only
+        counts the matches read so far.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return 0, True, []
+        with self._lock:
+            if not self._sorted:
+                self._tokens.sort()
+                self._sorted = True
+            ranges = sorted(self._prefixed(term) for term in terms)
+            _, first, tokens, _ = ranges[0]
+            others = [term for _, term, _, _ in ranges[1:]]
+            # The most the other terms can add to a candidate's score
+            best_scores = [self._best_score(term, tokens) for _, term, tokens, _ in ranges[1:]]
+            if not all(best_scores):
+                return 0, True, []
+            headroom = sum(best_scores)
+            top = []  # min-heap of the best (score, ordinal) so far
+            matches = 0
+            exact = not any(truncated for _, _, _, truncated in ranges)
+            for examined, (score, ordinal) in enumerate(self._candidates(first, tokens)):
+                # Candidates come in falling (score, ordinal) order
+                if examined == self.max_candidates or (len(top) == limit and (score + headroom, ordinal) < top[0]):
+                    exact = False
+                    break
+                for term in others:
+                    best = self._term_score(ordinal, term)
+                    if not best:
+                        break
+                    score += best
+                else:
+                    matches += 1
+                    if len(top) < limit:
+                        heapq.heappush(top, (score, ordinal))
+                    else:
+                        heapq.heappushpop(top, (score, ordinal))
+            top.sort(reverse=True)
+            return matches, exact, [(score, self._ids[ordinal]) for score, ordinal in top]
+
+
+def build_index(model, fields, batch_size=5000):
+    """Read ``fields`` of every document of ``model`` into a new PrefixIndex"""
+    index = PrefixIndex(fields)
+    collection = model._get_collection()
+    preference = read_actions_preference()
+    if preference is not None:
+        collection = collection.with_options(read_preference=preference)
+    for document in collection.find({}, dict.fromkeys(fields, 1)).sort('_id', 1).batch_size(batch_size):
+        index.add(document)
+    return index
+
+
+class _Entry:
+    def __init__(self):
+        self.index = None  # until the first build finishes
+        self.built = None
+        self.pending = None  # writes seen while a build runs, replayed on its result
+        self.done = threading.Event()  # set once the first build finished or failed
+
+
+_entries = {}
+_lock = threading.Lock()
+_pid = None
+
+
+def _rebuild(model, fields, entry):
+    try:
+        index = build_index(model, fields)
+    except PyMongoError:
+        # Keep serving the old index, if any, and try again later
+        index = None
+    with _lock:
+        if index is not None:
+            for document, document_id in entry.pending:
+                if document is not None:
+                    index.add(document)
+                else:
+                    index.discard(document_id)
+            entry.index = index
+        entry.built, entry.pending = time.monotonic(), None
+    entry.done.set()
+
+
+def _index_key(model):
+    return db_alias(model), model._meta['collection']
+
+
+def get_index(model, fields, wait=False):
+    """This process's PrefixIndex of ``model``, or None until it is built.
+
+    The first call starts the build on a background thread and, unless
+    ``wait`` is true, returns at once. Writes made through the API in this
+    process are applied right away (see ``index_documents``); writes by
+    other workers show up once the index is older than SEARCH_INDEX_TTL
+    seconds and gets rebuilt, again in the background while searches use
+    the old index. Each tenant's collection has its own index.
+    """
+    global _pid
+    collection = _index_key(model)
+    with _lock:
+        if _pid != os.getpid():
+            # Threads and their half-built indexes do not survive fork
+            _entries.clear()
+            _pid = os.getpid()
+        entry = _entries.get(collection)
+        if entry is None:
+            entry = _entries[collection] = _Entry()
+        if entry.pending is None and (entry.index is None or
+                                      time.monotonic() - entry.built > getattr(settings, 'SEARCH_INDEX_TTL', 300)):
+            entry.pending = []
+            # The build reads the same tenant's collection
+            threading.Thread(target=contextvars.copy_context().run, args=(_rebuild, model, fields, entry),
+                             name='search-index', daemon=True).start()
+    if wait:
+        entry.done.wait()
+    return entry.index
+
+
+def index_documents(model, added=(), removed=()):
+    """Apply written raw documents and deleted ids to this process's index, if built"""
+    with _lock:
+        entry = _entries.get(_index_key(model)) if _pid == os.getpid() else None
+        if entry is None:
+            return
+        for document in added:
+            if entry.index is not None:
+                entry.index.add(document)
+            if entry.pending is not None:
+                entry.pending.append((document, None))
+        for document_id in removed:
+            if entry.index is not None:
+                entry.index.discard(document_id)
+            if entry.pending is not None:
+                entry.pending.append((None, document_id))
+
+
+def reset_indexes():
+    with _lock:
+        _entries.clear()
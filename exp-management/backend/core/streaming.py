@@ -0,0 +1,53 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils import encoders
+
+
+def _dumps(row):
+    # Same compact, non-ASCII-escaping output as DRF's JSONRenderer
+    return json.dumps(row, cls=encoders.JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def iter_ndjson(rows, chunk_size=500):
+    """Encode rows as newline-delimited JSON, yielding bytes every chunk_size rows."""
+    chunk = []
+    for row in rows:
+        chunk.append(_dumps(row))
+        if len(chunk) >= chunk_size:
+            yield ('\n'.join(chunk) + '\n').encode('utf-8')
+            chunk = []
+    if chunk:
+        yield ('\n'.join(chunk) + '\n').encode('utf-8')
+
+
+def iter_json_array(rows, chunk_size=500):
+    """Encode rows as a single JSON array without holding it in memory."""
+    yield b'['
+    separator = ''
+    chunk = []
+    for row in rows:
+        chunk.append(_dumps(row))
+        if len(chunk) >= chunk_size:
+            yield (separator + ','.join(chunk)).encode('utf-8')
+            separator, chunk = ',', []
+    if chunk:
+        yield (separator + ','.join(chunk)).encode('utf-8')
+    yield b']'
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline-delimited JSON, one object per line.
+
+    Streaming views write their own body; this renderer lets content
+    negotiation accept ``?format=ndjson`` and renders error responses.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return b''.join(iter_ndjson(rows))
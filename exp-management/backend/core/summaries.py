@@ -0,0 +1,179 @@
+from collections import defaultdict
+from datetime import timezone
+from decimal import ROUND_HALF_UP, Decimal
+
+from bson import Decimal128
+from pymongo import UpdateOne
+
+from .archive import archive_collection
+from .models import Transaction, TransactionRollup
+from . import timeseries
+
+ROLLUP_PERIODS = ('day', 'month')
+SUMMARY_GROUPS = ('type', 'category', 'day', 'month')
+PERIOD_FORMATS = {'day': '%Y-%m-%d', 'month': '%Y-%m'}
+
+
+def _to_cents(amount):
+    if isinstance(amount, Decimal128):
+        amount = amount.to_decimal()
+    return int((Decimal(str(amount)) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def _from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def _buckets(date):
+    """Day and month bucket labels for a transaction date, in UTC"""
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc)
+    return {period: date.strftime(PERIOD_FORMATS[period]) for period in ROLLUP_PERIODS}
+
+
+def apply_rollups(added=(), removed=()):
+    """Fold raw transaction documents into the rollup collection.
+
+    ``added`` documents are counted in, ``removed`` ones counted out; an update
+    passes the old version as removed and the new one as added. All affected
+    buckets are written with a single unordered bulk_write of $inc upserts.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    for sign, documents in ((1, added), (-1, removed)):
+        for document in documents:
+            cents = _to_cents(document['amount'])
+            for period, bucket in _buckets(document['date']).items():
+                delta = deltas[(period, bucket, document['type'], document['category'])]
+                delta[0] += sign * cents
+                delta[1] += sign
+
+    operations = [
+        UpdateOne(
+            {'period': period, 'bucket': bucket, 'type': kind, 'category': category},
+            {'$inc': {'total_cents': cents, 'count': count}},
+            upsert=True
+        )
+        for (period, bucket, kind, category), (cents, count) in deltas.items()
+        if cents or count
+    ]
+    if operations:
+        TransactionRollup._get_collection().bulk_write(operations, ordered=False)
+
+
+def day_totals_pipeline(timeseries=False):
+    """Totals per day, type and category.
+
+    On a time-series collection the days come from $dateTrunc and the
+    groups from meta, which MongoDB computes per bucket where it can.
+    """
+    if timeseries:
+        key = {'day': {'$dateTrunc': {'date': '$date', 'unit': 'day'}}, 'type': '$meta.type',
+               'category': '$meta.category'}
+    else:
+        key = {'bucket': {'$dateToString': {'format': PERIOD_FORMATS['day'], 'date': '$date'}},
+               'type': '$type', 'category': '$category'}
+    return [{'$group': {
+        '_id': key,
+        'total': {'$sum': {'$toDecimal': '$amount'}},
+        'count': {'$sum': 1},
+    }}]
+
+
+def rebuild_rollups(batch_size=1000, progress=None):
+    """Recompute every rollup from the transactions and their archive.
+
+    Day totals come from one aggregation over each collection, month totals are
+    summed from the days. The result is built in a scratch collection and
+    renamed over the live one, so readers never see a partial rebuild.
+    Writes made while the rebuild runs are not reflected; run it off-peak.
+
+    ``progress(done, total, message)`` is called between steps; raising from
+    it stops the rebuild and leaves the live rollups as they were.
+    """
+    progress = progress or (lambda done, total, message: None)
+    days, months = defaultdict(lambda: [0, 0]), defaultdict(lambda: [0, 0])
+    # A day at the archive cutoff can have transactions in both
+    sources = ((Transaction._get_collection(), day_totals_pipeline(timeseries.enabled())),
+               (archive_collection(Transaction), day_totals_pipeline()))
+    for done, (collection, pipeline) in enumerate(sources):
+        progress(done, len(sources), 'summing %s' % collection.name)
+        for row in collection.aggregate(pipeline, allowDiskUse=True):
+            key, cents = row['_id'], _to_cents(row['total'])
+            if 'day' in key:
+                key['bucket'] = key['day'].strftime(PERIOD_FORMATS['day'])
+            for totals in (days[(key['bucket'], key['type'], key['category'])],
+                           months[(key['bucket'][:7], key['type'], key['category'])]):
+                totals[0] += cents
+                totals[1] += row['count']
+    documents = []
+    for period, buckets in (('day', days), ('month', months)):
+        for (bucket, kind, category), (cents, count) in buckets.items():
+            documents.append({'period': period, 'bucket': bucket, 'type': kind,
+                              'category': category, 'total_cents': cents, 'count': count})
+
+    live = TransactionRollup._get_collection()
+    scratch = live.database[live.name + '_rebuild']
+    scratch.drop()
+    scratch.create_index([('period', 1), ('bucket', 1), ('type', 1), ('category', 1)], unique=True)
+    for start in range(0, len(documents), batch_size):
+        progress(start, len(documents), 'writing rollups')
+        scratch.insert_many(documents[start:start + batch_size], ordered=False)
+    progress(len(documents), len(documents), 'writing rollups')
+    if documents:
+        scratch.rename(live.name, dropTarget=True)
+    else:
+        scratch.drop()
+        live.delete_many({})
+    return len(documents)
+
+
+def summarize(group_by='month', date_from=None, date_to=None, type=None, category=None):
+    """Income/expense totals grouped by type, category, day or month.
+
+    ``date_from`` is inclusive and ``date_to`` exclusive; both are dates, as
+    rollups have day resolution. Month rollups are read when the range is
+    month aligned, so the pipeline touches O(periods) documents.
+    """
+    month_aligned = all(bound is None or bound.day == 1 for bound in (date_from, date_to))
+    period = 'month' if group_by != 'day' and month_aligned else 'day'
+
+    match = {'period': period, 'count': {'$ne': 0}}
+    bucket_range = {}
+    if date_from is not None:
+        bucket_range['$gte'] = date_from.strftime(PERIOD_FORMATS[period])
+    if date_to is not None:
+        bucket_range['$lt'] = date_to.strftime(PERIOD_FORMATS[period])
+    if bucket_range:
+        match['bucket'] = bucket_range
+    if type is not None:
+        match['type'] = type
+    if category is not None:
+        match['category'] = category
+
+    if group_by in ('type', 'category'):
+        key = '$' + group_by
+    elif group_by == 'month' and period == 'day':
+        key = {'$substr': ['$bucket', 0, 7]}
+    else:
+        key = '$bucket'
+
+    pipeline = [
+        {'$match': match},
+        {'$group': {
+            '_id': key,
+            'income': {'$sum': {'$cond': [{'$eq': ['$type', 'income']}, '$total_cents', 0]}},
+            'expense': {'$sum': {'$cond': [{'$eq': ['$type', 'expense']}, '$total_cents', 0]}},
+            'count': {'$sum': '$count'},
+        }},
+        {'$sort': {'_id': 1}},
+    ]
+    results = []
+    for row in TransactionRollup._get_collection().aggregate(pipeline):
+        results.append({
+            'key': row['_id'],
+            'income': _from_cents(row['income']),
+            'expense': _from_cents(row['expense']),
+            'net': _from_cents(row['income'] - row['expense']),
+            'count': row['count'],
+        })
+    return results
@@ -0,0 +1,183 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import mongoengine
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from mongoengine.connection import DEFAULT_CONNECTION_NAME
+from rest_framework.exceptions import PermissionDenied
+
+from .mongo import configure
+
+ALIAS_PREFIX = 'tenant:'
+# Django groups named tenant:<id> hold the users of a tenant; superusers belong to all
+GROUP_PREFIX = 'tenant:'
+
+_current = ContextVar('tenant', default=None)
+
+
+class NoTenant(PermissionDenied):
+    default_detail = 'No tenant for this request.'
+    default_code = 'no_tenant'
+
+
+class TenantRegistry:
+    """Tenants by id, each behind its own MongoEngine connection alias.
+
+    MONGO_TENANTS maps an id to the usual mongoengine.connect() arguments,
+    typically ``host`` and ``db``, plus the ``hostnames`` it is served on.
+    Tenants may sit on different mongod instances; those sharing a host
+    string share one MongoClient and its pool.
+    """
+
+    def __init__(self, config):
+        self.aliases = {}
+        self.hostnames = {}
+        for tenant, options in config.items():
+            options = dict(options)
+            for hostname in options.pop('hostnames', ()):
+                self.hostnames[hostname.lower()] = tenant
+            alias = ALIAS_PREFIX + tenant
+            # A rebuilt registry may have moved the tenant elsewhere
+            mongoengine.disconnect(alias)
+            configure(alias, **options)
+            self.aliases[tenant] = alias
+
+    def __bool__(self):
+        return bool(self.aliases)
+
+    def __iter__(self):
+        return iter(sorted(self.aliases))
+
+    def __contains__(self, tenant):
+        return tenant in self.aliases
+
+    def alias(self, tenant):
+        if tenant not in self.aliases:
+            raise NoTenant
+        return self.aliases[tenant]
+
+    def for_host(self, host):
+        """The tenant served on ``host``, with or without a port, or None"""
+        return self.hostnames.get(host.rsplit(':', 1)[0].lower())
+
+
+_lock = threading.Lock()
+_configured = (None, None)
+
+
+def get_registry():
+    """The TenantRegistry built from settings.MONGO_TENANTS; empty runs a single tenant.
+
+    Rebuilt when the setting object changes, e.g. under override_settings.
+    """
+    global _configured
+    config = getattr(settings, 'MONGO_TENANTS', {})
+    source, registry = _configured
+    if source is not config:
+        with _lock:
+            source, registry = _configured
+            if source is not config:
+                registry = TenantRegistry(config)
+                _configured = (config, registry)
+    return registry
+
+
+def current_tenant():
+    return _current.get()
+
+
+def current_alias():
+    """The connection alias of the active tenant's database.
+
+    Without tenants everything lives behind the default alias. With them,
+    a tenant must have been resolved, or NoTenant is raised.
+    """
+    registry = get_registry()
+    if not registry:
+        return DEFAULT_CONNECTION_NAME
+    tenant = _current.get()
+    if tenant is None:
+        raise NoTenant
+    return registry.alias(tenant)
+
+
+def db_alias(document):
+    """The alias ``document`` reads and writes through right now"""
+    if document._meta.get('tenant_scoped'):
+        return current_alias()
+    return document._meta.get('db_alias', DEFAULT_CONNECTION_NAME)
+
+
+def activate(tenant):
+    """Make ``tenant`` current for the rest of the request; TenantMiddleware undoes it"""
+    _current.set(tenant)
+
+
+@contextmanager
+def using_tenant(tenant):
+    """Run the block as ``tenant``, e.g. a job or a management command"""
+    token = _current.set(tenant)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def tenant_ids(tenants=None):
+    """The given tenants, or every one, for a command to run over; [None] without tenants"""
+    registry = get_registry()
+    if not registry:
+        return [None]
+    unknown = [tenant for tenant in tenants or () if tenant not in registry]
+    if unknown:
+        raise ValueError('Unknown tenants: %s' % ', '.join(unknown))
+    return list(tenants or registry)
+
+
+def user_tenants(user):
+    """Ids of the tenants ``user`` may log in to"""
+    registry = get_registry()
+    if user.is_superuser:
+        return list(registry)
+    names = user.groups.filter(name__startswith=GROUP_PREFIX).values_list('name', flat=True)
+    return sorted(name[len(GROUP_PREFIX):] for name in names if name[len(GROUP_PREFIX):] in registry)
+
+
+class TenantMiddleware:
+    """Resolves the request's tenant from its host.
+
+    A request on a host no tenant is served on is left to the access
+    token's tenant claim (core/auth.py). Whatever the request made current
+    is undone when it ends, as threads serve one request after another.
+    Runs without a thread hop under ASGI as well as under WSGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _current.set(self.host_tenant(request))
+        try:
+            return self.get_response(request)
+        finally:
+            _current.reset(token)
+
+    async def __acall__(self, request):
+        token = _current.set(self.host_tenant(request))
+        try:
+            return await self.get_response(request)
+        finally:
+            _current.reset(token)
+
+    def host_tenant(self, request):
+        registry = get_registry()
+        return registry.for_host(request.get_host()) if registry else None
@@ -0,0 +1,193 @@
+import json
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from bson import ObjectId
+from pymongo import ReplaceOne
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.archive import ARCHIVE_POLICIES, archive, archive_collection
+from core.cache import get_response_cache
+from core.models import Project, Tombstone, Transaction, TransactionRollup
+from core.summaries import rebuild_rollups
+
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        get_response_cache().backend.clear()
+        now = datetime.utcnow()
+        self.old = [
+            Transaction(date=datetime(2015, 1, day), description='Old %d' % day, amount=Decimal('10.00'),
+                        type='expense', category='Office').save()
+            for day in (1, 2, 3)
+        ]
+        self.recent = [
+            Transaction(date=now - timedelta(days=days), description='Recent %d' % days, amount=Decimal('5.00'),
+                        type='income', category='Sales').save()
+            for days in (1, 2)
+        ]
+
+    def tearDown(self):
+        for model in (Transaction, Project):
+            model.drop_collection()
+            archive_collection(model).drop()
+        TransactionRollup.drop_collection()
+        Tombstone.drop_collection()
+        get_response_cache().backend.clear()
+
+    def hot_ids(self, model):
+        return {row['_id'] for row in model._get_collection().find({}, {'_id': 1})}
+
+    def archived_ids(self, model):
+        return {row['_id'] for row in archive_collection(model).find({}, {'_id': 1})}
+
+
+class TestArchive(ArchiveTestCase):
+    def test_moves_cold_documents_in_batches_once(self):
+        """Test old transactions move in batches and a second run moves nothing"""
+        progress = []
+        assert archive(ARCHIVE_POLICIES['transactions'], batch_size=2, progress=progress.append) == 3
+        assert progress == [2, 3]
+        assert self.hot_ids(Transaction) == {transaction.id for transaction in self.recent}
+        assert self.archived_ids(Transaction) == {transaction.id for transaction in self.old}
+        assert archive(ARCHIVE_POLICIES['transactions']) == 0
+
+    def test_closed_projects_only(self):
+        """Test only completed or cancelled projects untouched past the cutoff are archived"""
+        long_ago = datetime.utcnow() - timedelta(days=400)
+        projects = {status_: Project(name=status_, client='ABC Corp', status=status_).save()
+                    for status_ in ('active', 'completed', 'cancelled')}
+        Project._get_collection().update_many({}, {'$set': {'updated_at': long_ago}})
+        Project(name='Done lately', client='ABC Corp', status='completed').save()
+
+        assert archive(ARCHIVE_POLICIES['projects']) == 2
+        assert self.archived_ids(Project) == {projects['completed'].id, projects['cancelled'].id}
+
+    def test_projects_without_updated_at_go_by_created_at(self):
+        """Test closed projects stored before updated_at existed are archived by their creation date"""
+        long_ago = datetime.utcnow() - timedelta(days=400)
+        old = Project(name='Old', client='ABC Corp', status='completed', created_at=long_ago).save()
+        new = Project(name='New', client='ABC Corp', status='completed').save()
+        Project._get_collection().update_many({}, {'$unset': {'updated_at': ''}})
+
+        assert archive(ARCHIVE_POLICIES['projects']) == 1
+        assert self.archived_ids(Project) == {old.id}
+        assert new.id in self.hot_ids(Project)
+
+    def test_resumes_after_interruption(self):
+        """Test copies left by a stopped run are finished, and documents edited mid-move stay hot"""
+        # A run stopped after copying this one but before deleting it
+        archive_collection(Transaction).insert_one(Transaction._get_collection().find_one({'_id': self.old[0].id}))
+        edited = self.old[1]
+
+        def copy_while_edited(filter, document, upsert):
+            if document['_id'] == edited.id:
+                Transaction._get_collection().update_one({'_id': edited.id}, {'$inc': {'version': 1}})
+            return ReplaceOne(filter, document, upsert=upsert)
+
+        with mock.patch('core.archive.ReplaceOne', copy_while_edited):
+            assert archive(ARCHIVE_POLICIES['transactions']) == 2
+        assert edited.id in self.hot_ids(Transaction)
+        assert self.archived_ids(Transaction) == {self.old[0].id, self.old[2].id}
+
+        assert archive(ARCHIVE_POLICIES['transactions']) == 1
+        assert self.hot_ids(Transaction) == {transaction.id for transaction in self.recent}
+
+    @override_settings(CHANGES_SETTLE_SECONDS=0)
+    def test_moves_are_tombstoned(self):
+        """Test clients syncing through /changes/ drop archived documents from their lists"""
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='accountant', password='testpass123'))
+        since = client.get('/api/transactions/changes/').data['since']
+        time.sleep(0.002)
+
+        archive(ARCHIVE_POLICIES['transactions'])
+        response = client.get('/api/transactions/changes/?since=%s' % since)
+        assert set(response.data['deleted']) == {str(transaction.id) for transaction in self.old}
+
+    def test_rollups_include_the_archive(self):
+        """Test rebuilt rollups still count archived transactions"""
+        rebuild_rollups()
+        before = sorted((row.period, row.bucket, row.total_cents) for row in TransactionRollup.objects)
+
+        out = StringIO()
+        call_command('archive', 'transactions', stdout=out)
+        assert 'transactions: moved 3 documents to transactions_archive' in out.getvalue()
+        rebuild_rollups()
+        assert sorted((row.period, row.bucket, row.total_cents) for row in TransactionRollup.objects) == before
+
+
+class TestArchivedReads(ArchiveTestCase):
+    def setUp(self):
+        super().setUp()
+        archive(ARCHIVE_POLICIES['transactions'])
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='accountant', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+    def descriptions(self, response):
+        return [row['description'] for row in response.data['results']]
+
+    def test_lists_hot_data_by_default(self):
+        """Test lists leave archived documents out unless asked"""
+        assert self.descriptions(self.client.get('/api/transactions/')) == ['Recent 1', 'Recent 2']
+
+    def test_include_archived_pages_across_both(self):
+        """Test ?include_archived=1 merges both collections in order, page by page"""
+        response = self.client.get('/api/transactions/?include_archived=1&page_size=2')
+        seen = self.descriptions(response)
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen += self.descriptions(response)
+        assert seen == ['Recent 1', 'Recent 2', 'Old 3', 'Old 2', 'Old 1']
+
+        previous = self.client.get(response.data['previous'])
+        assert self.descriptions(previous) == ['Old 3', 'Old 2']
+
+    def test_date_range_past_cutoff_reads_archive(self):
+        """Test a date filter reaching back past the cutoff includes archived documents"""
+        response = self.client.get('/api/transactions/?date__gte=2015-01-02&type=expense')
+        assert self.descriptions(response) == ['Old 3', 'Old 2']
+        response = self.client.get('/api/transactions/?date__lt=2015-01-02')
+        assert self.descriptions(response) == ['Old 1']
+        recent = (datetime.utcnow() - timedelta(days=30)).date().isoformat()
+        assert self.descriptions(self.client.get('/api/transactions/?date__gte=%s' % recent)) == \
+            ['Recent 1', 'Recent 2']
+
+    def test_retrieve_and_export_archived(self):
+        """Test archived documents are found by id and exported only with include_archived"""
+        url = '/api/transactions/%s/' % self.old[0].id
+        assert self.client.get(url).status_code == status.HTTP_404_NOT_FOUND
+        response = self.client.get(url + '?include_archived=1')
+        assert (response.status_code, response.data['description']) == (status.HTTP_200_OK, 'Old 1')
+
+        response = self.client.get('/api/transactions/export/?include_archived=1&format=ndjson')
+        assert b''.join(response.streaming_content).count(b'\n') == 5
+
+    def test_export_merges_archive_in_order(self):
+        """Test an export interleaves both collections by the ordering and has each document once"""
+        # Caught mid-archive: copied to the archive, not yet deleted from the hot collection
+        Transaction._get_collection().insert_one(archive_collection(Transaction).find_one({'_id': self.old[0].id}))
+        Transaction(date=datetime(2015, 1, 2, 12), description='Not archived yet', amount=Decimal('1.00'),
+                    type='expense', category='Office').save()
+
+        response = self.client.get('/api/transactions/export/?include_archived=1&format=ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        assert [row['description'] for row in rows] == [
+            'Recent 1', 'Recent 2', 'Old 3', 'Not archived yet', 'Old 2', 'Old 1']
+
+    def test_archived_documents_are_read_only(self):
+        """Test writes to an archived document answer 409 and leave it untouched"""
+        url = '/api/transactions/%s/' % self.old[0].id
+        response = self.client.patch(url, {'description': 'Edited'}, format='json')
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert self.client.delete(url).status_code == status.HTTP_409_CONFLICT
+        assert self.client.get(url + '?include_archived=1').data['description'] == 'Old 1'
+        assert self.client.delete('/api/transactions/%s/' % ObjectId()).status_code == status.HTTP_404_NOT_FOUND
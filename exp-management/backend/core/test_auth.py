@@ -0,0 +1,134 @@
+from django.contrib.auth.models import Permission, User
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import auth
+from core.auth import BloomFilter, ClaimsJWTAuthentication, ClaimsUser, RevocationList
+from core.models import RevokedToken
+
+
+class TestBloomFilter:
+    def test_no_false_negatives_and_few_false_positives(self):
+        """Test every added key is found and few others are"""
+        bloom = BloomFilter(10000, error_rate=0.01)
+        for i in range(10000):
+            bloom.add('jti-%d' % i)
+
+        assert all('jti-%d' % i in bloom for i in range(10000))
+        false_positives = sum('other-%d' % i in bloom for i in range(10000))
+        assert false_positives < 200
+        assert bloom.count > 9900
+
+
+class TestClaimsAuthentication(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='auditor', password='testpass123', is_staff=True)
+        auth._permissions.clear()
+
+    def tearDown(self):
+        RevokedToken.drop_collection()
+
+    def login(self):
+        response = self.client.post('/api/auth/login/', {'username': 'auditor', 'password': 'testpass123'},
+                                    format='json')
+        assert response.status_code == status.HTTP_200_OK
+        return response.data
+
+    def authenticate(self, access):
+        request = APIRequestFactory().get('/api/employees/', HTTP_AUTHORIZATION='Bearer %s' % access)
+        return ClaimsJWTAuthentication().authenticate(request)[0]
+
+    def test_authenticates_from_claims_without_queries(self):
+        """Test a login token authenticates a claims user without reading the user table"""
+        access = self.login()['access']
+
+        with self.assertNumQueries(0):
+            user = self.authenticate(access)
+        assert isinstance(user, ClaimsUser)
+        assert (user.id, user.username, user.is_staff, user.is_superuser) == (self.user.id, 'auditor', True, False)
+
+    def test_permissions_are_cached(self):
+        """Test permissions are read once per user and then served from the cache"""
+        self.user.user_permissions.add(Permission.objects.get(codename='view_user'))
+        user = self.authenticate(self.login()['access'])
+
+        # The user, then its own and its groups' permissions
+        with self.assertNumQueries(3):
+            assert user.has_perm('auth.view_user')
+        with self.assertNumQueries(0):
+            assert user.has_module_perms('auth')
+            assert not user.has_perm('auth.delete_user')
+
+    def test_logout_revokes_tokens(self):
+        """Test logging out revokes the refresh and access tokens"""
+        tokens = self.login()
+        response = self.client.post('/api/auth/logout/', tokens, format='json')
+        assert response.status_code == status.HTTP_200_OK
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(tokens['access'])
+        response = self.client.post('/api/auth/refresh/', {'refresh': tokens['refresh']}, format='json')
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_refresh_tokens_work_once(self):
+        """Test a rotated refresh token cannot be used again"""
+        refresh = self.login()['refresh']
+
+        response = self.client.post('/api/auth/refresh/', {'refresh': refresh}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert self.authenticate(response.data['access']).username == 'auditor'
+
+        again = self.client.post('/api/auth/refresh/', {'refresh': refresh}, format='json')
+        assert again.status_code == status.HTTP_401_UNAUTHORIZED
+        assert self.client.post('/api/auth/refresh/', {'refresh': response.data['refresh']},
+                                format='json').status_code == status.HTTP_200_OK
+
+    @override_settings(TOKEN_REVOCATION_REFRESH_SECONDS=0)
+    def test_revocations_reach_other_processes(self):
+        """Test a revocation made elsewhere is picked up by the next refresh"""
+        token = AccessToken.for_user(self.user)
+        here, elsewhere = RevocationList(), RevocationList()
+        assert not here.is_revoked(token['jti'])
+
+        assert elsewhere.revoke(token)
+        assert not elsewhere.revoke(token)
+        assert here.is_revoked(token['jti'])
+        assert token['jti'] in here._filter
+
+    def test_refresh_reloads_the_user(self):
+        """Test a refresh rebuilds the claims from the user and refuses deactivated users"""
+        self.user.is_superuser = True
+        self.user.save()
+        refresh = self.login()['refresh']
+        User.objects.filter(pk=self.user.pk).update(is_superuser=False)
+
+        response = self.client.post('/api/auth/refresh/', {'refresh': refresh}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert not self.authenticate(response.data['access']).is_superuser
+
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.post('/api/auth/refresh/', {'refresh': response.data['refresh']}, format='json')
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_losing_privileges_revokes_tokens(self):
+        """Test deactivating a user or taking staff away revokes the tokens they hold"""
+        tokens = self.login()
+        self.user.is_staff = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(tokens['access'])
+        response = self.client.post('/api/auth/refresh/', {'refresh': tokens['refresh']}, format='json')
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+        other = User.objects.create_user(username='clerk', password='testpass123')
+        group = other.groups.create(name='clerks')
+        token = AccessToken.for_user(other)
+        assert self.authenticate(token).id == other.id
+        group.user_set.remove(other)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
@@ -0,0 +1,92 @@
+import threading
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.test import APIClient
+
+from core.batch import BatchView
+from core.models import Customer, Employee
+from core.views import CustomerViewSet, EmployeeViewSet
+
+
+class TestBatchView(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='dashboard', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        for name, email in (('Nguyễn Văn An', 'an@example.com'), ('Trần Thị Bình', 'binh@example.com')):
+            Employee(name=name, email=email, position='Developer', department='IT').save()
+        self.customer = Customer(name='ABC Corporation', email='contact@abc.com', company='ABC Corp').save()
+
+    def tearDown(self):
+        Employee.drop_collection()
+        Customer.drop_collection()
+
+    def batch(self, requests):
+        return self.client.post('/api/batch/', {'requests': requests}, format='json')
+
+    def test_answers_each_request_in_order(self):
+        """Test lists and details come back in the order asked, each with its own status and ETag"""
+        response = self.batch([
+            {'id': 'staff', 'path': 'employees/?ordering=email&page_size=1'},
+            {'id': 'client', 'path': '/api/customers/%s/' % self.customer.id},
+            {'id': 'missing', 'path': 'customers/%s/' % Employee.objects.first().id},
+        ])
+
+        assert response.status_code == status.HTTP_200_OK
+        staff, client, missing = response.data['responses']
+        assert (staff['id'], staff['status']) == ('staff', status.HTTP_200_OK)
+        assert [row['name'] for row in staff['body']['results']] == ['Nguyễn Văn An']
+        assert staff['body']['next']
+        assert (client['status'], client['body']['name']) == (status.HTTP_200_OK, 'ABC Corporation')
+        assert staff['etag'] == self.client.get('/api/employees/?ordering=email&page_size=1')['ETag']
+        assert client['etag'] == '"v0"'
+        assert (missing['id'], missing['status']) == ('missing', status.HTTP_404_NOT_FOUND)
+
+    def test_runs_requests_concurrently(self):
+        """Test sub-requests overlap on the pool instead of running one after another"""
+        barrier = threading.Barrier(2, timeout=5)
+        list_view = EmployeeViewSet.list
+
+        def meet_then_list(viewset, request, *args, **kwargs):
+            # Both lists must be in flight at once to pass the barrier
+            barrier.wait()
+            return list_view(viewset, request, *args, **kwargs)
+
+        with mock.patch.object(EmployeeViewSet, 'list', meet_then_list), \
+                mock.patch.object(CustomerViewSet, 'list', meet_then_list):
+            response = self.batch(['employees/', 'customers/'])
+
+        assert [item['status'] for item in response.data['responses']] == [status.HTTP_200_OK] * 2
+        assert [item['id'] for item in response.data['responses']] == [0, 1]
+
+    def test_only_get_on_document_resources(self):
+        """Test unknown paths, other views and resources without GET are refused per item"""
+        response = self.batch(['nowhere/', 'jobs/', 'batch/', 'employees/bulk/', 'employees/export/?format=csv'])
+
+        assert [item['status'] for item in response.data['responses']] == [
+            status.HTTP_404_NOT_FOUND, status.HTTP_404_NOT_FOUND, status.HTTP_404_NOT_FOUND,
+            status.HTTP_405_METHOD_NOT_ALLOWED, status.HTTP_400_BAD_REQUEST,
+        ]
+
+    def test_permissions_are_checked_per_request(self):
+        """Test the caller's identity reaches each sub-request and its viewset's permissions"""
+        with mock.patch.object(EmployeeViewSet, 'permission_classes', [IsAdminUser]):
+            response = self.batch(['employees/', 'customers/'])
+            assert [item['status'] for item in response.data['responses']] == [
+                status.HTTP_403_FORBIDDEN, status.HTTP_200_OK]
+
+            self.user.is_staff = True
+            self.user.save()
+            response = self.batch(['employees/'])
+            assert response.data['responses'][0]['status'] == status.HTTP_200_OK
+
+    def test_rejects_malformed_batches(self):
+        """Test the batch itself must be a non-empty list of paths within max_requests"""
+        assert self.batch([]).status_code == status.HTTP_400_BAD_REQUEST
+        assert self.batch([{'id': 'no path'}]).status_code == status.HTTP_400_BAD_REQUEST
+        too_many = ['employees/'] * (BatchView.max_requests + 1)
+        assert self.batch(too_many).status_code == status.HTTP_400_BAD_REQUEST
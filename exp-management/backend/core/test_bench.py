@@ -0,0 +1,70 @@
+import json
+import random
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from core.bench import build_request, compare, percentile, synthetic_transactions
+from core.models import Transaction
+
+
+class TestBenchHelpers:
+    def test_percentile_nearest_rank(self):
+        """Test percentiles use the nearest-rank method"""
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 95) == 95
+        assert percentile(values, 99) == 99
+        assert percentile([7], 99) == 7
+        assert percentile([], 50) is None
+
+    def test_synthetic_transactions_are_valid_and_repeatable(self):
+        """Test seeded documents load as valid transactions and repeat per seed"""
+        first = list(synthetic_transactions(20, seed=3))
+        second = list(synthetic_transactions(20, seed=3))
+        
+        assert [doc['amount'] for doc in first] == [doc['amount'] for doc in second]
+        for document in first:
+            Transaction._from_son(document).validate()
+
+    def test_build_request_unknown_scenario(self):
+        """Test an unknown scenario name is rejected"""
+        try:
+            build_request('delete-everything', random.Random(0), [])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('ValueError not raised')
+
+    def test_compare_flags_regressions(self):
+        """Test p95 growth and throughput drops beyond the threshold are reported"""
+        def result(p95, rps):
+            return {'rps': rps, 'latency_ms': {'p50': p95 / 2, 'p95': p95, 'p99': p95 * 2}}
+        
+        baseline = {'scenarios': {'list': result(10.0, 100.0), 'create': result(10.0, 100.0)}}
+        report = {'scenarios': {'list': result(15.0, 100.0), 'create': result(10.5, 98.0), 'filter': result(1, 1)}}
+        diff = compare(report, baseline, threshold=10)
+        
+        assert diff['scenarios']['list']['p95_change_pct'] == 50.0
+        assert diff['scenarios']['create']['rps_change_pct'] == -2.0
+        assert 'filter' not in diff['scenarios']
+        assert diff['regressions'] == ['list']
+
+
+class TestBenchCommand(TestCase):
+    def test_bench_reports_each_scenario(self):
+        """Test the bench command seeds a scratch database and reports latency as JSON"""
+        before = Transaction.objects.count()
+        out = StringIO()
+        call_command('bench', transactions=30, requests=6, concurrency=2,
+                     scenarios='list,retrieve,create,aggregate', stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        
+        assert report['dataset']['transactions'] == 30
+        assert set(report['scenarios']) == {'list', 'retrieve', 'create', 'aggregate'}
+        for result in report['scenarios'].values():
+            assert result['requests'] == 6
+            assert result['errors'] == 0
+            assert result['latency_ms']['p50'] <= result['latency_ms']['p99']
+        assert report['peak_rss_mb'] > 0
+        # The working database is left untouched
+        assert Transaction.objects.count() == before
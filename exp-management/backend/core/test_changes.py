@@ -0,0 +1,91 @@
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.changes import encode_token
+from core.models import Customer, Tombstone
+from core.views import CustomerViewSet
+
+
+@override_settings(CHANGES_SETTLE_SECONDS=0)
+class TestChanges(TestCase):
+    url = '/api/customers/changes/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='syncer', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.kept = Customer(name='Kept', email='kept@example.com').save()
+
+    def tearDown(self):
+        Customer.drop_collection()
+        Tombstone.drop_collection()
+
+    def poll(self, since=None):
+        response = self.client.get(self.url, {'since': since} if since else {})
+        assert response.status_code == status.HTTP_200_OK
+        # With no settle time, a write in the poll's own millisecond counts as seen
+        time.sleep(0.002)
+        return response.data
+
+    def test_poll_returns_writes_and_deletions_since_token(self):
+        """Test a poll returns created, updated and deleted documents once"""
+        token = self.poll()['since']
+        assert self.poll(token)['results'] == []
+        
+        created = self.client.post('/api/customers/', {'name': 'New', 'email': 'new@example.com'}, format='json')
+        doomed = Customer(name='Doomed', email='doomed@example.com').save()
+        self.client.put('/api/customers/%s/' % self.kept.id, {'name': 'Kept 2', 'email': 'kept@example.com'},
+                        format='json')
+        self.client.delete('/api/customers/%s/' % doomed.id)
+        
+        data = self.poll(token)
+        assert {item['name'] for item in data['results']} == {'New', 'Kept 2'}
+        assert data['deleted'] == [str(doomed.id)]
+        assert not data['has_more']
+        assert all(item['updated_at'] for item in data['results'])
+        assert created.data['updated_at']
+        
+        data = self.poll(data['since'])
+        assert (data['results'], data['deleted']) == ([], [])
+
+    def test_bulk_writes_are_tracked(self):
+        """Test bulk updates stamp updated_at and bulk deletes leave tombstones"""
+        other = Customer(name='Other', email='other@example.com').save()
+        token = self.poll()['since']
+        
+        self.client.patch('/api/customers/bulk/', [{'id': str(self.kept.id), 'status': 'customer'}], format='json')
+        self.client.delete('/api/customers/bulk/', {'ids': [str(other.id)]}, format='json')
+        
+        data = self.poll(token)
+        assert [item['status'] for item in data['results']] == ['customer']
+        assert data['deleted'] == [str(other.id)]
+
+    def test_changes_page_with_has_more(self):
+        """Test a backlog larger than a page comes in several polls without gaps"""
+        token = self.poll()['since']
+        for index in range(5):
+            Customer(name='Customer %d' % index, email='c%d@example.com' % index).save()
+        
+        names = []
+        with mock.patch.object(CustomerViewSet, 'changes_page_size', 2):
+            while True:
+                data = self.poll(token)
+                names.extend(item['name'] for item in data['results'])
+                token = data['since']
+                if not data['has_more']:
+                    break
+        assert names == ['Customer %d' % index for index in range(5)]
+
+    def test_invalid_and_expired_tokens(self):
+        """Test a malformed token is rejected and one past tombstone retention expires"""
+        assert self.client.get(self.url, {'since': 'garbage'}).status_code == status.HTTP_400_BAD_REQUEST
+        
+        old = datetime.utcnow() - timedelta(days=Tombstone.RETENTION_DAYS + 1)
+        response = self.client.get(self.url, {'since': encode_token({'u': [old, None], 'd': [old, None]})})
+        assert response.status_code == status.HTTP_410_GONE
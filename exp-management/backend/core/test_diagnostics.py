@@ -0,0 +1,152 @@
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase
+from core import diagnostics, mongo
+from core.indexes import sync_indexes
+from core.models import QueryShapeStat
+
+COLLSCAN_EXPLAIN = {
+    'queryPlanner': {'winningPlan': {'stage': 'SORT', 'inputStage': {'stage': 'COLLSCAN'}}},
+    'executionStats': {'nReturned': 20, 'totalDocsExamined': 50000, 'totalKeysExamined': 0},
+}
+IXSCAN_EXPLAIN = {
+    'queryPlanner': {'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': 'email_1'}}},
+    'executionStats': {'nReturned': 1, 'totalDocsExamined': 1, 'totalKeysExamined': 1},
+}
+
+
+class TestQueryShape:
+    def test_find_shape_strips_values(self):
+        """Test filters reduce to field kinds and keep the sort order"""
+        command = {
+            'find': 'transactions',
+            'filter': {
+                'type': 'expense',
+                'category': {'$in': ['Office', 'Travel']},
+                '$or': [{'date': {'$lt': 5}}, {'date': 5, '_id': {'$lt': 7}}],
+            },
+            'sort': {'date': -1, '_id': -1},
+        }
+        collection, filter_shape, sort = diagnostics.query_shape('find', command)
+        
+        assert collection == 'transactions'
+        assert filter_shape == [['_id', 'range'], ['category', 'in'], ['date', 'range'], ['type', 'eq']]
+        assert sort == [['date', -1], ['_id', -1]]
+
+    def test_aggregate_shape_uses_leading_match_and_sort(self):
+        """Test an aggregate's shape comes from its leading $match and $sort"""
+        command = {'aggregate': 'transaction_rollups', 'pipeline': [
+            {'$match': {'period': 'month', 'bucket': {'$gte': '2024-01'}}},
+            {'$sort': {'bucket': 1}},
+            {'$group': {'_id': '$bucket'}},
+        ]}
+        assert diagnostics.query_shape('aggregate', command) == (
+            'transaction_rollups', [['bucket', 'range'], ['period', 'eq']], [['bucket', 1]]
+        )
+
+    def test_plan_summary_and_totals(self):
+        """Test the winning plan and execution totals are read from explain output"""
+        assert diagnostics.plan_summary(COLLSCAN_EXPLAIN) == 'COLLSCAN'
+        assert diagnostics.plan_summary(IXSCAN_EXPLAIN) == 'IXSCAN email_1'
+        assert diagnostics.execution_totals(COLLSCAN_EXPLAIN) == (50000, 0, 20)
+
+    def test_recommend_index_equality_sort_range(self):
+        """Test recommended keys put equality, then sort, then range fields"""
+        keys = diagnostics.recommend_index(
+            [('amount', 'range'), ('date', 'range'), ('type', 'eq')], [('date', -1), ('_id', -1)]
+        )
+        assert keys == [('type', 1), ('date', -1), ('_id', -1), ('amount', 1)]
+
+    def test_covers(self):
+        """Test index prefixes match in order, with sort directions all equal or all reversed"""
+        index = [('type', 1), ('date', -1), ('_id', -1)]
+        assert diagnostics.covers(index, [('type', 1), ('date', 1), ('_id', 1)], equality=1)
+        assert not diagnostics.covers(index, [('type', 1), ('date', 1), ('_id', -1)], equality=1)
+        assert diagnostics.covers([('date', -1), ('_id', -1)], [('date', 1)], equality=1)
+        assert not diagnostics.covers([('date', 1)], [('type', 1), ('date', 1)], equality=1)
+
+
+class TestSlowQueryListener:
+    def test_only_slow_explainable_commands_are_submitted(self):
+        """Test the listener forwards slow reads and skips fast ones and its own collection"""
+        submitted = []
+        recorder = SimpleNamespace(submit=lambda *args: submitted.append(args))
+        listener = diagnostics.SlowQueryListener(threshold_ms=100, recorder=recorder)
+        
+        def run(request_id, command_name, command, micros):
+            listener.started(SimpleNamespace(command_name=command_name, command=command, connection_id=('h', 1),
+                                             request_id=request_id, database_name='exp'))
+            listener.succeeded(SimpleNamespace(command_name=command_name, connection_id=('h', 1),
+                                               request_id=request_id, duration_micros=micros))
+        
+        run(1, 'find', {'find': 'transactions', 'filter': {}, 'lsid': {'id': 1}, '$db': 'exp'}, 250000)
+        run(2, 'find', {'find': 'transactions', 'filter': {}}, 5000)
+        run(3, 'find', {'find': 'query_shapes', 'filter': {}}, 250000)
+        run(4, 'insert', {'insert': 'transactions'}, 250000)
+        
+        assert submitted == [('default', 'exp', 'find', {'find': 'transactions', 'filter': {}}, 250.0)]
+
+    def test_command_alias_matches_database_and_server(self):
+        """Test a command is traced back to the alias of its database on the server that ran it"""
+        settings = {'tenant:acme': {'name': 'acme'}, 'tenant:acme-eu': {'name': 'acme'}}
+        clients = {'tenant:acme': SimpleNamespace(nodes=frozenset({('node-a', 27017)})),
+                   'tenant:acme-eu': SimpleNamespace(nodes=frozenset({('node-c', 27017)}))}
+        with mock.patch.dict(mongo._connection_settings, settings), mock.patch.dict(mongo._connections, clients):
+            assert mongo.command_alias('acme', ('node-c', 27017)) == 'tenant:acme-eu'
+            assert mongo.command_alias('acme', ('node-z', 27017)) == 'tenant:acme'
+            assert mongo.command_alias('exp', ('node-a', 27017)) == 'default'
+
+
+class TestIndexAdvisor(TestCase):
+    def tearDown(self):
+        QueryShapeStat.drop_collection()
+
+    def test_advise_suggests_missing_compound_index(self):
+        """Test a collection-scanning shape gets an index and indexed shapes do not"""
+        command = {'find': 'transactions', 'filter': {'category': 'Office', 'type': 'expense', 'date': {'$gte': 1}},
+                   'sort': {'date': -1}}
+        diagnostics.record('find', command, 120.0, COLLSCAN_EXPLAIN)
+        diagnostics.record('find', command, 80.0)
+        diagnostics.record('find', {'find': 'employees', 'filter': {'email': 'a@b.co'}}, 150.0, IXSCAN_EXPLAIN)
+        
+        report = diagnostics.advise()
+        suggestions = report['transactions']['suggestions']
+        
+        assert [item['index'] for item in suggestions] == [('category', 'type', '-date')]
+        assert suggestions[0]['queries'] == 2
+        assert suggestions[0]['shapes'][0]['examined_per_result'] == 2500.0
+        assert report['employees']['suggestions'] == []
+        # Every declared transaction index leads with a different field
+        assert report['transactions']['redundant'] == []
+
+    def test_explains_on_the_connection_that_ran_it(self):
+        """Test slow queries are explained through their own alias and kept apart per database"""
+        explained = []
+        
+        def get_connection(alias):
+            def explain(name):
+                return lambda *args, **kwargs: explained.append((alias, name)) or COLLSCAN_EXPLAIN
+            return {name: SimpleNamespace(command=explain(name)) for name in ('acme', 'globex')}
+        
+        command = {'find': 'transactions', 'filter': {'type': 'expense'}}
+        recorder = diagnostics.SlowQueryRecorder()
+        with mock.patch.object(diagnostics, 'get_connection', get_connection):
+            recorder.process('tenant:acme', 'acme', 'find', command, 120.0)
+            recorder.process('tenant:globex', 'globex', 'find', command, 90.0)
+        
+        assert explained == [('tenant:acme', 'acme'), ('tenant:globex', 'globex')]
+        assert sorted(QueryShapeStat.objects.values_list('database', 'count')) == [('acme', 1), ('globex', 1)]
+
+    def test_index_advisor_command(self):
+        """Test the command prints suggestions and can reset the recorded shapes"""
+        sync_indexes(QueryShapeStat)
+        command = {'find': 'transactions', 'filter': {'category': 'Office', 'type': 'expense'}, 'sort': {'date': -1}}
+        diagnostics.record('find', command, 120.0, COLLSCAN_EXPLAIN)
+        out = StringIO()
+        call_command('index_advisor', '--reset', stdout=out)
+        
+        assert "add index ('category', 'type', '-date')" in out.getvalue()
+        assert QueryShapeStat.objects.count() == 0
+        assert 'shape_1' in QueryShapeStat._get_collection().index_information()
@@ -0,0 +1,201 @@
+import io
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.imports import FILES_COLLECTION, import_rows, read_csv, read_xlsx
+from core.jobs import Worker
+from core.models import Asset, Job, Transaction, TransactionRollup
+from core.serializers import TransactionSerializer
+from core.views import AssetViewSet, TransactionViewSet
+
+HEADER = 'Date,Description,Amount,Type,Category\n'
+
+
+def csv_file(text):
+    return io.BytesIO(('﻿' + text).encode('utf-8'))
+
+
+def xlsx_file(rows, references=True):
+    """A minimal workbook: shared strings, an inline string and a date-formatted serial"""
+    main = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+    strings, cells = [], []
+    for number, row in enumerate(rows, start=1):
+        xml = []
+        for column, value in zip('ABCDEFGH', row):
+            # r is optional in OOXML and some writers leave it out
+            ref = ' r="%s%d"' % (column, number) if references else ''
+            if isinstance(value, datetime):
+                serial = (value - datetime(1899, 12, 30)).total_seconds() / 86400
+                xml.append('<c%s s="1"><v>%r</v></c>' % (ref, serial))
+            elif isinstance(value, (int, float)):
+                xml.append('<c%s><v>%r</v></c>' % (ref, value))
+            elif value.startswith('inline:'):
+                xml.append('<c%s t="inlineStr"><is><t>%s</t></is></c>' % (ref, value[7:]))
+            else:
+                strings.append(value)
+                xml.append('<c%s t="s"><v>%d</v></c>' % (ref, len(strings) - 1))
+        cells.append('<row%s>%s</row>' % (' r="%d"' % number if references else '', ''.join(xml)))
+    stream = io.BytesIO()
+    with zipfile.ZipFile(stream, 'w') as archive:
+        archive.writestr('xl/workbook.xml', (
+            '<workbook xmlns="%s" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            '<sheets><sheet name="Data" sheetId="1" r:id="rId1"/></sheets></workbook>') % main)
+        archive.writestr('xl/_rels/workbook.xml.rels', (
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="worksheets/sheet1.xml"/></Relationships>'))
+        archive.writestr('xl/styles.xml', (
+            '<styleSheet xmlns="%s"><numFmts><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm"/></numFmts>'
+            '<cellXfs><xf numFmtId="0"/><xf numFmtId="164"/></cellXfs></styleSheet>') % main)
+        archive.writestr('xl/sharedStrings.xml', '<sst xmlns="%s">%s</sst>' % (
+            main, ''.join('<si><t>%s</t></si>' % value for value in strings)))
+        archive.writestr('xl/worksheets/sheet1.xml', '<worksheet xmlns="%s"><sheetData>%s</sheetData></worksheet>' % (
+            main, ''.join(cells)))
+    stream.seek(0)
+    return stream
+
+
+class TestReaders:
+    def test_csv_rows_are_keyed_by_lowercased_header(self):
+        """Test CSV rows come back by column name with their line numbers, skipping blank lines"""
+        rows = list(read_csv(csv_file(HEADER + '2024-05-01,Lunch,12.50,expense,food\n\n2024-05-02,"a, b",1,income,x\n')))
+        assert rows == [
+            (2, {'date': '2024-05-01', 'description': 'Lunch', 'amount': '12.50', 'type': 'expense', 'category': 'food'}),
+            (4, {'date': '2024-05-02', 'description': 'a, b', 'amount': '1', 'type': 'income', 'category': 'x'}),
+        ]
+
+    def test_xlsx_rows_resolve_strings_and_dates(self):
+        """Test XLSX rows resolve shared and inline strings and turn date cells into datetimes"""
+        stream = xlsx_file([
+            ['Date', 'Description', 'Amount'],
+            [datetime(2024, 5, 1, 9, 30), 'inline:Lunch', 12.5],
+        ])
+        assert list(read_xlsx(stream)) == [
+            (2, {'date': datetime(2024, 5, 1, 9, 30), 'description': 'Lunch', 'amount': '12.5'}),
+        ]
+
+    def test_xlsx_without_references_counts_positions(self):
+        """Test rows and cells without an r attribute take the next row number and column"""
+        stream = xlsx_file([
+            ['Date', 'Description', 'Amount'],
+            [datetime(2024, 5, 1, 9, 30), 'Lunch', 12.5],
+            ['2024-05-02', 'inline:Taxi', 20],
+        ], references=False)
+        assert list(read_xlsx(stream)) == [
+            (2, {'date': datetime(2024, 5, 1, 9, 30), 'description': 'Lunch', 'amount': '12.5'}),
+            (3, {'date': '2024-05-02', 'description': 'Taxi', 'amount': '20'}),
+        ]
+
+
+class TestValidateRows:
+    def test_same_results_as_run_validation(self):
+        """Test validate_rows accepts, rejects and reports exactly like run_validation"""
+        serializer = TransactionSerializer()
+        rows = [
+            {'date': '2024-05-01T10:00:00+02:00', 'description': ' Lunch ', 'amount': '12.5', 'type': 'expense',
+             'category': 'food'},
+            {'date': '2024-05-01', 'description': 'x' * 201, 'amount': '1e3', 'type': 'INCOME', 'category': ''},
+            {'date': 'yesterday', 'description': 'a\x00', 'amount': '123456789.12', 'type': 'income'},
+            {'date': '2024-05-01 10:00', 'description': 'd', 'amount': '0.005', 'type': 'expense', 'category': 'c'},
+        ]
+        for row, (data, errors) in zip(rows, serializer.validate_rows(rows)):
+            try:
+                expected, expected_errors = serializer.run_validation({k: v for k, v in row.items() if v}), None
+            except Exception as exc:
+                expected, expected_errors = None, {k: [str(m) for m in v] for k, v in exc.detail.items()}
+            assert (data, errors) == (expected, expected_errors)
+
+
+class TestImportRows(TestCase):
+    def tearDown(self):
+        Transaction.drop_collection()
+        TransactionRollup.drop_collection()
+        Asset.drop_collection()
+
+    def test_imports_valid_rows_and_reports_invalid_ones(self):
+        """Test valid rows are inserted with rollups and invalid ones reported by row number"""
+        report = import_rows(TransactionViewSet, read_csv(csv_file(
+            HEADER + '2024-05-01T09:00:00,Lunch,12.5,expense,food\n'
+                     '2024-05-01T10:00:00,Refund,abc,income,food\n'
+                     '2024-05-02T10:00:00,Salary,1000,income,pay\n'
+        )), chunk_size=2)
+
+        assert (report['rows'], report['created'], report['duplicates'], report['invalid']) == (3, 2, 0, 1)
+        assert report['errors'] == [{'row': 3, 'errors': {'amount': ['A valid number is required.']}}]
+        assert report['rows_per_second'] > 0
+        lunch = Transaction.objects.get(description='Lunch')
+        assert (lunch.amount, lunch.date, lunch.created_at is not None) == (Decimal('12.50'), datetime(2024, 5, 1, 9), True)
+        assert TransactionRollup.objects(period='month', bucket='2024-05', type='income').first().total_cents == 100000
+
+    def test_duplicates_are_skipped(self):
+        """Test rows repeating a stored or earlier natural key are skipped, so imports can be rerun"""
+        Transaction(date=datetime(2024, 5, 1, 9), description='Lunch', amount=Decimal('12.50'), type='expense',
+                    category='food').save()
+        text = HEADER + ('2024-05-01T09:00:00Z,Lunch,12.50,expense,food\n'
+                         '2024-05-03T09:00:00,Taxi,20,expense,travel\n'
+                         '2024-05-03T09:00:00,Taxi,20.00,expense,travel\n')
+
+        # The two taxi rows land in different chunks
+        report = import_rows(TransactionViewSet, read_csv(csv_file(text)), chunk_size=2)
+        assert (report['created'], report['duplicates']) == (1, 2)
+        assert import_rows(TransactionViewSet, read_csv(csv_file(text)))['created'] == 0
+        assert Transaction.objects.count() == 2
+
+    def test_assets_from_xlsx(self):
+        """Test assets import from a workbook, applying field defaults"""
+        report = import_rows(AssetViewSet, read_xlsx(xlsx_file([
+            ['Name', 'Category', 'Value', 'Location'],
+            ['Laptop', 'equipment', 1500, 'HQ'],
+            ['Laptop', 'equipment', 1500, 'HQ'],
+            ['Desk', 'furniture', 200.25, 'inline:'],
+        ])))
+
+        assert (report['created'], report['duplicates'], report['invalid']) == (2, 1, 0)
+        desk = Asset.objects.get(name='Desk')
+        assert (desk.value, desk.status, desk.location) == (Decimal('200.25'), 'active', None)
+
+
+class TestImportAPI(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='importer', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        for model in (Transaction, TransactionRollup, Job):
+            model.drop_collection()
+        db = Transaction._get_db()
+        for name in ('files', 'chunks'):
+            db.drop_collection('%s.%s' % (FILES_COLLECTION, name))
+
+    def test_upload_queues_import_job(self):
+        """Test an upload is imported by the worker and the job reports the result"""
+        upload = SimpleUploadedFile('may.csv', (HEADER + '2024-05-01,Lunch,12.5,expense,food\n').encode('utf-8'))
+        response = self.client.post('/api/transactions/import/', {'file': upload}, format='multipart')
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response.data['params']['format'] == 'csv'
+
+        Worker(['import']).run(burst=True)
+        job = self.client.get(response['Location']).data
+        assert job['status'] == 'succeeded'
+        assert (job['result']['rows'], job['result']['created']) == (1, 1)
+        assert Transaction.objects.count() == 1
+        assert Transaction._get_db()[FILES_COLLECTION + '.files'].count_documents({}) == 0
+
+    def test_rejects_other_files_and_collections(self):
+        """Test imports need a CSV or XLSX file and a collection that accepts them"""
+        upload = SimpleUploadedFile('may.pdf', b'%PDF')
+        response = self.client.post('/api/transactions/import/', {'file': upload}, format='multipart')
+        assert (response.status_code, response.data) == (status.HTTP_400_BAD_REQUEST,
+                                                         {'file': ['Upload a .csv or .xlsx file.']})
+        assert self.client.post('/api/transactions/import/', {}, format='multipart').status_code == \
+            status.HTTP_400_BAD_REQUEST
+        upload = SimpleUploadedFile('staff.csv', b'name\n')
+        assert self.client.post('/api/employees/import/', {'file': upload}, format='multipart').status_code == \
+            status.HTTP_404_NOT_FOUND
@@ -0,0 +1,207 @@
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+from bson import ObjectId
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.jobs import JOB_TYPES, JobCancelled, Worker, cancel, enqueue, job_type
+from core.models import Job, Transaction, TransactionRollup
+from core.summaries import rebuild_rollups
+
+
+class JobTestCase(TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(JOB_TYPES)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+
+        @job_type('count', concurrency=1)
+        def count(context):
+            for done in range(1, 4):
+                context.progress(done, 3, 'counting')
+            self.calls.append(context.params)
+            return {'counted': 3}
+
+        @job_type('flaky', max_attempts=2, retry_delay=0)
+        def flaky(context):
+            self.calls.append('flaky')
+            raise RuntimeError('disk full')
+
+        @job_type('wait', concurrency=2)
+        def wait(context):
+            deadline = time.monotonic() + 2
+            while time.monotonic() < deadline:
+                context.progress(0)
+                time.sleep(0.01)
+            self.calls.append('timed out')
+
+    def tearDown(self):
+        Job.drop_collection()
+
+    def job(self, job):
+        return Job.objects.get(id=job.id)
+
+
+class TestWorker(JobTestCase):
+    def test_runs_job_and_reports_progress(self):
+        """Test a worker runs a queued job and records its progress and result"""
+        job = enqueue('count', {'day': '2024-05-01'})
+
+        Worker(['count']).run(burst=True)
+
+        job = self.job(job)
+        assert (job.status, job.attempts, job.result) == ('succeeded', 1, {'counted': 3})
+        assert job.progress == {'done': 3, 'total': 3, 'message': 'counting'}
+        assert job.finished_at and not job.lease_expires_at
+        assert self.calls == [{'day': '2024-05-01'}]
+
+    def test_failing_job_is_retried_then_failed(self):
+        """Test a raising job is retried up to max_attempts and keeps the error"""
+        job = enqueue('flaky')
+
+        Worker(['flaky']).run(burst=True)
+
+        job = self.job(job)
+        assert (job.status, job.attempts) == ('failed', 2)
+        assert job.error == 'RuntimeError: disk full'
+        assert self.calls == ['flaky', 'flaky']
+
+    def test_retry_waits_for_its_delay(self):
+        """Test a retried job is not claimed before its run_at"""
+        JOB_TYPES['flaky'].retry_delay = 60
+        job = enqueue('flaky')
+
+        Worker(['flaky']).run(burst=True)
+
+        job = self.job(job)
+        assert (job.status, job.attempts, len(self.calls)) == ('queued', 1, 1)
+        assert job.run_at > datetime.utcnow() + timedelta(seconds=50)
+
+    def test_concurrency_limit_spans_workers(self):
+        """Test a type at its concurrency limit is skipped while other types still run"""
+        running = Job(type='count', status='running', started_at=datetime.utcnow(),
+                      lease_expires_at=datetime.utcnow() + timedelta(minutes=1)).save()
+        queued, other = enqueue('count'), enqueue('flaky')
+
+        worker = Worker(['count', 'flaky'])
+        assert worker.claim()['_id'] == other.id
+        assert worker.claim() is None
+
+        running.update(set__status='succeeded')
+        assert worker.claim()['_id'] == queued.id
+
+    def test_late_claim_past_limit_is_given_back(self):
+        """Test of two claims racing for the last slot, the later one steps back"""
+        worker = Worker(['count'])
+        queued = enqueue('count')
+        with mock.patch.object(Worker, '_free_types', return_value=['count']):
+            Job(type='count', status='running', started_at=datetime.utcnow() - timedelta(seconds=1)).save()
+            assert worker.claim() is None
+
+        job = self.job(queued)
+        assert (job.status, job.attempts, job.worker) == ('queued', 0, None)
+
+    def test_expired_lease_is_retried(self):
+        """Test a job whose worker stopped renewing its lease is queued again"""
+        stale = Job(type='count', status='running', attempts=1, worker='gone:1',
+                    lease_expires_at=datetime.utcnow() - timedelta(seconds=1)).save()
+        spent = Job(type='count', status='running', attempts=3, worker='gone:1',
+                    lease_expires_at=datetime.utcnow() - timedelta(seconds=1)).save()
+
+        Worker(['count']).run(burst=True)
+
+        assert (self.job(stale).status, self.job(stale).attempts) == ('succeeded', 2)
+        assert (self.job(spent).status, self.job(spent).error) == ('failed', 'Worker gone:1 stopped responding')
+
+    def test_cancel(self):
+        """Test cancelling stops a queued job at once and a running one at its next progress report"""
+        queued = enqueue('count')
+        assert cancel(queued.id)['status'] == 'cancelled'
+        assert cancel(queued.id) is None
+
+        running = enqueue('wait')
+        worker = Worker(['wait'])
+        worker.lease_seconds = 0.03
+        job = worker.claim()
+        assert cancel(running.id)['cancel_requested']
+        worker.run_job(job)
+
+        assert self.job(running).status == 'cancelled'
+        assert self.calls == []
+
+    def test_rebuild_rollups_reports_progress(self):
+        """Test the rollup rebuild reports each step and can be stopped before it replaces the rollups"""
+        self.addCleanup(Transaction.drop_collection)
+        self.addCleanup(TransactionRollup.drop_collection)
+        Transaction(date=datetime(2024, 3, 1), description='Laptop', amount=Decimal('10.00'),
+                    type='expense', category='Office').save()
+        job = enqueue('rebuild_rollups')
+
+        Worker(['rebuild_rollups']).run(burst=True)
+
+        job = self.job(job)
+        assert job.status == 'succeeded'
+        assert job.progress == {'done': 2, 'total': 2, 'message': 'writing rollups'}
+
+        def stop(done, total, message):
+            if message == 'writing rollups':
+                raise JobCancelled
+        TransactionRollup.objects.delete()
+        with pytest.raises(JobCancelled):
+            rebuild_rollups(progress=stop)
+        assert TransactionRollup.objects.count() == 0
+
+
+class TestJobsAPI(JobTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.staff = User.objects.create_user(username='operator', password='testpass123', is_staff=True)
+        self.user = User.objects.create_user(username='viewer', password='testpass123')
+
+    def test_queue_and_follow_job(self):
+        """Test staff can queue a job and follow it to completion"""
+        self.client.force_authenticate(user=self.staff)
+        response = self.client.post('/api/jobs/', {'type': 'count', 'params': {'day': 1}}, format='json')
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response.data['status'] == 'queued'
+        assert response.data['created_by'] == 'operator'
+        assert response['Location'].endswith('/api/jobs/%s/' % response.data['id'])
+
+        Worker(['count']).run(burst=True)
+        detail = self.client.get(response['Location'])
+        assert detail.status_code == status.HTTP_200_OK
+        assert (detail.data['status'], detail.data['result']) == ('succeeded', {'counted': 3})
+
+        listed = self.client.get('/api/jobs/', {'status': 'succeeded'})
+        assert [job['id'] for job in listed.data] == [response.data['id']]
+
+    def test_queueing_needs_staff_and_a_known_type(self):
+        """Test only staff can queue and cancel, and only registered types"""
+        self.client.force_authenticate(user=self.user)
+        assert self.client.post('/api/jobs/', {'type': 'count'}, format='json').status_code == \
+            status.HTTP_403_FORBIDDEN
+
+        self.client.force_authenticate(user=self.staff)
+        response = self.client.post('/api/jobs/', {'type': 'rm -rf'}, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'type' in response.data
+
+    def test_cancel_job(self):
+        """Test DELETE cancels a queued job and refuses a finished one"""
+        self.client.force_authenticate(user=self.staff)
+        job = enqueue('count')
+
+        response = self.client.delete('/api/jobs/%s/' % job.id)
+        assert (response.status_code, response.data['status']) == (status.HTTP_202_ACCEPTED, 'cancelled')
+        assert self.client.delete('/api/jobs/%s/' % job.id).status_code == status.HTTP_409_CONFLICT
+        assert self.client.delete('/api/jobs/%s/' % ObjectId()).status_code == status.HTTP_404_NOT_FOUND
+        assert self.client.get('/api/jobs/nope/').status_code == status.HTTP_404_NOT_FOUND
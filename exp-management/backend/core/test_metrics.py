@@ -0,0 +1,162 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+from asgiref.sync import iscoroutinefunction
+from motor.frameworks.asyncio import run_on_executor
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from core import metrics
+from core.async_views import async_read_view
+from core.models import Customer
+from core.views import CustomerViewSet
+
+
+class TestHistogram:
+    def test_expose_cumulative_buckets(self):
+        """Test observations land in cumulative le buckets with sum and count"""
+        histogram = metrics.Histogram('demo_seconds', 'Demo.', (0.1, 1.0))
+        histogram.observe(('EmployeeViewSet', 'list'), 0.05)
+        histogram.observe(('EmployeeViewSet', 'list'), 0.1)
+        histogram.observe(('EmployeeViewSet', 'list'), 3.0)
+        
+        lines = histogram.expose()
+        assert lines[:2] == ['# HELP demo_seconds Demo.', '# TYPE demo_seconds histogram']
+        assert 'demo_seconds_bucket{viewset="EmployeeViewSet",action="list",le="0.1"} 2' in lines
+        assert 'demo_seconds_bucket{viewset="EmployeeViewSet",action="list",le="1.0"} 2' in lines
+        assert 'demo_seconds_bucket{viewset="EmployeeViewSet",action="list",le="+Inf"} 3' in lines
+        assert 'demo_seconds_count{viewset="EmployeeViewSet",action="list"} 3' in lines
+
+    def test_listener_records_only_inside_a_request(self):
+        """Test command events count towards the current request only"""
+        listener = metrics.MongoCommandListener()
+        event = SimpleNamespace(duration_micros=1500, command_name='find')
+        listener.succeeded(event)
+        
+        stats = metrics.RequestStats()
+        token = metrics._current.set(stats)
+        try:
+            listener.succeeded(event)
+            listener.failed(event)
+            with metrics.timed('serialize'):
+                pass
+        finally:
+            metrics._current.reset(token)
+        
+        assert stats.mongo_commands == 2
+        assert abs(stats.mongo_time - 0.003) < 1e-9
+        assert 'serialize' in stats.timings
+        header = metrics.server_timing(stats, 0.01)
+        assert header.startswith('db;dur=3.000;desc="2 commands", serialize;dur=')
+        assert header.endswith('total;dur=10.000')
+
+
+class TestPerformanceMetricsMiddleware(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        Customer(name="Metrics", email="metrics@example.com", company="Acme").save()
+        for histogram in metrics.HISTOGRAMS:
+            histogram.clear()
+
+    def tearDown(self):
+        Customer.objects.all().delete()
+
+    def test_disabled_by_default(self):
+        """Test no header or endpoint unless PERFORMANCE_METRICS is on"""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get('/api/customers/')
+        
+        assert 'Server-Timing' not in response
+        assert client.get('/metrics').status_code == status.HTTP_404_NOT_FOUND
+
+    @override_settings(PERFORMANCE_METRICS=True)
+    def test_server_timing_and_histograms(self):
+        """Test requests get a Server-Timing header and are counted per viewset and action"""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get('/api/customers/')
+        
+        assert response.status_code == status.HTTP_200_OK
+        timing = response['Server-Timing']
+        assert timing.startswith('db;dur=')
+        assert 'serialize;dur=' in timing
+        assert 'auth;dur=' in timing
+        
+        with override_settings(METRICS_TOKEN='scrape-secret'):
+            scrape = client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        assert scrape.status_code == status.HTTP_200_OK
+        assert scrape['Content-Type'].startswith('text/plain; version=0.0.4')
+        body = scrape.content.decode()
+        assert 'api_request_duration_seconds_count{viewset="CustomerViewSet",action="list"} 1' in body
+        assert 'api_request_serialize_seconds_count{viewset="CustomerViewSet",action="list"} 1' in body
+
+    @override_settings(PERFORMANCE_METRICS=True, METRICS_TOKEN='scrape-secret')
+    def test_metrics_need_token_or_staff(self):
+        """Test /metrics refuses anonymous and non-staff requests and wrong tokens"""
+        client = APIClient()
+        assert client.get('/metrics').status_code == status.HTTP_401_UNAUTHORIZED
+        assert client.get('/metrics', HTTP_AUTHORIZATION='Bearer guess').status_code == status.HTTP_401_UNAUTHORIZED
+        client.force_login(self.user)
+        assert client.get('/metrics').status_code == status.HTTP_401_UNAUTHORIZED
+        
+        self.user.is_staff = True
+        self.user.save()
+        assert client.get('/metrics').status_code == status.HTTP_200_OK
+        with override_settings(METRICS_TOKEN=''):
+            assert APIClient().get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code == \
+                status.HTTP_401_UNAUTHORIZED
+
+    @override_settings(PERFORMANCE_METRICS=True)
+    async def test_async_requests_are_not_adapted(self):
+        """Test ASGI requests are timed by awaiting the view, with labels from the resolved URL"""
+        async def view(request):
+            return HttpResponse()
+        middleware = metrics.PerformanceMetricsMiddleware(view)
+        assert iscoroutinefunction(middleware)
+        assert (await middleware(RequestFactory().get('/')))['Server-Timing'].startswith('db;dur=')
+        
+        response = await AsyncClient().get('/api/customers/')
+        assert 'Server-Timing' in response
+        assert 'api_request_duration_seconds_count{viewset="CustomerViewSet",action="list"} 1' in metrics.expose()
+
+    @override_settings(PERFORMANCE_METRICS=True)
+    async def test_async_reads_are_counted_once(self):
+        """Test a Motor read is counted by the command listener alone, as Motor carries the context"""
+        listener = metrics.MongoCommandListener()
+        collection = Customer._get_collection()
+
+        class Cursor:
+            def __init__(self, query):
+                self.query = query
+
+            def sort(self, *args):
+                return self
+
+            limit = sort
+
+            def fetch(self):
+                # pymongo publishes the command on Motor's executor thread
+                listener.succeeded(SimpleNamespace(duration_micros=1000, command_name='find'))
+                return list(collection.find(self.query))
+
+            async def to_list(self, length):
+                return await run_on_executor(asyncio.get_running_loop(), self.fetch)
+
+        motor_collection = SimpleNamespace(find=lambda query, **kwargs: Cursor(query))
+        motor_collection.with_options = lambda **kwargs: motor_collection
+        view = metrics.PerformanceMetricsMiddleware(async_read_view(CustomerViewSet.as_view({'get': 'list'})))
+        request = APIRequestFactory().get('/api/customers/')
+        force_authenticate(request, user=self.user)
+        with mock.patch('core.async_views.async_available', lambda alias: True), \
+                mock.patch('core.mongo.get_async_db', lambda alias: {collection.name: motor_collection}):
+            response = await view(request)
+        
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['results'][0]['name'] == 'Metrics'
+        assert 'desc="1 commands"' in response['Server-Timing']
@@ -1,6 +1,15 @@
 import pytest
-from core.models import Employee
-from core.serializers import EmployeeSerializer
+from datetime import datetime
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from bson import ObjectId
+from django.core.management import call_command
+from rest_framework.renderers import JSONRenderer
+from core.models import Employee, Transaction, Project
+from core.filters import indexed_fields
+from core.indexes import declared_indexes, index_plan, sync_indexes
+from core.serializers import EmployeeSerializer, TransactionSerializer, ProjectSerializer
 
 
 class TestEmployee:
@@ -67,3 +76,96 @@ class TestEmployee:
         assert 'email' in serializer.errors
         assert 'position' in serializer.errors
         assert 'department' in serializer.errors
+
+
+class TestRawSerialization:
+    def test_serialize_raw_matches_to_representation(self):
+        """Test the as_pymongo() fast path renders byte-identical JSON"""
+        transaction = Transaction(
+            date=datetime(2024, 5, 17, 9, 30),
+            description="Office chairs",
+            amount=Decimal('1249.5'),
+            type='expense',
+            category='Furniture'
+        ).save()
+        project = Project(name="Website", client="ABC Corp").save()
+        
+        try:
+            renderer = JSONRenderer()
+            for serializer_class, document in [(TransactionSerializer, transaction), (ProjectSerializer, project)]:
+                document = document.reload()
+                raw = type(document).objects(id=document.id).as_pymongo().first()
+                serializer = serializer_class()
+                expected = renderer.render(serializer_class(document).data)
+                assert renderer.render(serializer.serialize_raw(raw)) == expected
+        finally:
+            transaction.delete()
+            project.delete()
+
+    def test_serialize_raw_respects_field_subset(self):
+        """Test converters follow the fields kwarg"""
+        raw = {'_id': ObjectId(), 'amount': 12.5, 'description': 'Coffee'}
+        data = TransactionSerializer(fields=['id', 'amount']).serialize_raw(raw)
+        assert data == {'id': str(raw['_id']), 'amount': Decimal('12.50')}
+
+    def test_raw_converters_are_looked_up_once(self):
+        """Test a serializer reuses its converters for every row instead of rebuilding the cache key"""
+        serializer = TransactionSerializer()
+        converters = serializer.get_raw_converters()
+        with mock.patch.object(TransactionSerializer, 'fields', new_callable=mock.PropertyMock) as fields:
+            list(serializer.iter_serialize_raw([{'_id': ObjectId(), 'amount': 1.5}] * 3))
+        assert not fields.called
+        assert serializer.get_raw_converters() is converters
+
+
+class TestIndexSync:
+    def teardown_method(self):
+        Project.drop_collection()
+        Employee.drop_collection()
+
+    def test_declared_compound_and_partial_indexes(self):
+        """Test compound and partial index declarations are read from meta"""
+        declared = declared_indexes(Project)
+        
+        assert declared['status_1_start_date_1'] == ([('status', 1), ('start_date', 1)], {})
+        assert declared['client_1_start_date_1'] == (
+            [('client', 1), ('start_date', 1)], {'partialFilterExpression': {'status': 'active'}}
+        )
+        assert declared_indexes(Transaction)['type_1_date_-1__id_-1'][0] == [('type', 1), ('date', -1), ('_id', -1)]
+        # A partial index alone does not make a field filterable
+        assert indexed_fields(Project) == {'id', 'status', 'client', 'start_date', 'updated_at'}
+
+    def test_sync_builds_missing_and_drops_stale_on_request(self):
+        """Test syncing creates declared indexes and only drops extra ones when asked"""
+        Project.drop_collection()
+        collection = Project._get_collection()
+        collection.create_index([('name', 1)], name='name_1')
+        collection.create_index([('client', 1), ('start_date', 1)], name='client_1_start_date_1')
+        
+        declared, missing, changed, stale = index_plan(Project)
+        assert set(missing) == {
+            'status_1_start_date_1', 'client_1', 'start_date_1', 'name_text_client_text_description_text',
+            'updated_at_1__id_1'
+        }
+        assert changed == ['client_1_start_date_1']
+        assert stale == ['name_1']
+        
+        result = sync_indexes(Project)
+        assert set(result['created']) == set(missing)
+        assert result['dropped'] == []
+        assert 'name_1' in collection.index_information()
+        
+        result = sync_indexes(Project, drop_stale=True)
+        assert result['created'] == ['client_1_start_date_1']
+        assert set(result['dropped']) == {'name_1', 'client_1_start_date_1'}
+        
+        assert 'name_1' not in collection.index_information()
+        assert 'client_1_start_date_1' in collection.index_information()
+
+    def test_reseeding_keeps_indexes(self):
+        """Test seeding employees again leaves their indexes, the text index included"""
+        call_command('seed_employees', stdout=StringIO())
+        call_command('seed_employees', stdout=StringIO())
+        
+        assert Employee.objects.count() == 30
+        assert 'name_text_email_text' in Employee._get_collection().index_information()
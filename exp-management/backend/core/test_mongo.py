@@ -0,0 +1,51 @@
+import pytest
+import mongoengine
+from mongoengine.connection import get_connection
+from pymongo import ReadPreference
+from core.mongo import client_options, configure, read_actions_preference, reset_connections
+
+
+class TestConnectionManager:
+    def test_client_options_from_environment(self):
+        """Test pool, timeout and concern settings are parsed from MONGO_* variables"""
+        options = client_options({
+            'MONGO_MAX_POOL_SIZE': '50',
+            'MONGO_MIN_POOL_SIZE': '5',
+            'MONGO_SERVER_SELECTION_TIMEOUT_MS': '2000',
+            'MONGO_WRITE_CONCERN': 'majority',
+            'MONGO_READ_PREFERENCE': 'primaryPreferred',
+            'MONGO_RETRY_WRITES': 'false',
+            'MONGO_SOCKET_TIMEOUT_MS': '',
+        })
+        
+        assert options == {
+            'maxPoolSize': 50,
+            'minPoolSize': 5,
+            'serverSelectionTimeoutMS': 2000,
+            'w': 'majority',
+            'read_preference': ReadPreference.PRIMARY_PREFERRED,
+            'retryWrites': False,
+        }
+
+    def test_read_actions_preference(self):
+        """Test read-only actions can be routed to secondaries"""
+        assert read_actions_preference({}) is None
+        preference = read_actions_preference({'MONGO_READ_ACTIONS_PREFERENCE': 'secondaryPreferred'})
+        assert preference == ReadPreference.SECONDARY_PREFERRED
+
+    def test_configure_is_lazy_and_reset_reopens(self):
+        """Test clients are only created on use and replaced after a reset"""
+        alias = 'test-pool'
+        try:
+            options = configure(alias=alias, environ={'MONGO_MAX_POOL_SIZE': '7'},
+                                host='mongodb://localhost:27017/pool_test')
+            assert options['maxPoolSize'] == 7
+            assert options['connect'] is False
+            assert alias not in mongoengine.connection._connections
+            
+            client = get_connection(alias)
+            reset_connections()
+            assert alias not in mongoengine.connection._connections
+            assert get_connection(alias) is not client
+        finally:
+            mongoengine.disconnect(alias)
@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+from asgiref.sync import async_to_sync
+from bson import ObjectId
+from django.contrib.auth.models import User
+from django.test import AsyncClient, Client, TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.realtime import RESYNC, ChangeHub, MemorySource, get_hub
+
+
+def frame_data(frame):
+    event, data = frame.decode('utf-8').strip().split('\n')
+    return event[len('event: '):], json.loads(data[len('data: '):])
+
+
+class TestChangeHub:
+    def test_fan_out_filters_per_subscriber(self):
+        """Test one source feeds every subscriber the collections and operations it asked for"""
+        employee_id, project_id = ObjectId(), ObjectId()
+
+        async def scenario():
+            source = MemorySource()
+            hub = ChangeHub(source)
+            employees = hub.subscribe(collections=['employees'])
+            deletes = hub.subscribe(operations=['delete'])
+            source.put('employees', 'insert', employee_id, {'_id': employee_id, 'name': 'Nguyễn Văn An'})
+            source.put('projects', 'delete', project_id)
+            await asyncio.sleep(0.01)
+            frames = ([employees.queue.get_nowait() for _ in range(employees.queue.qsize())],
+                      [deletes.queue.get_nowait() for _ in range(deletes.queue.qsize())])
+            hub.unsubscribe(employees)
+            hub.unsubscribe(deletes)
+            return frames, source.started
+
+        (employee_frames, delete_frames), started = async_to_sync(scenario)()
+        
+        assert started == 1
+        event, data = frame_data(employee_frames[0])
+        assert len(employee_frames) == 1
+        assert (event, data['operation'], data['id']) == ('change', 'insert', str(employee_id))
+        assert data['document']['name'] == 'Nguyễn Văn An'
+        assert [frame_data(frame)[1] for frame in delete_frames] == [
+            {'collection': 'projects', 'operation': 'delete', 'id': str(project_id)}
+        ]
+
+    def test_slow_subscriber_gets_resync(self):
+        """Test a full queue is replaced by one resync event without touching other subscribers"""
+        async def scenario():
+            hub = ChangeHub(MemorySource())
+            hub.queue_size = 2
+            slow = hub.subscribe()
+            hub.queue_size = 10
+            fast = hub.subscribe()
+            for _ in range(3):
+                hub.publish({'collection': 'assets', 'operation': 'delete', 'id': ObjectId()})
+            result = (slow.queue.qsize(), slow.queue.get_nowait(), slow.overflows, fast.queue.qsize())
+            hub.unsubscribe(slow)
+            hub.unsubscribe(fast)
+            return result
+
+        assert async_to_sync(scenario)() == (1, RESYNC, 1, 3)
+
+    def test_source_stops_with_last_subscriber(self):
+        """Test the source task ends once nobody listens"""
+        async def scenario():
+            hub = ChangeHub(MemorySource())
+            subscription = hub.subscribe()
+            task = hub._task
+            hub.unsubscribe(subscription)
+            await asyncio.sleep(0)
+            return len(hub), task.cancelled() or task.cancelling()
+
+        assert async_to_sync(scenario)() == (0, True)
+
+
+class TestEventsView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='watcher', password='testpass123')
+        self.token = str(AccessToken.for_user(self.user))
+
+    @override_settings(REALTIME_STREAM_SECONDS=0.5)
+    async def test_stream_delivers_changes(self):
+        """Test an authenticated client receives matching changes as server-sent events"""
+        source = MemorySource()
+        get_hub().source = source
+        response = await AsyncClient().get('/api/events/', {'collections': 'customers', 'access_token': self.token})
+        
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'text/event-stream'
+        stream = response.streaming_content.__aiter__()
+        assert await stream.__anext__() == b'retry: 3000\n\n'
+        
+        customer_id = ObjectId()
+        source.put('employees', 'delete', ObjectId())
+        source.put('customers', 'update', customer_id, {'_id': customer_id, 'name': 'Acme'})
+        event, data = frame_data(await asyncio.wait_for(stream.__anext__(), 1))
+        assert (event, data['collection'], data['document']['name']) == ('change', 'customers', 'Acme')
+        
+        # The stream ends after its lifetime and leaves the hub
+        rest = [frame async for frame in stream]
+        assert set(rest) <= {b': keep-alive\n\n'}
+        assert len(get_hub()) == 0
+
+    async def test_rejects_bad_tokens_and_filters(self):
+        """Test the stream checks credentials and known collections"""
+        client = AsyncClient()
+        assert (await client.get('/api/events/', {'access_token': 'forged'})).status_code == 401
+        response = await client.get('/api/events/', {'collections': 'users', 'access_token': self.token})
+        assert response.status_code == 400
+
+    def test_wsgi_is_refused(self):
+        """Test the synchronous server answers 501 instead of tying up a worker"""
+        assert Client().get('/api/events/').status_code == 501
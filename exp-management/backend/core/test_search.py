@@ -0,0 +1,224 @@
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+from bson import ObjectId
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.request import Request
+
+from core import search
+from core.filters import IndexedQueryFilter
+from core.models import Customer, Employee, Tombstone
+from core.pagination import MongoCursorPagination
+from core.search import PrefixIndex, fold, get_index, index_documents, reset_indexes, tokenize
+from core.views import CustomerViewSet, EmployeeViewSet, SearchView, TransactionViewSet
+
+
+class TestFolding:
+    def test_fold_strips_vietnamese_diacritics(self):
+        """Test accents and đ fold to plain lowercase letters"""
+        assert fold('Nguyễn Văn An') == 'nguyen van an'
+        assert fold('Đặng Thị Xuân') == 'dang thi xuan'
+        assert fold('Trương Văn Đức') == 'truong van duc'
+
+    def test_tokenize_splits_emails(self):
+        """Test emails split into searchable words"""
+        assert tokenize('an.nguyen@company.com') == ['an', 'nguyen', 'company', 'com']
+        assert tokenize(None) == []
+
+
+class TestPrefixIndex:
+    def make_index(self):
+        index = PrefixIndex(('name', 'email'))
+        self.ids = [ObjectId() for _ in range(4)]
+        index.add({'_id': self.ids[0], 'name': 'Nguyễn Văn An', 'email': 'an.nguyen@company.com'})
+        index.add({'_id': self.ids[1], 'name': 'Nguyễn Thị Quỳnh', 'email': 'quynh.nguyen@company.com'})
+        index.add({'_id': self.ids[2], 'name': 'Ngô Văn Việt', 'email': 'viet.ngo@company.com'})
+        index.add({'_id': self.ids[3], 'name': 'Trần Văn Rồng', 'email': 'an.tran@company.com'})
+        return index
+
+    def test_prefix_terms_and_ranking(self):
+        """Test every term must prefix a token and exact name words rank first"""
+        index = self.make_index()
+        
+        matches, exact, hits = index.search('nguyen', 10)
+        assert (matches, exact) == (2, True)
+        assert [document_id for _, document_id in hits] == [self.ids[1], self.ids[0]]
+        
+        # "an" is a whole name word of the first document but only an email word of the last
+        matches, exact, hits = index.search('van an', 10)
+        assert [document_id for _, document_id in hits] == [self.ids[0], self.ids[3]]
+        assert hits[0][0] > hits[1][0]
+        
+        assert index.search('ng', 10)[0] == 3
+        assert index.search('nguyen zz', 10) == (0, True, [])
+
+    def test_replace_and_discard(self):
+        """Test re-adding a document replaces its tokens and discarding removes it"""
+        index = self.make_index()
+        index.add({'_id': self.ids[0], 'name': 'Lê Văn Cường', 'email': 'cuong.le@company.com'})
+        index.discard(self.ids[1])
+        
+        assert index.search('nguyen', 10)[0] == 0
+        assert [document_id for _, document_id in index.search('cuong', 10)[2]] == [self.ids[0]]
+        assert len(index) == 3
+
+    def test_broad_query_stops_early(self):
+        """Test a query matching more than the limit reads only what it needs"""
+        index = PrefixIndex(('name',))
+        ids = [ObjectId() for _ in range(50)]
+        for document_id in ids:
+            index.add({'_id': document_id, 'name': 'Nguyễn Văn An'})
+        
+        matches, exact, hits = index.search('n', 5)
+        assert not exact
+        assert [document_id for _, document_id in hits] == ids[::-1][:5]
+
+
+class TestSearchView(TestCase):
+    def setUp(self):
+        reset_indexes()
+        call_command('seed_employees', stdout=None)
+        Customer(name='Nguyễn Hoàng Long', email='long@acme.vn', company='Acme').save()
+        for viewset in SearchView.viewsets.values():
+            get_index(viewset.model, viewset.search_fields, wait=True)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='searcher', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        reset_indexes()
+        Employee.drop_collection()
+        Customer.drop_collection()
+
+    def test_search_folds_diacritics_and_ranks(self):
+        """Test "nguyen" finds the seeded Nguyễn employees and the customer"""
+        response = self.client.get('/api/search/', {'q': 'nguyen'})
+        
+        assert response.status_code == status.HTTP_200_OK
+        names = [item['object']['name'] for item in response.data['results']]
+        assert 'Nguyễn Văn An' in names
+        assert 'Nguyễn Hoàng Long' in names
+        assert response.data['count_exact']
+        assert {item['type'] for item in response.data['results']} == {'employee', 'customer'}
+        
+        response = self.client.get('/api/search/', {'q': 'nguyen van an', 'types': 'employee'})
+        assert response.data['results'][0]['object']['name'] == 'Nguyễn Văn An'
+        
+        response = self.client.get('/api/search/', {'q': 'dang'})
+        assert {item['object']['name'] for item in response.data['results']} == {'Đặng Văn Giang', 'Đặng Thị Xuân'}
+
+    def test_search_pages(self):
+        """Test results page with page and page_size"""
+        first = self.client.get('/api/search/', {'q': 'v', 'types': 'employee', 'page_size': 5})
+        second = self.client.get(first.data['next'])
+        
+        assert len(first.data['results']) == 5
+        assert first.data['previous'] is None
+        assert second.data['previous'] is not None
+        first_ids = {item['object']['id'] for item in first.data['results']}
+        assert not first_ids & {item['object']['id'] for item in second.data['results']}
+
+    def test_writes_update_the_index(self):
+        """Test created and deleted documents show up in search at once"""
+        assert self.client.get('/api/search/', {'q': 'phuong'}).data['count'] == 1
+        
+        response = self.client.post('/api/employees/', {
+            'name': 'Võ Thị Phượng', 'email': 'phuong.vo@company.com',
+            'position': 'Tester', 'department': 'IT'
+        }, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        assert self.client.get('/api/search/', {'q': 'phuong'}).data['count'] == 2
+        
+        self.client.delete('/api/employees/%s/' % response.data['id'])
+        assert self.client.get('/api/search/', {'q': 'phuong'}).data['count'] == 1
+
+    def test_reseeding_is_tracked(self):
+        """Test seeding again tombstones the old employees and refreshes cached lists and the index"""
+        self.addCleanup(Tombstone.drop_collection)
+        before = self.client.get('/api/employees/').data['results'][0]['id']
+        assert self.client.get('/api/search/', {'q': 'phuong'}).data['count'] == 1
+        
+        call_command('seed_employees', stdout=None)
+        
+        assert self.client.get('/api/employees/').data['results'][0]['id'] != before
+        response = self.client.get('/api/search/', {'q': 'phuong'})
+        assert response.data['count'] == 1
+        assert response.data['results'][0]['object']['id'] == str(Employee.objects.get(name='Ngô Thị Phương').id)
+        assert Tombstone.objects(collection='employees').count() == 30
+
+    def test_first_build_runs_in_the_background(self):
+        """Test a worker's first search does not wait for the index, and writes made meanwhile are kept"""
+        reset_indexes()
+        release = threading.Event()
+        build_index = search.build_index
+
+        def slow_build(model, fields):
+            release.wait(5)
+            return build_index(model, fields)
+
+        with mock.patch('core.search.build_index', slow_build):
+            assert get_index(Employee, EmployeeViewSet.search_fields) is None
+            index_documents(Employee, added=[{'_id': ObjectId(), 'name': 'Võ Thị Phượng'}])
+            release.set()
+            index = get_index(Employee, EmployeeViewSet.search_fields, wait=True)
+        
+        assert index.search('phuong', 10)[0] == 2
+
+    def test_invalid_parameters(self):
+        """Test an empty query, unknown types and bad pages are rejected"""
+        assert self.client.get('/api/search/', {'q': '  '}).status_code == status.HTTP_400_BAD_REQUEST
+        assert self.client.get('/api/search/', {'q': 'an', 'types': 'transaction'}).status_code == \
+            status.HTTP_400_BAD_REQUEST
+        assert self.client.get('/api/search/', {'q': 'an', 'page': '0'}).status_code == status.HTTP_400_BAD_REQUEST
+
+
+class TestTextSearchFilter:
+    def filter(self, viewset_class, params):
+        request = Request(APIRequestFactory().get('/', params))
+        view = viewset_class()
+        view.request = request
+        return IndexedQueryFilter().filter_queryset(request, viewset_class.model.objects, view)
+
+    def test_q_uses_the_text_index(self):
+        """Test ?q= becomes a $text query on searchable views"""
+        queryset = self.filter(CustomerViewSet, {'q': 'nguyen', 'status': 'lead'})
+        
+        assert queryset._query['$text'] == {'$search': 'nguyen'}
+        assert queryset._query['status'] == 'lead'
+
+    def test_q_ranks_by_relevance(self):
+        """Test ?q= lists come best match first, in pages by offset, unless ?ordering= is given"""
+        paginator = MongoCursorPagination()
+        view = SimpleNamespace(get_ordering=lambda: IndexedQueryFilter().get_ordering(request, view),
+                               ordering_fields=CustomerViewSet.ordering_fields,
+                               search_fields=CustomerViewSet.search_fields, model=Customer)
+        request = Request(APIRequestFactory().get('/api/customers/', {'q': 'nguyen', 'page_size': 2}))
+        queryset = paginator.prepare_queryset(Customer.objects.search_text('nguyen'), request, view)
+        
+        assert queryset._ordering == [('_text_score', {'$meta': 'textScore'}), ('_id', -1)]
+        assert queryset._limit == 3
+        rows = [{'_id': ObjectId(), '_text_score': score} for score in (3.0, 2.5, 2.0, 1.5, 1.0)]
+        assert paginator.paginate_rows(rows[:3]) == rows[:2]
+        assert paginator.get_previous_link() is None
+        
+        request = Request(APIRequestFactory().get(paginator.get_next_link()))
+        queryset = paginator.prepare_queryset(Customer.objects.search_text('nguyen'), request, view)
+        assert queryset._limit == 5
+        assert paginator.paginate_rows(paginator.merge_rows(rows[::2], rows[1::2])) == rows[2:4]
+        assert paginator.decode_cursor(Request(APIRequestFactory().get(paginator.get_previous_link())))['p'] == [0]
+        
+        request = Request(APIRequestFactory().get('/api/customers/', {'q': 'nguyen', 'ordering': 'email'}))
+        assert paginator.get_ordering(view) == ('email', 'id')
+
+    def test_q_rejected_without_search_fields(self):
+        """Test ?q= is rejected on views with nothing to search"""
+        with pytest.raises(ValidationError) as exc_info:
+            self.filter(TransactionViewSet, {'q': 'rent'})
+        assert 'q' in exc_info.value.detail
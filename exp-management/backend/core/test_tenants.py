@@ -0,0 +1,187 @@
+from datetime import datetime
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+import mongomock
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from mongoengine.connection import get_db
+
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from core.async_views import async_read_view
+from core.cache import get_response_cache
+from core.jobs import Worker
+from core.models import Job, Transaction, TransactionRollup
+from core.tenants import TenantMiddleware, current_tenant, using_tenant
+from core.views import TransactionViewSet
+
+TENANTS = {
+    'acme': {'host': 'mongodb://node-a', 'db': 'acme', 'mongo_client_class': mongomock.MongoClient,
+             'hostnames': ['acme.example.com']},
+    'globex': {'host': 'mongodb://node-b', 'db': 'globex', 'mongo_client_class': mongomock.MongoClient,
+               'hostnames': ['globex.example.com']},
+}
+
+
+@override_settings(MONGO_TENANTS=TENANTS)
+class TenantTestCase(TestCase):
+    def setUp(self):
+        get_response_cache().backend.clear()
+        self.user = User.objects.create_user(username='accountant', password='testpass123')
+        self.user.groups.add(Group.objects.create(name='tenant:acme'))
+
+    def tearDown(self):
+        Job.drop_collection()
+        get_response_cache().backend.clear()
+        for tenant in TENANTS:
+            database = get_db('tenant:' + tenant)
+            database.client.drop_database(database.name)
+
+    def client_for(self, host):
+        client = APIClient(HTTP_HOST=host)
+        client.force_authenticate(user=self.user)
+        return client
+
+    def create(self, client, description):
+        response = client.post('/api/transactions/', {
+            'date': '2024-03-01T09:00:00Z', 'description': description, 'amount': '10.00',
+            'type': 'expense', 'category': 'Office',
+        }, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        return response.data
+
+    def descriptions(self, client):
+        response = client.get('/api/transactions/')
+        assert response.status_code == status.HTTP_200_OK
+        return [row['description'] for row in response.data['results']]
+
+
+class TestRouting(TenantTestCase):
+    def test_hosts_see_only_their_tenant(self):
+        """Test each host reads and writes its own tenant's database, and unknown hosts are refused"""
+        acme, globex = self.client_for('acme.example.com'), self.client_for('globex.example.com')
+        created = self.create(acme, 'Acme laptop')
+        self.create(globex, 'Globex desk')
+
+        assert self.descriptions(acme) == ['Acme laptop']
+        assert self.descriptions(globex) == ['Globex desk']
+        assert globex.get('/api/transactions/%s/' % created['id']).status_code == status.HTTP_404_NOT_FOUND
+        with using_tenant('acme'):
+            assert Transaction._get_db().name == 'acme'
+            assert Transaction.objects.count() == 1
+        response = self.client_for('testserver').get('/api/transactions/')
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    async def test_middleware_stays_async(self):
+        """Test ASGI requests get their tenant without being adapted to a thread"""
+        async def view(request):
+            return HttpResponse(current_tenant())
+        middleware = TenantMiddleware(view)
+        assert iscoroutinefunction(middleware)
+        response = await middleware(RequestFactory().get('/', HTTP_HOST='globex.example.com'))
+        assert response.content == b'globex'
+        assert current_tenant() is None
+
+    def test_response_cache_is_per_tenant(self):
+        """Test a cached list of one tenant is never served to another"""
+        acme, globex = self.client_for('acme.example.com'), self.client_for('globex.example.com')
+        self.create(acme, 'Acme laptop')
+        assert self.descriptions(acme) == ['Acme laptop']
+        assert self.descriptions(globex) == []
+
+
+class TestTokens(TenantTestCase):
+    def login(self, host='testserver', **body):
+        return APIClient(HTTP_HOST=host).post('/api/auth/login/', dict(
+            {'username': 'accountant', 'password': 'testpass123'}, **body), format='json')
+
+    def test_async_reads_use_the_tenant_alias(self):
+        """Test ASGI reads pick Motor by the tenant's alias, from the host or the token claim"""
+        with using_tenant('acme'):
+            Transaction(date=datetime(2024, 3, 1), description='Acme laptop', amount=Decimal('10.00'),
+                        type='expense', category='Office').save()
+        aliases = []
+
+        async def find_async(queryset, alias):
+            aliases.append(alias)
+            return list(queryset)
+
+        view = TenantMiddleware(async_read_view(TransactionViewSet.as_view({'get': 'list'})))
+        factory = APIRequestFactory()
+        # Only acme's node is reachable through Motor here
+        with mock.patch('core.async_views.async_available', lambda alias: alias == 'tenant:acme'), \
+                mock.patch('core.async_views.find_async', find_async):
+            request = factory.get('/api/transactions/', HTTP_HOST='acme.example.com')
+            force_authenticate(request, user=self.user)
+            assert async_to_sync(view)(request).data['results'][0]['description'] == 'Acme laptop'
+
+            request = factory.get('/api/transactions/', HTTP_HOST='globex.example.com')
+            force_authenticate(request, user=self.user)
+            assert async_to_sync(view)(request).data['results'] == []
+
+            access = self.login().data['access']
+            request = factory.get('/api/transactions/', HTTP_AUTHORIZATION='Bearer %s' % access)
+            assert async_to_sync(view)(request).data['results'][0]['description'] == 'Acme laptop'
+        assert aliases == ['tenant:acme', 'tenant:acme']
+
+    def test_token_claim_selects_tenant(self):
+        """Test a login token carries the user's tenant and routes requests on shared hosts"""
+        response = self.login()
+        assert response.status_code == status.HTTP_200_OK
+        with using_tenant('acme'):
+            Transaction(date=datetime(2024, 3, 1), description='Acme laptop', amount=Decimal('10.00'),
+                        type='expense', category='Office').save()
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer %s' % response.data['access'])
+        assert self.descriptions(client) == ['Acme laptop']
+
+        client = APIClient(HTTP_HOST='globex.example.com')
+        client.credentials(HTTP_AUTHORIZATION='Bearer %s' % response.data['access'])
+        assert client.get('/api/transactions/').status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_login_needs_membership(self):
+        """Test users cannot log in to tenants they are not members of"""
+        assert self.login(tenant='globex').status_code == status.HTTP_401_UNAUTHORIZED
+        assert self.login(host='globex.example.com').status_code == status.HTTP_401_UNAUTHORIZED
+        assert self.login(host='acme.example.com', tenant='globex').status_code == status.HTTP_401_UNAUTHORIZED
+        assert self.login(host='acme.example.com').status_code == status.HTTP_200_OK
+
+
+class TestMaintenance(TenantTestCase):
+    def test_jobs_run_as_their_tenant(self):
+        """Test a queued job runs against the tenant that queued it"""
+        self.user.is_staff = True
+        self.user.save()
+        acme = self.client_for('acme.example.com')
+        self.create(acme, 'Acme laptop')
+        response = acme.post('/api/jobs/', {'type': 'rebuild_rollups'}, format='json')
+        assert response.status_code == status.HTTP_202_ACCEPTED
+
+        Worker(['rebuild_rollups']).run(burst=True)
+
+        assert Job.objects.get(id=response.data['id']).tenant == 'acme'
+        with using_tenant('acme'):
+            assert TransactionRollup.objects.count() > 0
+        with using_tenant('globex'):
+            assert TransactionRollup.objects.count() == 0
+        assert self.client_for('globex.example.com').get(
+            '/api/jobs/%s/' % response.data['id']).status_code == status.HTTP_404_NOT_FOUND
+
+    def test_commands_run_per_tenant(self):
+        """Test maintenance commands go over every tenant, or those given"""
+        out = StringIO()
+        call_command('sync_indexes', 'transactions', 'jobs', stdout=out)
+        assert 'acme/transactions: built' in out.getvalue()
+        assert 'globex/transactions: built' in out.getvalue()
+        # Jobs are shared by every tenant
+        assert 'acme/jobs' not in out.getvalue() and '\njobs: built' in '\n' + out.getvalue()
+        out = StringIO()
+        call_command('rebuild_rollups', '--tenant', 'globex', stdout=out)
+        assert out.getvalue().strip() == 'Rebuilt 0 rollup buckets of globex'
@@ -0,0 +1,141 @@
+from datetime import datetime
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.archive import archive_collection
+from core.cache import get_response_cache
+from core.diagnostics import plan_summary
+from core.indexes import declared_indexes, sync_indexes
+from core.models import Transaction
+from core.mongo import async_available
+from core.timeseries import LEGACY_SUFFIX, create_timeseries, migrate
+
+
+def plain_collection(database, name):
+    # mongomock has no time-series collections
+    return database.create_collection(name)
+
+
+class TimeseriesTestCase(TestCase):
+    def setUp(self):
+        get_response_cache().backend.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='accountant', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        collection = Transaction._get_collection()
+        collection.drop()
+        collection.database[collection.name + LEGACY_SUFFIX].drop()
+        archive_collection(Transaction).drop()
+        get_response_cache().backend.clear()
+
+    def raw(self, transaction_id):
+        return Transaction._get_collection().find_one({'_id': transaction_id})
+
+
+class TestMeta(TimeseriesTestCase):
+    def test_writes_keep_meta_in_step(self):
+        """Test created and edited transactions carry their type and category in meta"""
+        response = self.client.post('/api/transactions/', {
+            'date': '2024-03-01T09:00:00Z', 'description': 'Laptop', 'amount': '1200.00',
+            'type': 'expense', 'category': 'Office',
+        }, format='json')
+        transaction = Transaction.objects.get(id=response.data['id'])
+        assert self.raw(transaction.id)['meta'] == {'type': 'expense', 'category': 'Office'}
+
+        self.client.patch('/api/transactions/%s/' % transaction.id, {'category': 'Software'}, format='json')
+        assert self.raw(transaction.id)['meta'] == {'type': 'expense', 'category': 'Software'}
+
+    def test_timeseries_indexes(self):
+        """Test indexes led by type or category are keyed on meta in time-series mode"""
+        assert 'type_1_date_-1__id_-1' in declared_indexes(Transaction)
+        with override_settings(TRANSACTIONS_TIMESERIES=True):
+            declared = declared_indexes(Transaction)
+        assert {'meta_1_date_1', 'meta.type_1_date_-1__id_-1', 'meta.category_1_date_-1__id_-1'} <= set(declared)
+        assert 'type_1_date_-1__id_-1' not in declared
+        assert declared['_id_1'] == ([('_id', 1)], {})
+
+    @skipUnless(async_available(), 'MongoDB is mocked')
+    @override_settings(TRANSACTIONS_TIMESERIES=True)
+    def test_lookups_by_id_use_an_index(self):
+        """Test by-id reads of a time-series collection scan the _id index rather than every bucket"""
+        collection = Transaction._get_collection()
+        create_timeseries(collection.database, collection.name)
+        sync_indexes(Transaction)
+        transaction = Transaction(date=datetime(2024, 3, 1), description='Laptop', amount=Decimal('10.00'),
+                                  type='expense', category='Office').save()
+
+        assert plan_summary(collection.find({'_id': transaction.id}).explain()) == 'IXSCAN _id_1'
+
+
+@override_settings(TRANSACTIONS_TIMESERIES=True)
+class TestTimeseriesViews(TimeseriesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.transactions = [
+            Transaction(date=datetime(2024, 1, day), description='Day %d' % day, amount=Decimal('10.00'),
+                        type=kind, category='Office').save()
+            for day, kind in ((1, 'expense'), (2, 'income'), (3, 'expense'))
+        ]
+
+    def test_filters_read_meta(self):
+        """Test type filters are repeated on meta and still find the same transactions"""
+        response = self.client.get('/api/transactions/?type=expense')
+        assert [row['description'] for row in response.data['results']] == ['Day 3', 'Day 1']
+
+    def test_writes_without_find_and_modify(self):
+        """Test updates and deletes go through the versioned read-then-write path"""
+        collection = Transaction._get_collection()
+        url = '/api/transactions/%s/' % self.transactions[0].id
+        with mock.patch.object(collection.__class__, 'find_one_and_update', side_effect=AssertionError), \
+                mock.patch.object(collection.__class__, 'find_one_and_delete', side_effect=AssertionError):
+            response = self.client.patch(url, {'amount': '12.00'}, format='json', HTTP_IF_MATCH='"v0"')
+            assert (response.status_code, response['ETag']) == (status.HTTP_200_OK, '"v1"')
+            response = self.client.patch(url, {'amount': '15.00'}, format='json', HTTP_IF_MATCH='"v0"')
+            assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+            assert self.client.delete(url, HTTP_IF_MATCH='"v1"').status_code == status.HTTP_204_NO_CONTENT
+        assert self.raw(self.transactions[0].id) is None
+
+
+@override_settings(TRANSACTIONS_TIMESERIES=True)
+@mock.patch('core.timeseries.create_timeseries', plain_collection)
+@mock.patch('core.timeseries.is_timeseries', lambda collection: False)
+class TestMigrate(TimeseriesTestCase):
+    def setUp(self):
+        super().setUp()
+        # Stored before meta existed
+        Transaction._get_collection().insert_many([
+            {'date': datetime(2024, 1, day), 'description': 'Day %d' % day, 'amount': '10.00',
+             'type': 'expense', 'category': 'Office', 'version': 0}
+            for day in (1, 2, 3)
+        ])
+        self.ids = [row['_id'] for row in Transaction._get_collection().find().sort('_id', 1)]
+
+    def test_copies_in_batches_with_meta(self):
+        """Test every transaction is copied into the new collection with its meta"""
+        progress = []
+        assert migrate(batch_size=2, progress=progress.append) == 3
+        assert progress == [2, 3]
+        rows = list(Transaction._get_collection().find().sort('_id', 1))
+        assert [row['_id'] for row in rows] == self.ids
+        assert all(row['meta'] == {'type': 'expense', 'category': 'Office'} for row in rows)
+        assert Transaction._get_collection().index_information().keys() >= {'meta_1_date_1'}
+
+    def test_resumes_after_interruption(self):
+        """Test a rerun copies only what a stopped run had not, and skips transactions written since"""
+        collection = Transaction._get_collection()
+        legacy = collection.database[collection.name + LEGACY_SUFFIX]
+        collection.rename(legacy.name)
+        collection.insert_one(legacy.find_one({'_id': self.ids[0]}))
+        Transaction(date=datetime(2024, 2, 1), description='Written since', amount=Decimal('5.00'),
+                    type='income', category='Sales').save()
+
+        assert migrate() == 2
+        assert collection.count_documents({}) == 4
+        assert migrate() == 0
@@ -1,10 +1,21 @@
+import asyncio
 import pytest
 import json
-from django.test import TestCase
+from datetime import datetime
+from decimal import Decimal
+from unittest import skipUnless
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
 from rest_framework import status
-from core.models import Employee
+from core.models import Employee, Project, Tombstone, Transaction, TransactionRollup
+from core.summaries import rebuild_rollups
+from core.cache import LocMemResponseCache, get_response_cache
+from core.async_views import async_read_urls, async_read_view
+from core.mongo import async_available
+from core.urls import router
+from core.views import TransactionViewSet
 
 
 class TestEmployeeViewSet(TestCase):
@@ -92,3 +103,567 @@ class TestEmployeeViewSet(TestCase):
         
         response = self.client.delete(f'/api/employees/{self.employee.id}/')
         assert response.status_code == status.HTTP_204_NO_CONTENT
+
+
+class TestTransactionPagination(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        
+        # Two transactions share a date so the id tiebreaker is exercised
+        self.transactions = []
+        for day in [1, 2, 2, 3, 4]:
+            transaction = Transaction(
+                date=datetime(2024, 1, day),
+                description=f"Transaction {day}",
+                amount=Decimal('100.00'),
+                type='expense',
+                category='Office'
+            )
+            transaction.save()
+            self.transactions.append(transaction)
+
+    def tearDown(self):
+        Transaction.objects.all().delete()
+
+    def test_transaction_list_walks_pages_with_cursor(self):
+        """Test following next links visits every transaction once, newest first"""
+        seen = []
+        url = '/api/transactions/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            assert len(response.data['results']) <= 2
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        
+        expected = sorted(self.transactions, key=lambda t: (t.date, t.id), reverse=True)
+        assert seen == [str(t.id) for t in expected]
+
+    def test_transaction_list_previous_link(self):
+        """Test the previous link returns the page before the cursor"""
+        first = self.client.get('/api/transactions/?page_size=2')
+        second = self.client.get(first.data['next'])
+        assert first.data['previous'] is None
+        
+        back = self.client.get(second.data['previous'])
+        assert back.status_code == status.HTTP_200_OK
+        assert back.data['results'] == first.data['results']
+        assert back.data['previous'] is None
+
+    def test_transaction_list_invalid_cursor(self):
+        """Test a malformed cursor is rejected"""
+        response = self.client.get('/api/transactions/?cursor=not-a-cursor')
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+class TestTransactionQueryParams(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        
+        for day, kind, category in [(1, 'income', 'Sales'), (5, 'expense', 'Office'),
+                                    (10, 'expense', 'Travel'), (15, 'expense', 'Office')]:
+            Transaction(
+                date=datetime(2024, 3, day),
+                description=f"{category} {day}",
+                amount=Decimal('50.00'),
+                type=kind,
+                category=category
+            ).save()
+
+    def tearDown(self):
+        Transaction.objects.all().delete()
+
+    def test_transaction_filter_by_type_and_date(self):
+        """Test indexed filters are combined into one query"""
+        response = self.client.get('/api/transactions/?type=expense&date__gte=2024-03-06')
+        assert response.status_code == status.HTTP_200_OK
+        assert [item['description'] for item in response.data['results']] == ['Office 15', 'Travel 10']
+
+    def test_transaction_filter_in_lookup(self):
+        """Test comma separated values for the in lookup"""
+        response = self.client.get('/api/transactions/?category__in=Sales,Travel')
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['results']) == 2
+
+    def test_transaction_filter_without_index_rejected(self):
+        """Test filters on fields without an index are rejected"""
+        response = self.client.get('/api/transactions/?amount=50')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'amount' in response.data
+
+    def test_transaction_filter_invalid_choice(self):
+        """Test filter values are validated like serializer input"""
+        response = self.client.get('/api/transactions/?type=refund')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_transaction_ordering_and_projection(self):
+        """Test ascending ordering and field projection"""
+        response = self.client.get('/api/transactions/?ordering=date&fields=id,description')
+        assert response.status_code == status.HTTP_200_OK
+        results = response.data['results']
+        assert [item['description'] for item in results] == ['Sales 1', 'Office 5', 'Travel 10', 'Office 15']
+        assert set(results[0]) == {'id', 'description'}
+
+    def test_transaction_ordering_not_allowed(self):
+        """Test ordering on a field outside ordering_fields is rejected"""
+        response = self.client.get('/api/transactions/?ordering=amount')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+class TestTransactionExport(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        
+        for day in range(1, 8):
+            Transaction(
+                date=datetime(2024, 4, day),
+                description=f"Transaction {day}",
+                amount=Decimal('10.00'),
+                type='income' if day % 2 else 'expense',
+                category='Sales'
+            ).save()
+
+    def tearDown(self):
+        Transaction.objects.all().delete()
+
+    def test_transaction_export_ndjson(self):
+        """Test NDJSON export streams one document per line"""
+        response = self.client.get('/api/transactions/export/?format=ndjson&type=income')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming
+        assert response['Content-Type'].startswith('application/x-ndjson')
+        
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        rows = [json.loads(line) for line in lines]
+        assert len(rows) == 4
+        assert all(row['type'] == 'income' for row in rows)
+
+    def test_transaction_export_json_array(self):
+        """Test the default export is one JSON array of every document"""
+        response = self.client.get('/api/transactions/export/')
+        assert response.status_code == status.HTTP_200_OK
+        
+        rows = json.loads(b''.join(response.streaming_content))
+        assert [row['description'] for row in rows][:2] == ['Transaction 7', 'Transaction 6']
+        assert len(rows) == 7
+
+
+class TestEmployeeBulk(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        Employee.objects.all().delete()
+
+    def _employee(self, number, email=None):
+        return {
+            'name': f'Employee {number}',
+            'email': email or f'employee{number}@example.com',
+            'position': 'Developer',
+            'department': 'IT'
+        }
+
+    def test_bulk_create(self):
+        """Test a valid batch is inserted and every item gets an id"""
+        items = [self._employee(number) for number in range(3)]
+        response = self.client.post('/api/employees/bulk/', items, format='json')
+        
+        assert response.status_code == status.HTTP_201_CREATED
+        assert [item['status'] for item in response.data['results']] == [201, 201, 201]
+        assert Employee.objects.count() == 3
+
+    def test_bulk_create_unordered_partial_failure(self):
+        """Test unordered batches write valid items and report invalid ones"""
+        items = [self._employee(0), self._employee(1, email='invalid-email'), self._employee(2)]
+        response = self.client.post('/api/employees/bulk/', {'items': items, 'ordered': False}, format='json')
+        
+        assert response.status_code == status.HTTP_207_MULTI_STATUS
+        results = response.data['results']
+        assert [item['status'] for item in results] == [201, 400, 201]
+        assert 'email' in results[1]['errors']
+        assert Employee.objects.count() == 2
+
+    def test_bulk_create_ordered_stops_at_failure(self):
+        """Test ordered batches skip everything after the first failure"""
+        items = [self._employee(0), self._employee(1, email='invalid-email'), self._employee(2)]
+        response = self.client.post('/api/employees/bulk/', items, format='json')
+        
+        assert response.status_code == status.HTTP_207_MULTI_STATUS
+        assert [item['status'] for item in response.data['results']] == [201, 400, 424]
+        assert Employee.objects.count() == 1
+
+    def test_bulk_update_and_delete(self):
+        """Test bulk PATCH and DELETE report unknown ids per item"""
+        employee = Employee(**self._employee(0)).save()
+        missing = '0' * 24
+        
+        response = self.client.patch('/api/employees/bulk/', {'items': [
+            {'id': str(employee.id), 'position': 'Lead'},
+            {'id': missing, 'position': 'Lead'},
+        ], 'ordered': False}, format='json')
+        assert [item['status'] for item in response.data['results']] == [200, 404]
+        assert employee.reload().position == 'Lead'
+        
+        response = self.client.delete('/api/employees/bulk/', {'ids': [str(employee.id), missing]}, format='json')
+        assert [item['status'] for item in response.data['results']] == [204, 404]
+        assert Employee.objects.count() == 0
+
+    def test_bulk_update_rejects_repeated_ids(self):
+        """Test an id given twice in one batch is refused rather than overwriting the first update"""
+        employee = Employee(**self._employee(0)).save()
+        response = self.client.patch('/api/employees/bulk/', {'items': [
+            {'id': str(employee.id), 'position': 'Lead'},
+            {'id': str(employee.id), 'department': 'Sales'},
+        ], 'ordered': False}, format='json')
+        
+        results = response.data['results']
+        assert [item['status'] for item in results] == [200, 400]
+        assert 'id' in results[1]['errors']
+        employee.reload()
+        assert (employee.position, employee.department, employee.version) == ('Lead', 'IT', 1)
+
+
+class TestConditionalWrites(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='pm', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project(name='Website Redesign', client='ABC Corp', progress=10).save()
+        self.url = f'/api/projects/{self.project.id}/'
+
+    def tearDown(self):
+        Project.drop_collection()
+        Tombstone.drop_collection()
+
+    def test_patch_sets_only_sent_fields(self):
+        """Test PATCH writes the sent fields and bumps the version, leaving others alone"""
+        etag = self.client.get(self.url)['ETag']
+        assert etag == '"v0"'
+        # Another writer changes a different field in between
+        Project.objects(id=self.project.id).update(set__status='active')
+        
+        response = self.client.patch(self.url, {'progress': 40}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert (response.data['progress'], response.data['status'], response.data['version']) == (40, 'active', 1)
+        assert response['ETag'] == '"v1"'
+        project = self.project.reload()
+        assert (project.progress, project.status, project.name) == (40, 'active', 'Website Redesign')
+        
+        response = self.client.patch(self.url, {'progress': 101}, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert self.client.patch(f'/api/projects/{"0" * 24}/', {'progress': 5}, format='json').status_code == \
+            status.HTTP_404_NOT_FOUND
+
+    def test_if_match_rejects_stale_writes(self):
+        """Test of two edits made from the same ETag, the second gets a 412"""
+        etag = self.client.get(self.url)['ETag']
+        
+        first = self.client.patch(self.url, {'progress': 50}, format='json', HTTP_IF_MATCH=etag)
+        second = self.client.patch(self.url, {'progress': 60}, format='json', HTTP_IF_MATCH=etag)
+        assert first.status_code == status.HTTP_200_OK
+        assert second.status_code == status.HTTP_412_PRECONDITION_FAILED
+        assert self.project.reload().progress == 50
+        
+        response = self.client.put(self.url, {'name': 'Portal', 'client': 'ABC Corp'}, format='json',
+                                   HTTP_IF_MATCH=first['ETag'])
+        assert (response.status_code, response.data['version']) == (status.HTTP_200_OK, 2)
+        assert self.client.patch(self.url, {'progress': 1}, format='json', HTTP_IF_MATCH='*').status_code == \
+            status.HTTP_200_OK
+
+    def test_conditional_delete(self):
+        """Test DELETE honours If-Match and records a tombstone"""
+        response = self.client.delete(self.url, HTTP_IF_MATCH='"v7"')
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+        
+        response = self.client.delete(self.url, HTTP_IF_MATCH='"v0"')
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert Project.objects.count() == 0
+        assert Tombstone.objects(document_id=self.project.id).count() == 1
+        assert self.client.delete(self.url, HTTP_IF_MATCH='"v0"').status_code == status.HTTP_404_NOT_FOUND
+
+    def test_documents_without_a_version_are_at_zero(self):
+        """Test documents stored before versions existed match If-Match v0"""
+        Project._get_collection().update_one({'_id': self.project.id}, {'$unset': {'version': ''}})
+        
+        response = self.client.patch(self.url, {'progress': 20}, format='json', HTTP_IF_MATCH='"v0"')
+        assert (response.status_code, response.data['version']) == (status.HTTP_200_OK, 1)
+
+
+class TestTransactionSummary(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        TransactionRollup.objects.all().delete()
+
+    def tearDown(self):
+        Transaction.objects.all().delete()
+        TransactionRollup.objects.all().delete()
+
+    def _create(self, date, amount, kind, category):
+        response = self.client.post('/api/transactions/', {
+            'date': date,
+            'description': f'{category} {date}',
+            'amount': amount,
+            'type': kind,
+            'category': category
+        })
+        assert response.status_code == status.HTTP_201_CREATED
+        return response.data['id']
+
+    def test_summary_tracks_create_update_delete(self):
+        """Test rollups follow writes made through the API"""
+        self._create('2024-01-10T10:00:00Z', '100.10', 'income', 'Sales')
+        expense_id = self._create('2024-01-20T10:00:00Z', '40.05', 'expense', 'Office')
+        self._create('2024-02-03T10:00:00Z', '10.00', 'expense', 'Travel')
+        
+        response = self.client.get('/api/transactions/summary/?group_by=month')
+        assert response.status_code == status.HTTP_200_OK
+        january, february = response.data['results']
+        assert january['key'] == '2024-01'
+        assert january['income'] == Decimal('100.10')
+        assert january['expense'] == Decimal('40.05')
+        assert february['expense'] == Decimal('10.00')
+        assert response.data['totals']['net'] == Decimal('50.05')
+        
+        self.client.put(f'/api/transactions/{expense_id}/', {
+            'date': '2024-02-01T00:00:00Z',
+            'description': 'Moved',
+            'amount': '5.00',
+            'type': 'expense',
+            'category': 'Office'
+        })
+        response = self.client.get('/api/transactions/summary/?group_by=category&type=expense')
+        assert [(row['key'], row['expense']) for row in response.data['results']] == [
+            ('Office', Decimal('5.00')), ('Travel', Decimal('10.00'))
+        ]
+        
+        self.client.delete(f'/api/transactions/{expense_id}/')
+        response = self.client.get('/api/transactions/summary/?group_by=day&date__gte=2024-02-01&date__lte=2024-02-28')
+        assert [row['key'] for row in response.data['results']] == ['2024-02-03']
+
+    def test_summary_tracks_bulk_create_and_rebuild(self):
+        """Test bulk inserts update rollups and a rebuild reproduces them"""
+        items = [{
+            'date': f'2024-03-0{day}T08:00:00Z',
+            'description': f'Sale {day}',
+            'amount': '0.10',
+            'type': 'income',
+            'category': 'Sales'
+        } for day in range(1, 4)]
+        self.client.post('/api/transactions/bulk/', items, format='json')
+        
+        before = self.client.get('/api/transactions/summary/?group_by=day').data['results']
+        assert [row['income'] for row in before] == [Decimal('0.10')] * 3
+        
+        TransactionRollup.objects.all().delete()
+        rebuild_rollups()
+        after = self.client.get('/api/transactions/summary/?group_by=day').data['results']
+        assert after == before
+
+    def test_summary_rejects_unknown_group(self):
+        """Test group_by is validated"""
+        response = self.client.get('/api/transactions/summary/?group_by=week')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+class TestEmployeeResponseCache(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        get_response_cache().backend.clear()
+        Employee(name="Cached", email="cached@example.com", position="Developer", department="IT").save()
+
+    def tearDown(self):
+        Employee.objects.all().delete()
+        get_response_cache().backend.clear()
+
+    def _names(self, response):
+        return sorted(item['name'] for item in response.data['results'])
+
+    def test_repeated_reads_hit_cache_until_api_write(self):
+        """Test writes through the API invalidate cached lists"""
+        first = self.client.get('/api/employees/')
+        assert self._names(first) == ['Cached']
+        
+        # Written behind the API's back, so only a cache miss would show it
+        Employee(name="Direct", email="direct@example.com", position="Developer", department="IT").save()
+        assert self._names(self.client.get('/api/employees/')) == ['Cached']
+        
+        self.client.post('/api/employees/', {
+            'name': 'Via API', 'email': 'api@example.com', 'position': 'Manager', 'department': 'HR'
+        })
+        assert self._names(self.client.get('/api/employees/')) == ['Cached', 'Direct', 'Via API']
+
+    def test_if_none_match_returns_not_modified(self):
+        """Test a matching ETag gets a 304 with no body"""
+        response = self.client.get('/api/employees/')
+        etag = response['ETag']
+        
+        response = self.client.get('/api/employees/', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response['ETag'] == etag
+        assert not response.content
+
+    def test_cache_keys_include_query_params(self):
+        """Test different query strings are cached separately"""
+        Employee(name="Finance", email="fin@example.com", position="Accountant", department="Finance").save()
+        assert self._names(self.client.get('/api/employees/?department=IT')) == ['Cached']
+        assert self._names(self.client.get('/api/employees/?department=Finance')) == ['Finance']
+
+    @override_settings(RESPONSE_CACHE={'BACKEND': 'core.cache.DjangoResponseCache', 'TIMEOUT': 60})
+    def test_shared_backend(self):
+        """Test the shared backend against the local Django cache stand-in"""
+        get_response_cache().backend.clear()
+        self.client.get('/api/employees/')
+        Employee(name="Direct", email="direct@example.com", position="Developer", department="IT").save()
+        assert self._names(self.client.get('/api/employees/')) == ['Cached']
+        
+        get_response_cache().invalidate('employees')
+        assert self._names(self.client.get('/api/employees/')) == ['Cached', 'Direct']
+
+
+class TestLocMemResponseCache:
+    def test_lru_eviction_and_ttl(self):
+        """Test the in-process backend evicts least recently used and expired entries"""
+        cache = LocMemResponseCache(max_entries=2)
+        cache.set('a', 1, 60)
+        cache.set('b', 2, 60)
+        cache.get('a')
+        cache.set('c', 3, 60)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        
+        cache.set('expired', 4, -1)
+        assert cache.get('expired') is None
+
+    def test_generation_counter(self):
+        """Test bumping a counter changes it"""
+        cache = LocMemResponseCache()
+        generation = cache.get_counter('gen:employees')
+        assert cache.incr_counter('gen:employees') == generation + 1
+
+
+class TestAsyncReadUrls(TestCase):
+    def test_async_read_urls_disabled_by_default(self):
+        """Test the router URLs are kept as they are unless ASYNC_READ_ACTIONS is on"""
+        urls = router.urls
+        assert async_read_urls(urls) is urls
+
+    @override_settings(ASYNC_READ_ACTIONS=True)
+    def test_async_read_urls_wraps_list_and_retrieve(self):
+        """Test only list and retrieve routes get the async view, under the same names"""
+        wrapped = {url.name: url.callback for url in async_read_urls(router.urls)}
+        
+        assert asyncio.iscoroutinefunction(wrapped['transaction-list'])
+        assert asyncio.iscoroutinefunction(wrapped['transaction-detail'])
+        assert wrapped['transaction-detail'].cls is TransactionViewSet
+        assert not asyncio.iscoroutinefunction(wrapped['transaction-export'])
+        assert not asyncio.iscoroutinefunction(wrapped['transaction-bulk'])
+
+
+class TestTransactionAsyncReads(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.list_view = async_read_view(TransactionViewSet.as_view({'get': 'list', 'post': 'create'}))
+        self.detail_view = async_read_view(TransactionViewSet.as_view({'get': 'retrieve'}))
+        self.sync_list_view = TransactionViewSet.as_view({'get': 'list'})
+        
+        self.transactions = []
+        for day in [1, 2, 3]:
+            transaction = Transaction(
+                date=datetime(2024, 1, day),
+                description=f"Transaction {day}",
+                amount=Decimal('10.00') * day,
+                type='expense' if day % 2 else 'income',
+                category='Office'
+            )
+            transaction.save()
+            self.transactions.append(transaction)
+
+    def tearDown(self):
+        Transaction.objects.all().delete()
+
+    def _call(self, view, request, **kwargs):
+        force_authenticate(request, user=self.user)
+        return async_to_sync(view)(request, **kwargs)
+
+    def test_async_view_delegates_writes_to_sync_view(self):
+        """Test non-read methods go through the regular viewset"""
+        request = self.factory.post('/api/transactions/', {
+            'date': '2024-02-01T00:00:00Z',
+            'description': 'Created',
+            'amount': '5.00',
+            'type': 'expense',
+            'category': 'Office'
+        }, format='json')
+        response = self._call(self.list_view, request)
+        
+        assert response.status_code == status.HTTP_201_CREATED
+        assert Transaction.objects(description='Created').count() == 1
+
+    @skipUnless(async_available(), 'Motor is not installed or MongoDB is mocked')
+    def test_async_list_matches_sync_list(self):
+        """Test the async list returns the same page and cursors as the sync one"""
+        url = '/api/transactions/?page_size=2&type__in=expense,income'
+        response = self._call(self.list_view, self.factory.get(url))
+        request = self.factory.get(url)
+        force_authenticate(request, user=self.user)
+        expected = self.sync_list_view(request)
+        
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == expected.data
+        assert len(response.data['results']) == 2
+
+    @skipUnless(async_available(), 'Motor is not installed or MongoDB is mocked')
+    def test_async_list_rejects_invalid_filter(self):
+        """Test filter validation errors are reported by the async path"""
+        response = self._call(self.list_view, self.factory.get('/api/transactions/?amount=10'))
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    @skipUnless(async_available(), 'Motor is not installed or MongoDB is mocked')
+    def test_async_retrieve(self):
+        """Test async retrieve of an existing and a missing transaction"""
+        transaction = self.transactions[0]
+        request = self.factory.get(f'/api/transactions/{transaction.id}/')
+        response = self._call(self.detail_view, request, pk=str(transaction.id))
+        
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['id'] == str(transaction.id)
+        assert response.data['amount'] == Decimal('10.00')
+        
+        transaction.delete()
+        request = self.factory.get(f'/api/transactions/{transaction.id}/')
+        response = self._call(self.detail_view, request, pk=str(transaction.id))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
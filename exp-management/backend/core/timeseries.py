@@ -0,0 +1,135 @@
+from django.conf import settings
+
+from .archive import archive_collection, ensure_archive_indexes
+from .indexes import index_name, sync_indexes
+from .models import Transaction
+
+# Buckets hold one type and category over a few hours of dates, so filters on
+# either field and date ranges prune whole buckets
+TIMESERIES = {'timeField': 'date', 'metaField': 'meta', 'granularity': 'hours'}
+META_FIELDS = ('type', 'category')
+LEGACY_SUFFIX = '_legacy'
+MIGRATE_BATCH_SIZE = 1000
+
+
+def enabled():
+    """Whether transactions live in a time-series collection (TRANSACTIONS_TIMESERIES)"""
+    return getattr(settings, 'TRANSACTIONS_TIMESERIES', False)
+
+
+def is_timeseries(collection):
+    return 'timeseries' in collection.options()
+
+
+def create_timeseries(database, name):
+    return database.create_collection(name, timeseries=TIMESERIES)
+
+
+def timeseries_indexes(document, declared):
+    """A document's declared indexes, as a time-series transactions collection has them.
+
+    Indexes led by type or category are keyed on their meta copies instead,
+    and the server's own index on meta and date is kept. Time-series
+    collections have no index on _id, which by-id reads and writes need.
+    """
+    if document is not Transaction or not enabled():
+        return declared
+    indexes = {'meta_1_date_1': ([('meta', 1), ('date', 1)], {}), '_id_1': ([('_id', 1)], {})}
+    for name, (keys, options) in declared.items():
+        if keys[0][0] in META_FIELDS:
+            keys = [('meta.' + keys[0][0], keys[0][1])] + keys[1:]
+            name = index_name(keys)
+        indexes[name] = (keys, options)
+    return indexes
+
+
+def with_meta_conditions(queryset):
+    """``queryset`` with its type and category conditions repeated on meta, where the indexes are"""
+    query = queryset._query
+    meta = {'meta.' + name: query[name] for name in META_FIELDS if name in query}
+    return queryset.filter(__raw__=meta) if meta else queryset
+
+
+def find_one_and_update(collection, query, update):
+    """The document matching ``query`` before ``update``, without findAndModify.
+
+    Time-series collections do not take findAndModify, so the document is
+    read and then updated where its version is unchanged; a write landing
+    in between makes it read again.
+    """
+    while True:
+        old = collection.find_one(query)
+        if old is None:
+            return None
+        if collection.update_one({'_id': old['_id'], 'version': old.get('version')}, update).matched_count:
+            return old
+
+
+def find_one_and_delete(collection, query):
+    """The document matching ``query``, deleted as find_one_and_update above writes"""
+    while True:
+        old = collection.find_one(query)
+        if old is None:
+            return None
+        if collection.delete_one({'_id': old['_id'], 'version': old.get('version')}).deleted_count:
+            return old
+
+
+def _backfill_meta(collection):
+    """Give documents written before meta existed their copy of type and category"""
+    pairs = collection.aggregate([
+        {'$match': {'meta': {'$exists': False}}},
+        {'$group': {'_id': {name: '$' + name for name in META_FIELDS}}},
+    ])
+    for row in list(pairs):
+        collection.update_many(dict(row['_id'], meta={'$exists': False}), {'$set': {'meta': row['_id']}})
+
+
+def migrate(batch_size=MIGRATE_BATCH_SIZE, progress=None):
+    """Move transactions into a time-series collection; returns how many were copied.
+
+    The plain collection is renamed to transactions_legacy and copied into
+    a new time-series ``transactions`` in _id order, one ordered insert_many
+    per batch, so the highest _id copied marks how far a stopped run got
+    and running again resumes there. The legacy collection is left for the
+    caller to drop. Until the copy finishes, lists miss and writes 404 on
+    transactions not yet copied, so run it with writes paused.
+    """
+    hot = Transaction._get_collection()
+    database, name = hot.database, hot.name
+    legacy = database[name + LEGACY_SUFFIX]
+    names = database.list_collection_names()
+    if legacy.name not in names:
+        if name in names and not is_timeseries(hot):
+            hot.rename(legacy.name)
+        elif name in names:
+            return 0
+    if name not in database.list_collection_names():
+        create_timeseries(database, name)
+    sync_indexes(Transaction)
+    # Archived transactions are read with the same meta conditions
+    _backfill_meta(archive_collection(Transaction))
+    ensure_archive_indexes(Transaction)
+
+    # New transactions may already be in the new collection; they sort above every legacy _id
+    newest = list(legacy.find({}, {'_id': 1}).sort('_id', -1).limit(1))
+    if not newest:
+        return 0
+    copied_up_to = {'_id': {'$lte': newest[0]['_id']}}
+    last = list(hot.find(copied_up_to, {'_id': 1}).sort('_id', -1).limit(1))
+    last_id = last[0]['_id'] if last else None
+    copied = 0
+    while True:
+        page = {} if last_id is None else {'_id': {'$gt': last_id}}
+        documents = list(legacy.find(page).sort('_id', 1).limit(batch_size))
+        if not documents:
+            break
+        for document in documents:
+            document.update(Transaction.derived_changes(document))
+        # Ordered, so a batch cut short leaves only its first documents copied
+        hot.insert_many(documents)
+        last_id = documents[-1]['_id']
+        copied += len(documents)
+        if progress is not None:
+            progress(copied)
+    return copied
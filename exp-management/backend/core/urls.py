@@ -1,9 +1,12 @@
 from django.urls import path, include
-from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework.routers import DefaultRouter, SimpleRouter
+from rest_framework_simplejwt.views import TokenBlacklistView, TokenObtainPairView, TokenRefreshView
+from .async_views import async_read_urls
+from .batch import BatchView
+from .realtime import events_view
 from .views import (
     EmployeeViewSet, TransactionViewSet, ProjectViewSet,
-    CustomerViewSet, AssetViewSet
+    CustomerViewSet, AssetViewSet, JobViewSet, SearchView
 )
 
 router = DefaultRouter()
@@ -13,8 +16,17 @@ router.register(r'projects', ProjectViewSet, basename='project')
 router.register(r'customers', CustomerViewSet, basename='customer')
 router.register(r'assets', AssetViewSet, basename='asset')
 
+# Not document resources, so kept out of async_read_urls
+jobs_router = SimpleRouter()
+jobs_router.register(r'jobs', JobViewSet, basename='job')
+
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(async_read_urls(router.urls))),
+    path('', include(jobs_router.urls)),
+    path('search/', SearchView.as_view(), name='search'),
+    path('batch/', BatchView.as_view(), name='batch'),
+    path('events/', events_view, name='events'),
     path('auth/login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('auth/logout/', TokenBlacklistView.as_view(), name='token_logout'),
 ]
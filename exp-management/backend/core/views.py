@@ -1,75 +1,673 @@
+import heapq
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.http import StreamingHttpResponse
+from bson import ObjectId
+from django.utils.dateparse import parse_date
+from pymongo import ReturnDocument
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.pagination import _positive_int
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from .models import Employee, Transaction, Project, Customer, Asset
+from rest_framework.reverse import reverse
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.views import APIView
+from .archive import ARCHIVE_POLICIES, archive_collection, archived
+from .bulk import _to_object_id, bulk_create, bulk_delete, bulk_update, compile_set
+from .cache import etag_matches, get_response_cache, if_match_versions, make_etag, version_etag
+from .changes import ExpiredToken, changes_since
+from .exports import (
+    COLUMNAR_FORMATS, ArrowStreamRenderer, ColumnarExporter, CSVRenderer, ParquetRenderer, iter_columnar
+)
+from .filters import IndexedQueryFilter
+from .imports import import_format, store_upload
+from .jobs import cancel, enqueue
+from .metrics import timed
+from .models import Employee, Transaction, Project, Customer, Asset, Job, TrackedDocument
+from .mongo import read_actions_preference
+from .pagination import MongoCursorPagination, merge_ordered
+from .search import get_index, index_documents, tokenize
+from .streaming import NDJSONRenderer, iter_json_array, iter_ndjson
+from .summaries import SUMMARY_GROUPS, apply_rollups, summarize
+from .tenants import current_tenant
+from . import timeseries
 from .serializers import (
     EmployeeSerializer, TransactionSerializer, ProjectSerializer,
-    CustomerSerializer, AssetSerializer
+    CustomerSerializer, AssetSerializer, JobSerializer
 )
 
 class MongoEngineViewSet(viewsets.ViewSet):
     """Base ViewSet for MongoEngine documents"""
+    pagination_class = MongoCursorPagination
+    filter_backend = IndexedQueryFilter
+    ordering = ('-id',)
+    filter_fields = ()
+    ordering_fields = ()
+    search_fields = ()  # text fields for ?q= and /api/search/, most important first
+    export_batch_size = 1000
+    changes_page_size = 500
+    bulk_max_items = 5000
+    import_key = ()  # natural key of POST import/, which skips rows already stored; empty turns import off
+    archive_param = 'include_archived'
+    cache_responses = False
+    read_actions = ('list', 'retrieve', 'export')
     
     def list(self, request):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        cached = self.get_cached_response(request)
+        if cached is not None:
+            return cached
+        queryset = self.get_page_queryset(request)
+        rows = list(queryset)
+        if self.reads_archive(request):
+            # The same page of the same query over archived documents, merged in order
+            rows = self.paginator.merge_rows(rows, archived(queryset))
+        return self.get_list_response(request, rows)
+    
+    def reads_archive(self, request):
+        """Whether a read covers archived documents too (core/archive.py).
+        
+        Reads stay on the hot collection unless ?include_archived=1 asks for
+        the archive or a filter on the policy's date field reaches past its cutoff.
+        """
+        policy = ARCHIVE_POLICIES.get(self.model._meta['collection'])
+        if policy is None:
+            return False
+        if request.query_params.get(self.archive_param, '').lower() in ('1', 'true', 'yes'):
+            return True
+        if policy.range_field is None:
+            return False
+        return policy.reaches_archive(*self.filter_backend().get_range(request, self, policy.range_field))
+    
+    def get_page_queryset(self, request):
+        """Raw queryset for one list page; built without touching the database"""
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.paginator.prepare_queryset(queryset.as_pymongo(), request, view=self)
+    
+    def get_list_response(self, request, rows):
+        page = self.paginator.paginate_rows(rows)
+        fields = self.filter_backend().get_projection(request, self)
+        serializer = self.get_serializer(fields=fields)
+        with timed('serialize'):
+            data = list(serializer.iter_serialize_raw(page))
+        return self.cache_response(request, self.paginator.get_paginated_response(data))
+    
+    @action(detail=False, methods=['get'], renderer_classes=[
+        JSONRenderer, NDJSONRenderer, ParquetRenderer, ArrowStreamRenderer, CSVRenderer
+    ])
+    def export(self, request):
+        """Stream every matching document as a JSON array or NDJSON (?format=ndjson).
+        
+        For analytics, ?format=parquet, arrow (IPC stream) or csv writes typed
+        columns a record batch at a time (core/exports.py).
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        ordering = self.paginator.get_ordering(self)
+        cursor = queryset.order_by(*ordering).no_cache().as_pymongo().batch_size(self.export_batch_size)
+        if self.reads_archive(request):
+            # Interleaved in order; a document caught mid-archive is in both, next to itself
+            cursor = merge_ordered(ordering, cursor, archived(cursor))
+        fields = self.filter_backend().get_projection(request, self)
+        serializer = self.get_serializer(fields=fields)
+        
+        renderer = request.accepted_renderer
+        if renderer.format in COLUMNAR_FORMATS:
+            body = iter_columnar(ColumnarExporter(serializer), cursor, renderer.format)
+        elif renderer.format == 'ndjson':
+            body = iter_ndjson(serializer.iter_serialize_raw(cursor))
+        else:
+            body = iter_json_array(serializer.iter_serialize_raw(cursor))
+        content_type = renderer.media_type
+        if renderer.format not in COLUMNAR_FORMATS or renderer.charset:
+            # Parquet and Arrow are binary
+            content_type += '; charset=utf-8'
+        response = StreamingHttpResponse(body, content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (
+            self.model._meta['collection'], renderer.format
+        )
+        # Let nginx pass chunks through instead of buffering the whole body
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """Documents written and ids deleted since ?since=<token>.
+        
+        Without since it only returns a token: take one before loading the
+        list, then poll with the token of each response. has_more means poll
+        again right away. A token older than the tombstones kept gets 410 and
+        the client reloads the list.
+        """
+        try:
+            written, deleted, token, more = changes_since(
+                self.model, request.query_params.get('since'), self.changes_page_size
+            )
+        except ExpiredToken:
+            return Response({'error': 'Token expired, reload the list'}, status=status.HTTP_410_GONE)
+        except ValueError:
+            return Response({'since': ['Invalid token.']}, status=status.HTTP_400_BAD_REQUEST)
+        with timed('serialize'):
+            results = list(self.get_serializer().iter_serialize_raw(written))
+        return Response(OrderedDict([
+            ('results', results),
+            ('deleted', [str(document_id) for document_id in deleted]),
+            ('since', token),
+            ('has_more', more),
+        ]))
+    
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request):
+        """Create (POST), partially update (PATCH) or delete (DELETE) a batch.
+        
+        The body is a list of items, or {"items": [...], "ordered": false};
+        DELETE takes {"ids": [...]}. Ordered batches stop at the first failure
+        like MongoDB ordered writes. Each item gets its own status in results.
+        """
+        data = request.data
+        ordered = True
+        if isinstance(data, dict):
+            ordered = data.get('ordered', True) not in (False, 'false', '0')
+            data = data.get('ids' if request.method == 'DELETE' else 'items')
+        if not isinstance(data, list):
+            return Response({'error': 'Expected a list of items'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(data) > self.bulk_max_items:
+            return Response({'error': 'At most %d items per request' % self.bulk_max_items},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        if request.method == 'POST':
+            result, created = bulk_create(self.serializer_class, data, ordered=ordered)
+            self.perform_bulk_write(created=created)
+            success = status.HTTP_201_CREATED
+        elif request.method == 'PATCH':
+            result, changed = bulk_update(self.serializer_class, data, ordered=ordered)
+            self.perform_bulk_write(changed=changed)
+            success = status.HTTP_200_OK
+        else:
+            result, deleted = bulk_delete(self.model, data)
+            self.perform_bulk_write(deleted=deleted)
+            success = status.HTTP_200_OK
+        if result.succeeded:
+            self.invalidate_cache()
+        
+        if not result.failed:
+            code = success
+        elif not result.succeeded:
+            code = status.HTTP_400_BAD_REQUEST
+        else:
+            code = status.HTTP_207_MULTI_STATUS
+        return Response({
+            'ordered': ordered,
+            'succeeded': result.succeeded,
+            'failed': result.failed,
+            'results': result.items,
+        }, status=code)
+    
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_file(self, request):
+        """Queue an import of an uploaded CSV or XLSX file (multipart field "file").
+        
+        The first row names the columns. Answers 202 with the import job;
+        its result reports created, duplicate and invalid rows, with the
+        errors of each invalid row by row number.
+        """
+        if not self.import_key:
+            return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['No file was submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            file_format = import_format(upload.name)
+        except ValueError as exc:
+            return Response({'file': [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+        file_id = store_upload(self.model, upload)
+        job = enqueue('import', {
+            'collection': self.model._meta['collection'],
+            'file_id': str(file_id),
+            'filename': upload.name,
+            'format': file_format,
+        }, user=request.user)
+        location = reverse('job-detail', args=[job.id], request=request)
+        return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
     
     def create(self, request):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            self.invalidate_cache()
+            self.update_search_index(added=[serializer.instance.to_mongo()])
+            with timed('serialize'):
+                data = serializer.data
+            return Response(data, status=status.HTTP_201_CREATED,
+                            headers={'ETag': version_etag(getattr(serializer.instance, 'version', 0))})
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     def retrieve(self, request, pk=None):
-        try:
-            instance = self.model.objects.get(id=pk)
-            serializer = self.get_serializer(instance)
-            return Response(serializer.data)
-        except self.model.DoesNotExist:
+        cached = self.get_cached_response(request)
+        if cached is not None:
+            return cached
+        raw = self.get_object_queryset(pk).first()
+        if raw is None and self.reads_archive(request):
+            raw = archived(self.get_object_queryset(pk)).first()
+        return self.get_retrieve_response(request, raw)
+    
+    def get_object_queryset(self, pk):
+        return self.get_queryset().filter(id=pk).as_pymongo().limit(1)
+    
+    def get_retrieve_response(self, request, raw):
+        if raw is None:
             return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        with timed('serialize'):
+            data = self.get_serializer().serialize_raw(raw)
+        return self.cache_response(request, Response(data), etag=version_etag(raw.get('version')))
     
     def update(self, request, pk=None):
-        try:
-            instance = self.model.objects.get(id=pk)
-            serializer = self.get_serializer(instance, data=request.data)
-            if serializer.is_valid():
-                serializer.save()
-                return Response(serializer.data)
+        return self.write_update(request, pk, partial=False)
+    
+    def partial_update(self, request, pk=None):
+        return self.write_update(request, pk, partial=True)
+    
+    def get_write_filter(self, request, pk):
+        """Filter matching document pk, at a version If-Match accepts; None for a malformed pk"""
+        object_id = _to_object_id(pk)
+        if object_id is None:
+            return None
+        query = {'_id': object_id}
+        versions = if_match_versions(request)
+        if versions is not None:
+            # Documents written before versions existed are at version 0
+            query['version'] = {'$in': versions + [None] if 0 in versions else versions}
+        return query
+    
+    def write_failed(self, query):
+        """404, 412 when the document exists at a version If-Match did not name, or 409 when it is archived"""
+        if query is not None and 'version' in query and \
+                self.model._get_collection().count_documents({'_id': query['_id']}, limit=1):
+            return Response({'error': 'The document has changed; fetch it again.'},
+                            status=status.HTTP_412_PRECONDITION_FAILED)
+        if query is not None and self.model._meta['collection'] in ARCHIVE_POLICIES and \
+                archive_collection(self.model).count_documents({'_id': query['_id']}, limit=1):
+            # Archived documents are read-only; ?include_archived=1 still reads them
+            return Response({'error': 'The document is archived and read-only.'}, status=status.HTTP_409_CONFLICT)
+        return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    def write_update(self, request, pk, partial):
+        """PUT or PATCH as one find_one_and_update of the validated fields.
+        
+        Nothing is read first and only the sent fields are written, so edits
+        to different fields of a document do not overwrite each other. With
+        If-Match naming the document's ETag, a document changed since answers 412.
+        """
+        query = self.get_write_filter(request, pk)
+        if query is None:
+            return self.write_failed(query)
+        serializer = self.get_serializer(data=request.data, partial=partial)
+        if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        except self.model.DoesNotExist:
-            return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        changes, errors = compile_set(self.model, serializer.validated_data)
+        if errors is not None:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        update = {'$set': changes}
+        tracked = issubclass(self.model, TrackedDocument)
+        if tracked:
+            changes['updated_at'] = datetime.utcnow()
+            update['$inc'] = {'version': 1}
+        
+        old = self.find_one_and_update(query, update)
+        if old is None:
+            return self.write_failed(query)
+        new = dict(old, **changes)
+        if tracked:
+            new['version'] = old.get('version', 0) + 1
+        self.perform_bulk_write(changed=[(old, new)])
+        self.invalidate_cache()
+        with timed('serialize'):
+            data = serializer.serialize_raw(new)
+        return Response(data, headers={'ETag': version_etag(new.get('version'))})
     
     def destroy(self, request, pk=None):
-        try:
-            instance = self.model.objects.get(id=pk)
-            instance.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        except self.model.DoesNotExist:
-            return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        """One find_one_and_delete; If-Match makes it conditional like updates"""
+        query = self.get_write_filter(request, pk)
+        deleted = None if query is None else self.find_one_and_delete(query)
+        if deleted is None:
+            return self.write_failed(query)
+        if issubclass(self.model, TrackedDocument):
+            self.model.tombstone([deleted['_id']])
+        self.perform_bulk_write(deleted=[deleted])
+        self.invalidate_cache()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    def find_one_and_update(self, query, update):
+        """The document matching query as it was before update, or None"""
+        return self.model._get_collection().find_one_and_update(query, update, return_document=ReturnDocument.BEFORE)
+    
+    def find_one_and_delete(self, query):
+        return self.model._get_collection().find_one_and_delete(query)
+    
+    def perform_authentication(self, request):
+        with timed('auth'):
+            super().perform_authentication(request)
+    
+    def perform_bulk_write(self, created=(), changed=(), deleted=()):
+        """Hook run after a bulk write with the raw documents it touched.
+        
+        changed holds (old, new) pairs; subclasses keep derived data current.
+        """
+        self.update_search_index(
+            added=list(created) + [new for old, new in changed],
+            removed=[document['_id'] for document in deleted]
+        )
+    
+    def update_search_index(self, added=(), removed=()):
+        """Apply written raw documents and deleted ids to this worker's search index"""
+        if self.search_fields:
+            index_documents(self.model, added=added, removed=removed)
+    
+    def get_cached_response(self, request):
+        """Serve a read from the response cache, or None on a miss.
+        
+        A matching If-None-Match gets a 304 without touching the database.
+        """
+        if not self.cache_responses:
+            return None
+        cache = get_response_cache()
+        self._cache_key = cache.make_key(self.model._meta['collection'], request)
+        entry = cache.get(self._cache_key)
+        if entry is None:
+            return None
+        etag, data = entry
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(data, headers={'ETag': etag})
+    
+    def cache_response(self, request, response, etag=None):
+        """Cache a 200 and tag it with etag, or a hash of its data when none is given"""
+        if response.status_code != status.HTTP_200_OK or (etag is None and not self.cache_responses):
+            return response
+        if etag is None:
+            etag = make_etag(response.data)
+        if self.cache_responses:
+            get_response_cache().set(self._cache_key, etag, response.data)
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        response['ETag'] = etag
+        return response
+    
+    def invalidate_cache(self):
+        if self.cache_responses:
+            get_response_cache().invalidate(self.model._meta['collection'])
     
     def get_queryset(self):
-        return self.model.objects.all()
+        queryset = self.model.objects.all()
+        preference = read_actions_preference()
+        if preference is not None and self.action in self.read_actions:
+            # Route read-only actions to secondaries when configured
+            queryset = queryset.read_preference(preference)
+        return queryset
     
     def get_serializer(self, *args, **kwargs):
         return self.serializer_class(*args, **kwargs)
+    
+    def filter_queryset(self, queryset):
+        return self.filter_backend().filter_queryset(self.request, queryset, self)
+    
+    def get_ordering(self):
+        return self.filter_backend().get_ordering(self.request, self) or self.ordering
+    
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            self._paginator = self.pagination_class()
+        return self._paginator
 
 class EmployeeViewSet(MongoEngineViewSet):
     model = Employee
     serializer_class = EmployeeSerializer
+    cache_responses = True
+    filter_fields = ('email', 'department')
+    ordering_fields = ('email', 'department')
+    search_fields = ('name', 'email')
 
 class TransactionViewSet(MongoEngineViewSet):
     model = Transaction
     serializer_class = TransactionSerializer
+    ordering = ('-date', '-id')
+    filter_fields = ('date', 'type', 'category')
+    import_key = ('date', 'amount', 'type', 'category', 'description')
+    ordering_fields = ('date',)
+    
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if timeseries.enabled():
+            # Time-series buckets and their indexes are keyed on meta
+            queryset = timeseries.with_meta_conditions(queryset)
+        return queryset
+    
+    def find_one_and_update(self, query, update):
+        if timeseries.enabled():
+            return timeseries.find_one_and_update(self.model._get_collection(), query, update)
+        return super().find_one_and_update(query, update)
+    
+    def find_one_and_delete(self, query):
+        if timeseries.enabled():
+            return timeseries.find_one_and_delete(self.model._get_collection(), query)
+        return super().find_one_and_delete(query)
+    
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Income/expense totals from the rollup collection.
+        
+        ?group_by=type|category|day|month (default month), optional
+        date__gte/date__lt/date__lte dates, type and category.
+        """
+        params = request.query_params
+        group_by = params.get('group_by', 'month')
+        if group_by not in SUMMARY_GROUPS:
+            return Response({'group_by': ['Choose one of: %s.' % ', '.join(SUMMARY_GROUPS)]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        bounds = {}
+        for param in ('date__gte', 'date__lt', 'date__lte'):
+            if param not in params:
+                continue
+            try:
+                bounds[param] = parse_date(params[param])
+            except ValueError:
+                bounds[param] = None
+            if bounds[param] is None:
+                return Response({param: ['Enter a date as YYYY-MM-DD.']}, status=status.HTTP_400_BAD_REQUEST)
+        date_to = bounds.get('date__lt')
+        if 'date__lte' in bounds:
+            date_to = bounds['date__lte'] + timedelta(days=1)
+        
+        results = summarize(
+            group_by=group_by,
+            date_from=bounds.get('date__gte'),
+            date_to=date_to,
+            type=params.get('type'),
+            category=params.get('category'),
+        )
+        totals = {
+            'income': sum((row['income'] for row in results), Decimal('0.00')),
+            'expense': sum((row['expense'] for row in results), Decimal('0.00')),
+            'count': sum(row['count'] for row in results),
+        }
+        totals['net'] = totals['income'] - totals['expense']
+        return Response({'group_by': group_by, 'totals': totals, 'results': results})
+    
+    def perform_bulk_write(self, created=(), changed=(), deleted=()):
+        super().perform_bulk_write(created=created, changed=changed, deleted=deleted)
+        apply_rollups(
+            added=list(created) + [new for old, new in changed],
+            removed=list(deleted) + [old for old, new in changed]
+        )
 
 class ProjectViewSet(MongoEngineViewSet):
     model = Project
     serializer_class = ProjectSerializer
+    cache_responses = True
+    filter_fields = ('status', 'client', 'start_date')
+    ordering_fields = ('client', 'start_date')
+    search_fields = ('name', 'client', 'description')
 
 class CustomerViewSet(MongoEngineViewSet):
     model = Customer
     serializer_class = CustomerSerializer
+    filter_fields = ('email', 'status', 'company')
+    ordering_fields = ('email', 'company')
+    search_fields = ('name', 'email', 'company')
 
 class AssetViewSet(MongoEngineViewSet):
     model = Asset
     serializer_class = AssetSerializer
+    cache_responses = True
+    filter_fields = ('category', 'status', 'location')
+    import_key = ('name', 'category', 'location')
+    ordering_fields = ('category', 'location')
+    search_fields = ('name', 'description')
+
+class SearchView(APIView):
+    """Ranked type-ahead across collections: GET /api/search/?q=nguy&types=employee,customer
+    
+    Every word of q matches the start of a word in the views' search_fields,
+    ignoring case, accents and đ, so "nguyen" finds "Nguyễn Văn An". Each
+    worker answers from its own in-memory index (core/search.py). Until a
+    worker has built them, the collections' text indexes answer instead,
+    matching whole words only. Pages with ?page= and ?page_size=;
+    count_exact is false when the count is a floor because a broad query
+    stopped reading early.
+    """
+    viewsets = OrderedDict([
+        ('employee', EmployeeViewSet),
+        ('project', ProjectViewSet),
+        ('customer', CustomerViewSet),
+        ('asset', AssetViewSet),
+    ])
+    page_size = MongoCursorPagination.page_size
+    max_page_size = MongoCursorPagination.max_page_size
+    
+    def get(self, request):
+        params = request.query_params
+        query = params.get('q', '')
+        if not tokenize(query):
+            return Response({'q': ['Enter a word or the start of one.']}, status=status.HTTP_400_BAD_REQUEST)
+        names = [name.strip() for name in params['types'].split(',')] if params.get('types') else list(self.viewsets)
+        if any(name not in self.viewsets for name in names):
+            return Response({'types': ['Choose from: %s.' % ', '.join(self.viewsets)]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        paging = {}
+        for param, default, cutoff in (('page', 1, None), ('page_size', self.page_size, self.max_page_size)):
+            try:
+                paging[param] = _positive_int(params.get(param, default), strict=True, cutoff=cutoff)
+            except ValueError:
+                return Response({param: ['Enter a positive whole number.']}, status=status.HTTP_400_BAD_REQUEST)
+        page, page_size = paging['page'], paging['page_size']
+        
+        # Each index ranks its best hits up to the end of the page; merge them by score
+        end = page * page_size
+        indexes = {name: get_index(self.viewsets[name].model, self.viewsets[name].search_fields) for name in names}
+        hits, count, exact = [], 0, True
+        for name in names:
+            if None in indexes.values():
+                # Text scores do not compare with prefix index ones, so all types fall back together
+                matches, complete, top = self.text_search(self.viewsets[name].model, query, end)
+            else:
+                matches, complete, top = indexes[name].search(query, end)
+            count += matches
+            exact = exact and complete
+            hits.extend((score, document_id, name) for score, document_id in top)
+        hits = heapq.nlargest(end, hits)[end - page_size:]
+        
+        documents = {}
+        for name in set(name for _, _, name in hits):
+            ids = [document_id for _, document_id, hit_name in hits if hit_name == name]
+            for raw in self.viewsets[name].model.objects(id__in=ids).as_pymongo():
+                documents[name, raw['_id']] = raw
+        serializers = {name: self.viewsets[name].serializer_class() for name in names}
+        with timed('serialize'):
+            # Skips hits deleted by another worker since this one's index was built
+            results = [
+                {'type': name, 'score': score, 'object': serializers[name].serialize_raw(documents[name, document_id])}
+                for score, document_id, name in hits if (name, document_id) in documents
+            ]
+        
+        url = request.build_absolute_uri()
+        next_link = previous_link = None
+        if not exact or count > end:
+            next_link = replace_query_param(url, 'page', page + 1)
+        if page == 2:
+            previous_link = remove_query_param(url, 'page')
+        elif page > 2:
+            previous_link = replace_query_param(url, 'page', page - 1)
+        return Response(OrderedDict([
+            ('count', count),
+            ('count_exact', exact),
+            ('next', next_link),
+            ('previous', previous_link),
+            ('results', results),
+        ]))
+    
+    def text_search(self, model, query, limit):
+        """PrefixIndex.search's ``(matches, complete, [(score, id), ...])`` from the text index"""
+        rows = list(model.objects.search_text(query).order_by('$text_score').only('id').limit(limit).as_pymongo())
+        return len(rows), len(rows) < limit, [(row['_text_score'], row['_id']) for row in rows]
+
+# Viewsets that accept imports, by collection, for the import job
+IMPORT_VIEWSETS = {
+    viewset.model._meta['collection']: viewset for viewset in (TransactionViewSet, AssetViewSet)
+}
+# Every document resource, by collection, for manage.py export
+EXPORT_VIEWSETS = {
+    viewset.model._meta['collection']: viewset
+    for viewset in (EmployeeViewSet, TransactionViewSet, ProjectViewSet, CustomerViewSet, AssetViewSet)
+}
+
+class JobViewSet(viewsets.ViewSet):
+    """Background jobs run by manage.py worker (core/jobs.py).
+    
+    POST {"type": "rebuild_rollups", "params": {}} queues one and answers 202
+    with its URL; GET /api/jobs/<id>/ follows status and progress, DELETE
+    cancels it. Queuing and cancelling need a staff user.
+    """
+    list_limit = 50
+    
+    def get_permissions(self):
+        if self.action in ('create', 'destroy'):
+            return [IsAdminUser()]
+        return super().get_permissions()
+    
+    def get_queryset(self):
+        """The jobs of the request's tenant"""
+        return Job.objects(tenant=current_tenant())
+    
+    def list(self, request):
+        """The latest jobs, filtered by ?type= and ?status="""
+        query = {param: request.query_params[param] for param in ('type', 'status') if param in request.query_params}
+        rows = self.get_queryset().filter(**query).order_by('-id').limit(self.list_limit).as_pymongo()
+        return Response(list(JobSerializer().iter_serialize_raw(rows)))
+    
+    def create(self, request):
+        serializer = JobSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        job = enqueue(serializer.validated_data['type'], serializer.validated_data.get('params'), user=request.user)
+        location = reverse('job-detail', args=[job.id], request=request)
+        return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+    
+    def retrieve(self, request, pk=None):
+        raw = self.get_queryset().filter(id=pk).as_pymongo().first() if ObjectId.is_valid(pk) else None
+        if raw is None:
+            return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(JobSerializer().serialize_raw(raw))
+    
+    def destroy(self, request, pk=None):
+        """Cancel a queued job, or ask a running one to stop at its next progress report"""
+        if not ObjectId.is_valid(pk):
+            return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        raw = cancel(ObjectId(pk))
+        if raw is None:
+            if not self.get_queryset().filter(id=pk).count():
+                return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+            return Response({'error': 'Job already finished'}, status=status.HTTP_409_CONFLICT)
+        return Response(JobSerializer().serialize_raw(raw), status=status.HTTP_202_ACCEPTED)
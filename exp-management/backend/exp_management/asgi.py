@@ -0,0 +1,8 @@
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'exp_management.settings')
+# Serve list/retrieve from the async Mongo client; set to false to use the sync views
+os.environ.setdefault('ASYNC_READ_ACTIONS', 'True')
+
+application = get_asgi_application()
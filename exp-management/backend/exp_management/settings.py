@@ -1,3 +1,4 @@
+import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -27,10 +28,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.PerformanceMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'core.tenants.TenantMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -56,6 +59,71 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'exp_management.wsgi.application'
+ASGI_APPLICATION = 'exp_management.asgi.application'
+
+# Serve list/retrieve through the async Mongo client (core/async_views.py); asgi.py turns it on
+ASYNC_READ_ACTIONS = os.getenv('ASYNC_READ_ACTIONS', 'False').lower() == 'true'
+
+# Server-Timing headers and Prometheus histograms at /metrics (core/metrics.py)
+PERFORMANCE_METRICS = os.getenv('PERFORMANCE_METRICS', 'False').lower() == 'true'
+# /metrics answers scrapers sending 'Authorization: Bearer <METRICS_TOKEN>' and staff sessions, no one else
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Record MongoDB queries slower than this many ms with their explain() plans for
+# manage.py index_advisor (core/diagnostics.py); 0 turns it off
+SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', '0'))
+SLOW_QUERY_EXPLAIN_INTERVAL = int(os.getenv('SLOW_QUERY_EXPLAIN_INTERVAL', '600'))
+
+# Seconds before a worker rebuilds its in-memory /api/search/ index from MongoDB
+# to pick up writes made by other workers (core/search.py)
+SEARCH_INDEX_TTL = int(os.getenv('SEARCH_INDEX_TTL', '300'))
+
+# /api/<resource>/changes/ leaves out writes newer than this many seconds, so a
+# write stamped just before a poll but committed after it is not skipped (core/changes.py)
+CHANGES_SETTLE_SECONDS = int(os.getenv('CHANGES_SETTLE_SECONDS', '2'))
+
+# /api/events/ server-sent events (core/realtime.py, ASGI only): each process reads
+# one change stream (REALTIME_SOURCE=change_stream, needs a replica set) or polls
+# every REALTIME_POLL_SECONDS (poll); auto picks by server. Streams end after
+# REALTIME_STREAM_SECONDS and clients reconnect.
+REALTIME_SOURCE = os.getenv('REALTIME_SOURCE', 'auto')
+REALTIME_POLL_SECONDS = float(os.getenv('REALTIME_POLL_SECONDS', '2'))
+REALTIME_STREAM_SECONDS = int(os.getenv('REALTIME_STREAM_SECONDS', '300'))
+
+# JWTs authenticate from their claims without loading the user (core/auth.py).
+# Permissions are cached per user for AUTH_PERMISSION_CACHE_SECONDS; tokens
+# revoked by other workers are seen within TOKEN_REVOCATION_REFRESH_SECONDS.
+AUTH_PERMISSION_CACHE_SECONDS = int(os.getenv('AUTH_PERMISSION_CACHE_SECONDS', '300'))
+TOKEN_REVOCATION_REFRESH_SECONDS = int(os.getenv('TOKEN_REVOCATION_REFRESH_SECONDS', '5'))
+
+# Background jobs (core/jobs.py) run by manage.py worker in JOB_WORKER_PROCESSES
+# processes. JOB_CONCURRENCY caps running jobs per type across all workers,
+# e.g. JOB_CONCURRENCY=rebuild_rollups=1,import=2
+JOB_WORKER_PROCESSES = int(os.getenv('JOB_WORKER_PROCESSES', '2'))
+JOB_CONCURRENCY = {
+    name.strip(): int(limit)
+    for name, limit in (item.split('=') for item in os.getenv('JOB_CONCURRENCY', '').split(',') if item.strip())
+}
+
+# POST /api/batch/ runs its GET sub-requests concurrently on a pool of at most
+# BATCH_MAX_WORKERS threads per process (core/batch.py)
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '8'))
+
+# manage.py archive moves transactions dated more than ARCHIVE_TRANSACTIONS_AFTER_DAYS
+# ago, and completed or cancelled projects untouched for ARCHIVE_PROJECTS_AFTER_DAYS,
+# into <collection>_archive; ?include_archived=1 reads them (core/archive.py)
+ARCHIVE_TRANSACTIONS_AFTER_DAYS = int(os.getenv('ARCHIVE_TRANSACTIONS_AFTER_DAYS', '730'))
+ARCHIVE_PROJECTS_AFTER_DAYS = int(os.getenv('ARCHIVE_PROJECTS_AFTER_DAYS', '180'))
+
+# Transactions live in a time-series collection (MongoDB 7.0+) bucketed by date, type and
+# category; manage.py timeseries_transactions moves them there (core/timeseries.py)
+TRANSACTIONS_TIMESERIES = os.getenv('TRANSACTIONS_TIMESERIES', 'False').lower() == 'true'
+
+# Tenants, each in its own database and possibly on its own mongod, as JSON:
+# {"acme": {"host": "mongodb://node-a:27017", "db": "acme", "hostnames": ["acme.example.com"]}}
+# Requests find theirs by host or by the access token's tenant claim (core/tenants.py);
+# empty keeps all data in the database of MONGODB_SETTINGS
+MONGO_TENANTS = json.loads(os.getenv('MONGO_TENANTS', '{}'))
 
 DATABASES = {
     'default': {
@@ -65,8 +133,6 @@ DATABASES = {
 }
 
 # MongoDB configuration with MongoEngine
-import mongoengine
-
 MONGODB_SETTINGS = {
     'db': os.getenv('MONGO_DB_NAME', 'exp_management'),
     'host': os.getenv('MONGO_HOST', 'mongodb'),
@@ -77,13 +143,28 @@ MONGODB_SETTINGS = {
     'connect': False,  # Don't connect on import
 }
 
-# Configure MongoEngine connection
+# Register the MongoEngine connection; the client opens lazily on first query.
+# Pool sizes, timeouts and concerns come from MONGO_* variables (core/mongo.py).
+from core.mongo import configure as configure_mongo
 try:
-    mongoengine.connect(**MONGODB_SETTINGS)
-    print("Successfully connected to MongoDB")
+    configure_mongo(**MONGODB_SETTINGS)
+    print("Registered MongoDB connection")
 except Exception as e:
     print(f"MongoDB connection error: {e}")
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Response cache for read endpoints (see core/cache.py)
+RESPONSE_CACHE = {
+    'BACKEND': 'core.cache.LocMemResponseCache',
+    'TIMEOUT': 60,
+    'OPTIONS': {'max_entries': 1024},
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -113,7 +194,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated' if not DEBUG else 'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.auth.ClaimsJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -126,6 +207,10 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_USER_CLASS': 'core.auth.ClaimsUser',
+    'TOKEN_OBTAIN_SERIALIZER': 'core.auth.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'core.auth.RevokingTokenRefreshSerializer',
+    'TOKEN_BLACKLIST_SERIALIZER': 'core.auth.RevokeTokenSerializer',
 }
 
 CORS_ALLOW_ALL_ORIGINS = DEBUG
@@ -1,6 +1,7 @@
+import json
 import os
 from pathlib import Path
-import mongoengine
+from core.mongo import configure as configure_mongo
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -23,10 +24,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.PerformanceMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'core.tenants.TenantMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -52,12 +55,56 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'exp_management.wsgi.application'
+ASGI_APPLICATION = 'exp_management.asgi.application'
+
+# Serve list/retrieve through the async Mongo client (core/async_views.py); asgi.py turns it on
+ASYNC_READ_ACTIONS = os.environ.get('ASYNC_READ_ACTIONS', 'False').lower() == 'true'
+
+# Server-Timing headers and Prometheus histograms at /metrics (core/metrics.py)
+PERFORMANCE_METRICS = os.environ.get('PERFORMANCE_METRICS', 'False').lower() == 'true'
+# /metrics answers scrapers sending 'Authorization: Bearer <METRICS_TOKEN>' and staff sessions, no one else
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Record MongoDB queries slower than this many ms with their explain() plans for
+# manage.py index_advisor (core/diagnostics.py); 0 turns it off
+SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', '0'))
+SLOW_QUERY_EXPLAIN_INTERVAL = int(os.environ.get('SLOW_QUERY_EXPLAIN_INTERVAL', '600'))
+
+# Background jobs (core/jobs.py) run by manage.py worker in JOB_WORKER_PROCESSES
+# processes. JOB_CONCURRENCY caps running jobs per type across all workers,
+# e.g. JOB_CONCURRENCY=rebuild_rollups=1,import=2
+JOB_WORKER_PROCESSES = int(os.environ.get('JOB_WORKER_PROCESSES', '2'))
+JOB_CONCURRENCY = {
+    name.strip(): int(limit)
+    for name, limit in (item.split('=') for item in os.environ.get('JOB_CONCURRENCY', '').split(',') if item.strip())
+}
+
+# POST /api/batch/ runs its GET sub-requests concurrently on a pool of at most
+# BATCH_MAX_WORKERS threads per process (core/batch.py)
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', '8'))
+
+# manage.py archive moves transactions dated more than ARCHIVE_TRANSACTIONS_AFTER_DAYS
+# ago, and completed or cancelled projects untouched for ARCHIVE_PROJECTS_AFTER_DAYS,
+# into <collection>_archive; ?include_archived=1 reads them (core/archive.py)
+ARCHIVE_TRANSACTIONS_AFTER_DAYS = int(os.environ.get('ARCHIVE_TRANSACTIONS_AFTER_DAYS', '730'))
+ARCHIVE_PROJECTS_AFTER_DAYS = int(os.environ.get('ARCHIVE_PROJECTS_AFTER_DAYS', '180'))
+
+# Transactions live in a time-series collection (MongoDB 7.0+) bucketed by date, type and
+# category; manage.py timeseries_transactions moves them there (core/timeseries.py)
+TRANSACTIONS_TIMESERIES = os.environ.get('TRANSACTIONS_TIMESERIES', 'False').lower() == 'true'
+
+# Tenants, each in its own database and possibly on its own mongod, as JSON:
+# {"acme": {"host": "mongodb://node-a:27017", "db": "acme", "hostnames": ["acme.example.com"]}}
+# Requests find theirs by host or by the access token's tenant claim (core/tenants.py);
+# empty keeps all data in the database of MONGODB_URI
+MONGO_TENANTS = json.loads(os.environ.get('MONGO_TENANTS', '{}'))
 
 # MongoDB Configuration for Production
 MONGODB_URI = os.environ.get('MONGODB_URI', 'mongodb://mongodb:27017/exp_management')
 
-# Connect to MongoDB
-mongoengine.connect(host=MONGODB_URI)
+# Register MongoDB; clients open lazily in each gunicorn worker after fork.
+# Pool sizes, timeouts and concerns come from MONGO_* variables (core/mongo.py).
+configure_mongo(host=MONGODB_URI)
 
 # Django Database (Required but not used with MongoEngine)
 DATABASES = {
@@ -67,6 +114,21 @@ DATABASES = {
     }
 }
 
+# Cache; set CACHE_BACKEND/CACHE_LOCATION to Redis or Memcached to share it across workers
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Response cache for read endpoints (see core/cache.py). With several gunicorn
+# workers use core.cache.DjangoResponseCache so invalidations reach all of them.
+RESPONSE_CACHE = {
+    'BACKEND': os.environ.get('RESPONSE_CACHE_BACKEND', 'core.cache.LocMemResponseCache'),
+    'TIMEOUT': int(os.environ.get('RESPONSE_CACHE_TIMEOUT', '30')),
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -106,10 +168,29 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 # REST Framework settings
 REST_FRAMEWORK = {
+    # JWTs authenticate from their claims; the user table here is per-worker :memory:
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'core.auth.ClaimsJWTAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20
 }
 
+from datetime import timedelta
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
+    'ROTATE_REFRESH_TOKENS': True,
+    'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_USER_CLASS': 'core.auth.ClaimsUser',
+    'TOKEN_OBTAIN_SERIALIZER': 'core.auth.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'core.auth.RevokingTokenRefreshSerializer',
+    'TOKEN_BLACKLIST_SERIALIZER': 'core.auth.RevokeTokenSerializer',
+}
+AUTH_PERMISSION_CACHE_SECONDS = int(os.environ.get('AUTH_PERMISSION_CACHE_SECONDS', '300'))
+TOKEN_REVOCATION_REFRESH_SECONDS = int(os.environ.get('TOKEN_REVOCATION_REFRESH_SECONDS', '5'))
+
 # Security settings for production
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
@@ -0,0 +1,21 @@
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '3'))
+threads = int(os.environ.get('GUNICORN_THREADS', '1'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True').lower() == 'true'
+
+# GUNICORN_ASGI=true runs uvicorn workers on exp_management.asgi, where list
+# and retrieve await an async Mongo client; otherwise the sync WSGI app.
+if os.environ.get('GUNICORN_ASGI', 'False').lower() == 'true':
+    wsgi_app = 'exp_management.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'exp_management.wsgi:application'
+
+
+def post_fork(server, worker):
+    # MongoClient is not fork-safe: make sure each worker opens its own
+    from core.mongo import reset_connections
+    reset_connections()
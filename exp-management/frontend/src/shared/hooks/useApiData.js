@@ -32,6 +32,32 @@ const mockData = {
     ]
 };
 
+// Largest page the API hands out (max_page_size)
+const PAGE_SIZE = 100;
+
+/**
+ * Fetch a list endpoint, following the cursor pagination to the last page
+ * @param {string} endpoint - API endpoint
+ * @param {Object} options - Request options
+ * @returns {Promise<Array|Object>} - Every row, or the response as is when it is not a page
+ */
+export const fetchAllPages = async (endpoint, options = {}) => {
+    const separator = endpoint.includes('?') ? '&' : '?';
+    const first = endpoint.includes('page_size=') ? endpoint : `${endpoint}${separator}page_size=${PAGE_SIZE}`;
+    let response = await api.get(first, options);
+    if (!response || !Array.isArray(response.results)) {
+        return response;
+    }
+    const rows = [...response.results];
+    while (response.next) {
+        // next is an absolute URL; the service prefixes its own base URL
+        const next = new URL(response.next);
+        response = await api.get(next.pathname.replace(/^\/api/, '') + next.search, options);
+        rows.push(...response.results);
+    }
+    return rows;
+};
+
 /**
  * Custom hook for fetching API data with fallback to mock data
  * @param {string} endpoint - API endpoint
@@ -50,7 +76,7 @@ const useApiData = (endpoint, options = {}) => {
             
             // Try to fetch from API first
             try {
-                const response = await api.get(endpoint, options);
+                const response = await fetchAllPages(endpoint, options);
                 setData(response);
             } catch (apiError) {
                 // Fallback to mock data if API fails